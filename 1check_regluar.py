@@ -8,24 +8,42 @@ import warnings
 from typing import Optional, Tuple
 from typing import Tuple, Dict, List
 from typing import Union, List, Tuple
-from concurrent.futures import ThreadPoolExecutor
 import pickle
 from collections import defaultdict
 import numpy as np
 from pathlib import Path
 import json
 import os
+from concurrent.futures import as_completed
+
+from alpha_catalog import AlphaCatalog
+from brain_async import API_URL, run_sync, run_many
+from check_pipeline import LOGGED_OUT, CheckPipeline, check_alphas
+from corr_engine import region_engine
+from metrics import metrics
+from os_store import os_store
+from os_sync import fetch_os_alphas_since, load_watermark, newest_submitted, save_watermark
+from pnl_store import open_pnl_store
+from prod_corr import ProdCorrService
+from property_writer import PropertyWriter
+from rate_limiter import limiter, paced_request
+from session_pool import AuthenticationError, get_session, refresh_session
+from session_pool import pool as session_pool
 
 
 def sign_in(username, password):
-    s = requests.Session()
-    s.auth = (username, password)
+    """
+    登录到 WorldQuant BRAIN 平台。
+
+    返回 session_pool 中该账号共享的 Session：进程内只认证一次，令牌快过期或遇到 401 时由池自动重新认证
+    （429 重试也在池里处理）。
+
+    Returns:
+        Session对象（成功）或None（失败）
+    """
     try:
-        response = s.post('https://api.worldquantbrain.com/authentication')
-        response.raise_for_status()
-        logging.info("Successfully signed in")
-        return s
-    except requests.exceptions.RequestException as e:
+        return get_session(username, password)
+    except AuthenticationError as e:
         logging.error(f"Login failed: {e}")
         return None
 
@@ -33,45 +51,30 @@ def sign_in(username, password):
 class SessionManager:
     """
     统一的session管理器，避免重复登录
+
+    登录、过期前重新认证和 401 重新认证都委托给 session_pool，这里只保留原来的调用接口。
     """
 
     def __init__(self, username, password):
         self.username = username
         self.password = password
-        self.session = None
-        self.last_login_time = None
-        self.login_count = 0
-        self._lock = False  # 简单的锁，防止并发登录
+
+    @property
+    def login_count(self):
+        return session_pool.login_count
 
     def get_session(self, force_refresh=False):
         """
-        获取有效的session，如果过期或不存在则重新登录
+        获取有效的session；force_refresh 为 True 时强制重新认证
         """
-        # 如果session存在且未强制刷新，直接返回
-        if self.session and not force_refresh:
-            return self.session
-
-        # 防止并发登录
-        if self._lock:
-            # 等待其他线程完成登录
-            while self._lock:
-                time.sleep(0.1)
-            return self.session
-
-        self._lock = True
-        try:
-            new_session = sign_in(self.username, self.password)
-            if new_session:
-                self.session = new_session
-                self.last_login_time = time.time()
-                self.login_count += 1
-                print(f"   🔐 [SessionManager] 登录成功 (总登录次数: {self.login_count})")
-                return self.session
-            else:
-                print("   ❌ [SessionManager] 登录失败")
+        session = sign_in(self.username, self.password)
+        if session is not None and force_refresh:
+            try:
+                refresh_session(session)
+            except AuthenticationError as e:
+                print(f"   ❌ [SessionManager] 登录失败: {e}")
                 return None
-        finally:
-            self._lock = False
+        return session
 
     def refresh_on_401(self):
         """
@@ -80,15 +83,6 @@ class SessionManager:
         print("   🔄 [SessionManager] 检测到401错误，刷新session...")
         return self.get_session(force_refresh=True)
 
-    def update_session(self, new_session):
-        """
-        更新session（用于外部已经登录的情况）
-        """
-        if new_session:
-            self.session = new_session
-            self.last_login_time = time.time()
-            self.login_count += 1
-
 
 def save_obj(obj: object, name: str) -> None:
     """
@@ -137,14 +131,17 @@ def wait_get(url: str, max_retries: int = 10) -> "requests.Response":
     retries = 0
     while retries < max_retries:
         while True:
-            simulation_progress = sess.get(url)
+            simulation_progress = paced_request(sess, 'GET', url)
+            if simulation_progress.status_code == 429:
+                # 限速器已按 Retry-After 暂停该类接口，直接重试即可
+                continue
             if simulation_progress.headers.get("Retry-After", 0) == 0:
                 break
-            time.sleep(float(simulation_progress.headers["Retry-After"]))
+            metrics.sleep(float(simulation_progress.headers["Retry-After"]), 'retry_after')
         if simulation_progress.status_code < 400:
             break
         else:
-            time.sleep(2 ** retries)
+            metrics.sleep(2 ** retries, 'backoff')
             retries += 1
     return simulation_progress
 
@@ -159,7 +156,14 @@ def _get_alpha_pnl(alpha_id: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: 包含日期和对应 PnL 数据的 DataFrame，列名为 'Date' 和 alpha_id。
     """
-    pnl = wait_get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/recordsets/pnl").json()
+    pnl = run_sync(sess, lambda c: c.get_pnl(alpha_id)).json()
+    return _pnl_to_frame(alpha_id, pnl)
+
+
+def _pnl_to_frame(alpha_id: str, pnl: dict) -> pd.DataFrame:
+    """
+    将 /recordsets/pnl 的响应转换为列名为 'Date' 和 alpha_id 的 DataFrame。
+    """
     df = pd.DataFrame(pnl['records'], columns=[item['name'] for item in pnl['schema']['properties']])
     df = df.rename(columns={'date': 'Date', 'pnl': alpha_id})
     df = df[['Date', alpha_id]]
@@ -221,17 +225,19 @@ def get_alpha_pnls(
             print(f"   ⚠️  [get_alpha_pnls] 分类alpha时出错，跳过 {item_alpha.get('id', 'unknown')}: {type(e).__name__}")
             continue
 
-    # 获取PnL数据（带错误处理）
-    def safe_get_pnl(alpha_id):
+    # 获取PnL数据：同一个事件循环内并发请求，失败的跳过
+    fetch_ids = [item['id'] for item in valid_alphas]
+    responses = run_many(sess, lambda c, alpha_id: c.get_pnl(alpha_id), fetch_ids, limit=20)
+
+    results = []
+    for alpha_id, response in zip(fetch_ids, responses):
         try:
-            return _get_alpha_pnl(alpha_id).set_index('Date')
+            if isinstance(response, Exception):
+                raise response
+            results.append(_pnl_to_frame(alpha_id, response.json()).set_index('Date'))
         except Exception as e:
             print(f"   ⚠️  [get_alpha_pnls] 获取 {alpha_id} 的PnL失败，跳过: {type(e).__name__} - {str(e)[:50]}")
-            return None
-
-    fetch_pnl_func = safe_get_pnl
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = executor.map(fetch_pnl_func, [item['id'] for item in valid_alphas])
+            results.append(None)
 
     # 过滤掉None结果
     valid_results = [r for r in results if r is not None]
@@ -242,99 +248,6 @@ def get_alpha_pnls(
     return alpha_ids, alpha_pnls
 
 
-def get_os_alphas(limit: int = 100, get_first: bool = False) -> List[Dict]:
-    """
-    获取OS阶段的alpha列表。
-    此函数通过调用WorldQuant Brain API获取用户的alpha列表，支持分页获取，并可以选择只获取第一个结果。
-    Args:
-        limit (int, optional): 每次请求获取的alpha数量限制。默认为100。
-        get_first (bool, optional): 是否只获取第一次请求的alpha结果。如果为True，则只请求一次。默认为False。
-    Returns:
-        List[Dict]: 包含alpha信息的字典列表，每个字典表示一个alpha。
-    """
-    fetched_alphas = []
-    offset = 0
-    retries = 0
-    total_alphas = 100  # 默认值
-
-    while len(fetched_alphas) < total_alphas:
-        try:
-            print(f"Fetching alphas from offset {offset} to {offset + limit}")
-            url = f"https://api.worldquantbrain.com/users/self/alphas?stage=OS&limit={limit}&offset={offset}&order=-dateSubmitted"
-            res = wait_get(url).json()
-
-            # 检查响应格式
-            if not isinstance(res, dict):
-                print(f"   ⚠️ API响应格式错误，不是字典类型: {type(res)}")
-                break
-
-            # 检查是否有错误信息
-            if 'error' in res or 'message' in res:
-                error_msg = res.get('error') or res.get('message', 'Unknown error')
-                print(f"   ⚠️ API返回错误: {error_msg}")
-                break
-
-            # 安全获取count字段
-            if offset == 0:
-                if 'count' in res:
-                    total_alphas = res['count']
-                    print(f"   📊 总alpha数量: {total_alphas}")
-                else:
-                    # 如果没有count字段，尝试从results长度推断，或使用默认值
-                    if 'results' in res and isinstance(res['results'], list):
-                        # 如果第一次请求就返回了所有结果，使用results长度
-                        if len(res['results']) < limit:
-                            total_alphas = len(res['results'])
-                            print(f"   ⚠️ 响应中没有'count'字段，从results长度推断: {total_alphas}")
-                        else:
-                            # 如果结果数等于limit，可能还有更多，设置一个较大的上限
-                            total_alphas = limit * 10  # 假设最多10页
-                            print(f"   ⚠️ 响应中没有'count'字段，使用默认上限: {total_alphas}")
-                    else:
-                        print(f"   ⚠️ 响应中既没有'count'也没有'results'字段，使用默认值: {total_alphas}")
-                        break
-
-            # 安全获取results字段
-            if 'results' not in res:
-                print(f"   ⚠️ API响应中没有'results'字段，跳过")
-                break
-
-            alphas = res["results"]
-            if not isinstance(alphas, list):
-                print(f"   ⚠️ 'results'字段不是列表类型: {type(alphas)}")
-                break
-
-            fetched_alphas.extend(alphas)
-            print(f"   ✅ 获取到 {len(alphas)} 个alpha，累计: {len(fetched_alphas)}")
-
-            if len(alphas) < limit:
-                print(f"   📊 已获取所有alpha（最后一页仅{len(alphas)}个）")
-                break
-            offset += limit
-            if get_first:
-                break
-
-        except KeyError as e:
-            print(f"   ⚠️ KeyError: {e}，跳过此次请求")
-            # 如果已经获取到一些alpha，返回已有的
-            if fetched_alphas:
-                print(f"   ✅ 返回已获取的 {len(fetched_alphas)} 个alpha")
-                return fetched_alphas
-            break
-        except Exception as e:
-            print(f"   ⚠️ 获取alpha列表时出错: {type(e).__name__} - {str(e)[:100]}")
-            # 如果已经获取到一些alpha，返回已有的
-            if fetched_alphas:
-                print(f"   ✅ 返回已获取的 {len(fetched_alphas)} 个alpha")
-                return fetched_alphas
-            break
-
-    # 确保不超过total_alphas（如果total_alphas是推断的，可能不准确）
-    if total_alphas > len(fetched_alphas):
-        return fetched_alphas
-    return fetched_alphas[:total_alphas]
-
-
 def calc_self_corr(
         alpha_id: str,
         os_alpha_rets: pd.DataFrame | None = None,
@@ -359,7 +272,7 @@ def calc_self_corr(
     try:
         if alpha_result is None:
             try:
-                alpha_result = wait_get(f"https://api.worldquantbrain.com/alphas/{alpha_id}").json()
+                alpha_result = wait_get(f"{API_URL}/alphas/{alpha_id}").json()
             except Exception as e:
                 print(f"   ⚠️  [calc_self_corr] 获取alpha {alpha_id} 信息失败: {type(e).__name__} - {str(e)[:50]}")
                 return 0.0 if not return_alpha_pnls else (0.0, pd.DataFrame())
@@ -397,39 +310,9 @@ def calc_self_corr(
             print(f"   ⚠️  [calc_self_corr] 区域 {region} 没有可用的OS alpha数据")
             return 0.0 if not return_alpha_pnls else (0.0, alpha_pnls)
 
-        region_os_rets = os_alpha_rets[os_alpha_ids[region]]
-
-        # 过滤掉标准差为0或NaN的alpha（避免除以零警告）
-        valid_cols = region_os_rets.columns[
-            (region_os_rets.std() > 1e-10) & (region_os_rets.std().notna())
-            ]
-
-        # 检查目标alpha的标准差是否有效
-        if len(alpha_rets.dropna()) > 0 and alpha_rets.std() > 1e-10:
-            # 只计算与有效alpha的相关性
-            if len(valid_cols) > 0:
-                region_os_rets_valid = region_os_rets[valid_cols]
-
-                # 使用警告上下文管理器抑制预期的除以零警告
-                with warnings.catch_warnings():
-                    warnings.filterwarnings('ignore', category=RuntimeWarning, message='invalid value encountered')
-                    corr_results = region_os_rets_valid.corrwith(alpha_rets)
-                    corr_results = corr_results.dropna()  # 移除NaN结果
-
-                    if len(corr_results) > 0:
-                        corr_results.sort_values(ascending=False).round(4).to_csv(
-                            str(cfg.data_path / 'os_alpha_corr.csv'))
-                        self_corr = corr_results.max()
-                    else:
-                        self_corr = 0
-            else:
-                self_corr = 0
-        else:
-            # 目标alpha标准差无效，无法计算相关性
-            self_corr = 0
-
-        if np.isnan(self_corr):
-            self_corr = 0
+        # 在该区域预先标准化好的OS收益率矩阵上一次矩阵乘法求相关（缺失日期按掩码成对对齐）
+        engine = region_engine(os_alpha_rets, os_alpha_ids, region)
+        self_corr, _ = engine.max_corr(alpha_rets)[0]
 
     except KeyError as e:
         print(f"   ⚠️  [calc_self_corr] KeyError for {alpha_id}: {e}")
@@ -448,83 +331,87 @@ def download_data(flag_increment=True):
     """
     下载数据并保存到指定路径。
     此函数会检查数据是否已经存在，如果不存在，则从 API 下载数据并保存到指定路径。
+    PnL 按列追加到 cfg.data_path/os_pnl，只写入新下载的 alpha。
     Args:
         flag_increment (bool): 是否使用增量下载，默认为 True。
     """
+    pnl_store = open_pnl_store(cfg.data_path)
     if flag_increment:
         try:
             os_alpha_ids = load_obj(str(cfg.data_path / 'os_alpha_ids'))
-            os_alpha_pnls = load_obj(str(cfg.data_path / 'os_alpha_pnls'))
             ppac_alpha_ids = load_obj(str(cfg.data_path / 'ppac_alpha_ids'))
-            exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids]
+            exist_alpha = {alpha for ids in os_alpha_ids.values() for alpha in ids}
         except Exception as e:
             logging.error(f"Failed to load existing data: {e}")
             os_alpha_ids = None
-            os_alpha_pnls = None
-            exist_alpha = []
+            exist_alpha = set()
             ppac_alpha_ids = []
     else:
         os_alpha_ids = None
-        os_alpha_pnls = None
-        exist_alpha = []
+        exist_alpha = set()
         ppac_alpha_ids = []
+        pnl_store.clear()
 
-    if os_alpha_ids is None:
-        alphas = get_os_alphas(limit=100, get_first=False)
-    else:
-        alphas = get_os_alphas(limit=30, get_first=True)
+    # 按 dateSubmitted 倒序翻页直到越过上次的水位线；没有已有数据时全量翻页
+    watermark_file = cfg.data_path / 'os_sync.json'
+    watermark = load_watermark(watermark_file) if os_alpha_ids is not None else None
+    alphas, complete = fetch_os_alphas_since(sess, watermark)
+    new_watermark = newest_submitted(alphas, watermark) if complete else watermark
 
     alphas = [item for item in alphas if item['id'] not in exist_alpha]
     ppac_alpha_ids += [item['id'] for item in alphas for item_match in item['classifications'] if
                        item_match['name'] == 'Power Pool Alpha']
 
-    os_alpha_ids, os_alpha_pnls = get_alpha_pnls(alphas, alpha_pnls=os_alpha_pnls, alpha_ids=os_alpha_ids)
+    if not alphas and os_alpha_ids is not None:
+        # 没有新alpha：磁盘文件不变，内存中的收益率也不必重算
+        if not os_store.loaded:
+            os_store.load(cfg.data_path)
+        if new_watermark and new_watermark != watermark:
+            save_watermark(watermark_file, new_watermark)
+        print(f'新下载的alpha数量: 0, 目前总共alpha数量: {len(pnl_store)}')
+        return
+
+    reload = os_alpha_ids is None or not os_store.loaded
+    os_alpha_ids, new_pnls = get_alpha_pnls(alphas, alpha_ids=os_alpha_ids)
+    pnl_store.append(new_pnls)
     save_obj(os_alpha_ids, str(cfg.data_path / 'os_alpha_ids'))
-    save_obj(os_alpha_pnls, str(cfg.data_path / 'os_alpha_pnls'))
     save_obj(ppac_alpha_ids, str(cfg.data_path / 'ppac_alpha_ids'))
-    print(f'新下载的alpha数量: {len(alphas)}, 目前总共alpha数量: {os_alpha_pnls.shape[1]}')
+    if new_watermark:
+        save_watermark(watermark_file, new_watermark)
+    if reload:
+        os_store.load(cfg.data_path)
+    else:
+        os_store.extend(os_alpha_ids, new_pnls, ppac_alpha_ids)
+    print(f'新下载的alpha数量: {len(alphas)}, 目前总共alpha数量: {len(pnl_store)}')
 
 
 def load_data(tag=None):
     """
     加载数据。
-    此函数会检查数据是否已经存在，如果不存在，则从 API 下载数据并保存到指定路径。
+    返回内存中 OS 收益率数据的视图，只在本进程第一次调用时读取 download_data 保存的文件；
+    download_data 下载到新 alpha 后视图自动更新。
     Args:
-        tag (str): 数据标记，默认为 None。
+        tag (str): 数据标记，默认为 None；'PPAC' 只保留 Power Pool alpha，'SelfCorr' 排除 Power Pool alpha。
     """
-    os_alpha_ids = load_obj(str(cfg.data_path / 'os_alpha_ids'))
-    os_alpha_pnls = load_obj(str(cfg.data_path / 'os_alpha_pnls'))
-    ppac_alpha_ids = load_obj(str(cfg.data_path / 'ppac_alpha_ids'))
-    if tag == 'PPAC':
-        for item in os_alpha_ids:
-            os_alpha_ids[item] = [alpha for alpha in os_alpha_ids[item] if alpha in ppac_alpha_ids]
-    elif tag == 'SelfCorr':
-        for item in os_alpha_ids:
-            os_alpha_ids[item] = [alpha for alpha in os_alpha_ids[item] if alpha not in ppac_alpha_ids]
-    else:
-        os_alpha_ids = os_alpha_ids
-    exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids]
-    os_alpha_pnls = os_alpha_pnls[exist_alpha]
-    os_alpha_rets = os_alpha_pnls - os_alpha_pnls.ffill().shift(1)
-    os_alpha_rets = os_alpha_rets[
-        pd.to_datetime(os_alpha_rets.index) > pd.to_datetime(os_alpha_rets.index).max() - pd.DateOffset(years=4)]
-    return os_alpha_ids, os_alpha_rets
+    if not os_store.loaded:
+        os_store.load(cfg.data_path)
+    return os_store.view(tag)
 
 
 def get_simulation_result_json(s, alpha_id, session_manager=None):
     """
     获取alpha的模拟结果JSON，使用SessionManager统一管理登录
     """
-    url = "https://api.worldquantbrain.com/alphas/" + alpha_id
+    url = API_URL + "/alphas/" + alpha_id
     max_retries = 10
     retries = 0
     while retries < max_retries:
         while True:
-            response = s.get(url)
+            response = paced_request(s, 'GET', url)
             retry_after = response.headers.get("Retry-After", 0)
-            if retry_after == 0:
+            if retry_after == 0 or response.status_code == 429:
                 break
-            time.sleep(float(retry_after))
+            metrics.sleep(float(retry_after), 'retry_after')
         if response.status_code < 400:
             try:
                 return response.json()
@@ -580,15 +467,14 @@ def get_simulation_result_json(s, alpha_id, session_manager=None):
             except:
                 pass  # 如果解析响应失败，继续原有逻辑
 
-            retry_after = response.headers.get("Retry-After", 60)  # 默认等待60秒
-            wait_time = float(retry_after)
-            print(f"   ⚠️  [429] API速率限制，等待 {wait_time:.1f} 秒后重试 ({retries + 1}/{max_retries})")
-            time.sleep(wait_time)
+            # 限速器已按 Retry-After 暂停该类接口并降低速率，下一次请求会自动等待
+            wait_time = limiter.delay('alpha')
+            print(f"   ⚠️  [429] API速率限制，{wait_time:.1f} 秒后重试 ({retries + 1}/{max_retries})")
             retries += 1
             continue  # 重试请求
         else:
             print(f"   ⚠️  Status {response.status_code} for {alpha_id}, retrying after {2 ** retries} seconds...")
-            time.sleep(2 ** retries)
+            metrics.sleep(2 ** retries, 'backoff')
             retries += 1
     print(f"   ❌  Failed to get {alpha_id} after {max_retries} retries")
     return {}
@@ -600,14 +486,7 @@ def get_prod_corr(s, alpha_id):
     and save result to dataframe
     """
 
-    while True:
-        result = s.get(
-            "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod"
-        )
-        if "retry-after" in result.headers:
-            time.sleep(float(result.headers["Retry-After"]))
-        else:
-            break
+    result = run_sync(s, lambda c: c.get_correlations(alpha_id, 'prod'))
     if result.json().get("records", 0) == 0:
         return pd.DataFrame()
     columns = [dct["name"] for dct in result.json()["schema"]["properties"]]
@@ -625,9 +504,12 @@ def set_alpha_properties(
         combo_desc: str = "322222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222",
         description: str = 'None',
         tags=['c1'],
+        defer: bool = False,
 ):
     """
     Function changes alpha's description parameters
+
+    defer=True 时只把请求体交给后台 property_writer 合并发送，立即返回 None
     """
 
     if tags is None:
@@ -642,23 +524,27 @@ def set_alpha_properties(
         "selection": {"description": selection_desc},
     }
 
+    if defer:
+        property_writer.enqueue(alpha_id, params)
+        return None
+
     max_retries = 5
     base_timeout = 600
 
     for attempt in range(max_retries):
         try:
-            response = s.patch(
-                "https://api.worldquantbrain.com/alphas/" + alpha_id,
+            response = paced_request(
+                s,
+                'PATCH',
+                API_URL + "/alphas/" + alpha_id,
                 json=params,
                 timeout=base_timeout,
             )
 
-            # 处理 Retry-After / retry-after
-            retry_after = response.headers.get("Retry-After") or response.headers.get("retry-after")
-            if retry_after:
-                wait_time = float(retry_after)
-                print(f"   ⏳ 设置 {alpha_id} 属性被限流，等待 {wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
+            # 被限流时限速器已暂停 PATCH 类接口，下一次尝试会自动等待
+            if response.status_code == 429:
+                wait_time = limiter.delay('patch')
+                print(f"   ⏳ 设置 {alpha_id} 属性被限流，{wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
                 continue
 
             if response.status_code in (401, 403):
@@ -681,68 +567,41 @@ def set_alpha_properties(
         except requests.exceptions.Timeout:
             wait_time = 2 ** attempt
             print(f"   ⏰ 设置 {alpha_id} 属性超时，{wait_time} 秒后重试 ({attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+            metrics.sleep(wait_time, 'backoff')
         except requests.exceptions.RequestException as e:
             wait_time = 2 ** attempt
             print(
                 f"   ⚠️ 设置 {alpha_id} 属性网络异常: {str(e)[:80]}，{wait_time} 秒后重试 ({attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+            metrics.sleep(wait_time, 'backoff')
 
     raise Exception(f"设置 {alpha_id} 属性失败，已重试 {max_retries} 次仍未成功")
 
 
-def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None, all_yellow_alphas=None):
-    depot = []
-    overtime_alphas = []  # 记录超时的alpha
+def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None, all_yellow_alphas=None,
+                     concurrency=10):
+    """
+    并发检查 alpha_bag[start:]：通过的 (alpha_id, {"pc", "has_false"}) 追加到 gold_bag，
+    超时（超过10分钟）的标记为 YELLOW 并打 overtime 标签。
+    """
     # 使用SessionManager统一管理登录，避免重复登录
     if hasattr(cfg, 'session_manager') and cfg.session_manager:
         s = cfg.session_manager.get_session()
+        relogin = cfg.session_manager.refresh_on_401
     else:
         s = sign_in(cfg.username, cfg.password)
+        relogin = lambda: refresh_session(s)
 
     # 如果没有传入sess，使用s
     if sess is None:
         sess = s
 
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
-            continue
-        if idx % 5 == 0:
-            print(idx)
-        # 移除每200个alpha的定期重新登录，改为在401时统一处理
-        # if idx % 200 == 0:
-        #     s = sign_in(cfg.username, cfg.password)
-        # print(idx)
-        status, payload = get_check_submission(s, g)
-        if status == "sleep":
-            time.sleep(100)
-            # 使用SessionManager刷新session
-            if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                s = cfg.session_manager.refresh_on_401()
-                sess = s
-            else:
-                s = sign_in(cfg.username, cfg.password)
-                sess = s
-            alpha_bag.append(g)
-        elif status == "fail":
-            continue
-        elif status == "error":
-            depot.append(g)
-        elif status == "overtime":
-            # 提交检查超时，记录到overtime_alphas列表
-            overtime_alphas.append(g)
-        elif status == "success":
-            info = payload or {}
-            pc_value = info.get("pc")
-            if pc_value is not None and pd.isna(pc_value):
-                print("check self-corrlation error")
-                time.sleep(100)
-                alpha_bag.append(g)
-                continue
-            gold_bag.append((g, info))
-        else:
-            print(f"   ⚠️ 未知状态 {status}，跳过 {g}")
-            continue
+    outcomes = check_alphas(s, alpha_bag[start:], concurrency=concurrency, relogin=relogin)
+    overtime_alphas = []  # 记录超时的alpha
+    for outcome in outcomes:
+        if outcome.ok:
+            gold_bag.append((outcome.alpha_id, {"pc": outcome.pc, "has_false": outcome.has_false}))
+        elif outcome.status == "overtime":
+            overtime_alphas.append(outcome.alpha_id)
 
     # 处理超时的alpha，标记为黄色并添加overtime标签
     if overtime_alphas and c_d and s_d:
@@ -750,177 +609,41 @@ def check_submission(alpha_bag, gold_bag, start, sess=None, c_d=None, s_d=None,
         overtime_time = datetime.now().strftime("%Y%m%d_%H%M%S")
         for alpha_id in overtime_alphas:
             try:
-                response = set_alpha_properties(sess, alpha_id,
-                                                name=f"{overtime_time}_OVERTIME",
-                                                description="提交检查超时（超过10分钟）",
-                                                combo_desc=c_d,
-                                                selection_desc=s_d,
-                                                color='YELLOW',
-                                                tags=['overtime'])
+                set_alpha_properties(sess, alpha_id,
+                                     name=f"{overtime_time}_OVERTIME",
+                                     description="提交检查超时（超过10分钟）",
+                                     combo_desc=c_d,
+                                     selection_desc=s_d,
+                                     color='YELLOW',
+                                     tags=['overtime'], defer=True)
                 if all_yellow_alphas is not None and alpha_id not in all_yellow_alphas:
                     all_yellow_alphas.append(alpha_id)
-                print(f"   🟡 {alpha_id[:8]}... → YELLOW (overtime, 状态: {response.status_code})")
+                print(f"   🟡 {alpha_id[:8]}... → YELLOW (overtime)")
             except Exception as e:
                 print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
         print(f"   ⏰ OVERTIME标记完成: {len(overtime_alphas)} 个alpha")
 
-    # print('depot')
-    # print(depot)
     return gold_bag
 
 
 def get_check_submission(s, alpha_id, max_retries=3):
     """
-    获取alpha的提交检查结果，包含重试逻辑
+    获取alpha的提交检查结果（单个 alpha，走 check_pipeline）
 
     Args:
         s: session对象
         alpha_id: alpha ID
-        max_retries: 最大重试次数，默认3次
+        max_retries: 最大检查次数，默认3次
 
     Returns:
         Tuple[str, dict | None]: 第一个元素是状态（"sleep"/"fail"/"error"/"success"/"overtime"），第二个元素是success时的额外数据
     """
-    check_start_time = time.time()
-    max_check_time = 10 * 60  # 10分钟 = 600秒
-
-    for attempt in range(max_retries):
-        try:
-            # 获取检查结果（带重试等待）
-            while True:
-                # 检查是否超过10分钟
-                elapsed_time = time.time() - check_start_time
-                if elapsed_time > max_check_time:
-                    elapsed_minutes = elapsed_time / 60
-                    print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                    return "overtime", None
-
-                result = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/check")
-
-                # 检查429状态码和rate limit exceeded消息
-                if result.status_code == 429:
-                    try:
-                        response_text = result.text.lower()
-                        if "rate limit exceeded" in response_text or "api rate limit exceeded" in response_text:
-                            print(f"   🔄 [429] 检测到API速率限制，重新登录...")
-                            # 尝试从全局session_manager获取新session
-                            if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                                new_session = cfg.session_manager.refresh_on_401()
-                                if new_session:
-                                    s.cookies.update(new_session.cookies)
-                                    print("   ✅ 重新登录成功，继续检查...")
-                                else:
-                                    print("   ❌ 重新登录失败")
-                                    return "error", None
-                            else:
-                                new_session = sign_in(cfg.username, cfg.password)
-                                if new_session:
-                                    s.cookies.update(new_session.cookies)
-                                    print("   ✅ 重新登录成功，继续检查...")
-                                else:
-                                    print("   ❌ 重新登录失败")
-                                    return "error", None
-                    except:
-                        pass  # 如果解析响应失败，继续原有逻辑
-
-                retry_after = result.headers.get("retry-after")
-
-                if retry_after:
-                    retry_after_float = float(retry_after)
-                    # 检查等待后是否超过10分钟
-                    if elapsed_time + retry_after_float > max_check_time:
-                        elapsed_minutes = elapsed_time / 60
-                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                        return "overtime", None
-                    time.sleep(retry_after_float)
-                elif result.status_code == 429:
-                    # 429但没有retry-after头，等待默认时间
-                    default_wait = 60
-                    if elapsed_time + default_wait > max_check_time:
-                        elapsed_minutes = elapsed_time / 60
-                        print(f"   ⚠️  {alpha_id}: 提交检查超时（已等待 {elapsed_minutes:.1f} 分钟）")
-                        return "overtime", None
-                    print(f"   ⚠️  [429] API速率限制，等待 {default_wait} 秒...")
-                    time.sleep(default_wait)
-                else:
-                    break
-
-            # 检查是否登出
-            if result.json().get("is", 0) == 0:
-                print(f"   ⚠️  {alpha_id}: logged out")
-                return "sleep", None
-
-            # 解析检查结果
-            checks_df = pd.DataFrame(
-                result.json()["is"]["checks"]
-            )
-
-            # 获取PROD_CORRELATION值
-            pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
-            if len(pc_rows) == 0:
-                raise ValueError("PROD_CORRELATION field not found in checks")
-
-            pc = pc_rows["value"].values[0]
-
-            false_flag = False
-            for field in ("result", "value"):
-                if field not in checks_df.columns:
-                    continue
-                for cell in checks_df[field]:
-                    if isinstance(cell, (bool, np.bool_)):
-                        if cell is False:
-                            false_flag = True
-                            break
-                    elif isinstance(cell, str) and "false" in cell.lower():
-                        false_flag = True
-                        break
-                if false_flag:
-                    break
-
-            # 检查是否有FAIL结果
-            if not any(checks_df["result"] == "FAIL"):
-                if false_flag:
-                    print(f"   🟡 {alpha_id}: PC={pc} 包含 False 检查项")
-                else:
-                    print(f"   ✅ {alpha_id}: PC={pc}")
-                return "success", {"pc": pc, "has_false": false_flag}
-            else:
-                print(f"   ❌ {alpha_id}: 检查失败 (PC={pc})")
-                return "fail", None
-
-        except KeyError as e:
-            # 数据结构错误
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): 字段缺失 {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # 指数退避：1秒、2秒、4秒
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-        except ValueError as e:
-            # PROD_CORRELATION字段不存在
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-        except Exception as e:
-            # 其他未知错误
-            error_type = type(e).__name__
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {error_type} - {str(e)[:50]}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error", None
-
-    # 理论上不会到这里
-    return "error", None
+    outcome = CheckPipeline(s, max_attempts=max_retries, backoff=1).run([alpha_id])[0]
+    if outcome.ok:
+        return "success", {"pc": outcome.pc, "has_false": outcome.has_false}
+    if outcome.status == LOGGED_OUT:
+        return "sleep", None
+    return outcome.status, None
 
 
 def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_num):
@@ -933,136 +656,62 @@ def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_
         s = sign_in(cfg.username, cfg.password)
     output = []
     count = 0
+    started = time.time()
 
-    for i in range(0, alpha_num, 40):
-        offset_start = time.time()
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 地区 {region} API请求，offset={i}")
-
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2026-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2026-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(
-            sharpe_th) + "&settings.region=" + region  + "&is.color!=YELLOW"+ "&order=-is.sharpe&hidden=false&type!=SUPER"
-            # + "&is.color!=PURPLE"
-        urls = [url_e]
-
-        for url in urls:  # 修复缩进，确保这个循环正确执行
-            req_start = time.time()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 发送API请求到: {url[:80]}...")  # 只打印URL前80字符
-
-            try:
-                # 添加超时30秒，避免无限挂起；如果需要重试机制，可以用wait_get替换
-                response = s.get(url, timeout=30)
-                req_time = time.time() - req_start
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API响应状态: {response.status_code}，响应时间: {req_time:.2f}秒")
-
-                if response.status_code != 200:
-                    print(
-                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API错误 {response.status_code}: {response.text[:200]}")  # 只打印前200字符错误信息
-                    # 如果非200，尝试重登录（使用SessionManager）
-                    if response.status_code in (401, 403):
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 尝试重新登录...")
-                        if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                            s = cfg.session_manager.refresh_on_401()
-                        else:
-                            s = sign_in(cfg.username, cfg.password)
-                    elif response.status_code == 429:
-                        # 检查响应消息是否包含 rate limit exceeded
-                        try:
-                            response_text = response.text.lower()
-                            if "rate limit exceeded" in response_text or "api rate limit exceeded" in response_text:
-                                print(
-                                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔄 [429] 检测到API速率限制，重新登录...")
-                                if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                                    s = cfg.session_manager.refresh_on_401()
-                                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✅ 重新登录成功")
-                                else:
-                                    s = sign_in(cfg.username, cfg.password)
-                                    if s:
-                                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✅ 重新登录成功")
-                        except:
-                            pass  # 如果解析响应失败，继续原有逻辑
-                    continue  # 重试这个请求
-
-                # 检查Retry-After头，如果有等待时间
-                retry_after = response.headers.get("Retry-After", 0)
-                if int(retry_after) > 0:
-                    wait_time = int(retry_after)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API要求等待 {wait_time} 秒...")
-                    time.sleep(wait_time)
-
-                alpha_list = response.json()["results"]
-                offset_count = len(alpha_list)
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 获取到 {offset_count} 个alpha，总计数: {count + offset_count}")
-
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s" % exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(
-                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 添加alpha {alpha_id} (Sharpe: {sharpe:.3f})")
-
-                        if turnover > 0.7:
-                            rec.append(decay * 4)
-                        elif turnover > 0.6:
-                            rec.append(decay * 3 + 3)
-                        elif turnover > 0.5:
-                            rec.append(decay * 3)
-                        elif turnover > 0.4:
-                            rec.append(decay * 2)
-                        elif turnover > 0.35:
-                            rec.append(decay + 4)
-                        elif turnover > 0.3:
-                            rec.append(decay + 2)
-                        output.append(rec)
-
-                offset_time = time.time() - offset_start
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 处理完成，耗时: {offset_time:.2f}秒")
-
-            except requests.exceptions.Timeout:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求超时 (30秒)，offset={i}，跳过")
-                continue
-            except requests.exceptions.RequestException as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求异常: {e}，offset={i}")
-                # 尝试重登录（使用SessionManager）
-                try:
-                    if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                        s = cfg.session_manager.refresh_on_401()
-                    else:
-                        s = sign_in(cfg.username, cfg.password)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录成功，继续")
-                except Exception as login_e:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录失败: {login_e}，跳过此offset")
-                continue
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] JSON解析或其他错误: {e}")
-                # 使用SessionManager重登录
-                if hasattr(cfg, 'session_manager') and cfg.session_manager:
-                    s = cfg.session_manager.refresh_on_401()
-                else:
-                    s = sign_in(cfg.username, cfg.password)
-                continue
+    # 候选从本地 alpha 目录筛选：先增量同步（只翻上次之后有改动的 alpha），再走本地索引查询
+    created_from = "2026-" + start_date + "T00:00:00-04:00"
+    catalog = AlphaCatalog()
+    try:
+        try:
+            catalog.sync(s, since=created_from)
+        except requests.exceptions.RequestException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] alpha目录同步失败，使用本地已有数据: {e}")
+        alpha_list = catalog.select(
+            region=region, super_alpha=False, exclude_colors=('YELLOW',),
+            min_sharpe=sharpe_th, min_fitness=fitness_th,
+            created_from=created_from, created_to="2026-" + end_date + "T00:00:00-04:00",
+            limit=alpha_num)
+    finally:
+        catalog.close()
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 地区 {region} 本地筛选到 {len(alpha_list)} 个alpha")
+
+    for j in range(len(alpha_list)):
+        alpha_id = alpha_list[j]["id"]
+        name = alpha_list[j]["name"]
+        dateCreated = alpha_list[j]["dateCreated"]
+        sharpe = alpha_list[j]["is"]["sharpe"]
+        fitness = alpha_list[j]["is"]["fitness"]
+        turnover = alpha_list[j]["is"]["turnover"]
+        margin = alpha_list[j]["is"]["margin"]
+        longCount = alpha_list[j]["is"]["longCount"]
+        shortCount = alpha_list[j]["is"]["shortCount"]
+        decay = alpha_list[j]["settings"]["decay"]
+        exp = alpha_list[j]['regular']['code']
+        count += 1
+
+        if (longCount + shortCount) > 100:
+            if sharpe < -sharpe_th:
+                exp = "-%s" % exp
+            rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
+            print(
+                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 添加alpha {alpha_id} (Sharpe: {sharpe:.3f})")
+
+            if turnover > 0.7:
+                rec.append(decay * 4)
+            elif turnover > 0.6:
+                rec.append(decay * 3 + 3)
+            elif turnover > 0.5:
+                rec.append(decay * 3)
+            elif turnover > 0.4:
+                rec.append(decay * 2)
+            elif turnover > 0.35:
+                rec.append(decay + 4)
+            elif turnover > 0.3:
+                rec.append(decay + 2)
+            output.append(rec)
 
-    total_time = time.time() - offset_start  # 注意：这里offset_start是最后一个循环的，实际应从函数开始计算
     print(
-        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，总计数: {count}，输出: {len(output)}，总耗时约: {total_time:.2f}秒 (估算)")
+        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，总计数: {count}，输出: {len(output)}，总耗时: {time.time() - started:.2f}秒")
     return output
 
 
@@ -1198,6 +847,8 @@ def get_date_range_from_user():
 # 初始化全局SessionManager，统一管理登录，避免重复登录
 cfg.session_manager = SessionManager(cfg.username, cfg.password)
 sess = cfg.session_manager.get_session()
+# 颜色/标签等属性修改交给后台合并发送，候选循环不再被 PATCH 阻塞
+property_writer = PropertyWriter(sess, relogin=cfg.session_manager.refresh_on_401)
 
 # 在循环开始前获取日期范围设置
 print("\n" + "🎯" * 40)
@@ -1219,6 +870,7 @@ while True:
 
     # 每轮开始时更新数据
     download_data(flag_increment=True)
+    os_alpha_ids, os_alpha_rets = load_data()
 
     # 如果是滚动窗口模式，每轮更新日期范围
     if rolling_window and isinstance(rolling_window, int):
@@ -1256,15 +908,19 @@ while True:
         c_d = "1Short descriptions of your Selection Expression and Combo Expression are required to submit this SuperAlpha."
         s_d = "1Short descriptions of your Selection Expression and Combo Expression are required to submit this SuperAlpha."
 
+        # 生产相关性按各 alpha 的下次轮询时间统一调度，每个 alpha 独立计10分钟
+        prod_corr_service = ProdCorrService(sess)
+        prod_corr_futures = {}
+
         # 检查是否有fail
         for idx, alpha_id in enumerate(alpha_ids, 1):
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             try:
                 # 添加请求延迟，避免触发429速率限制（每10个请求后延迟稍长）
                 if idx > 1 and idx % 10 == 1:
-                    time.sleep(2)  # 每10个请求后延迟2秒
+                    metrics.sleep(2, 'throttle')  # 每10个请求后延迟2秒
                 elif idx > 1:
-                    time.sleep(0.5)  # 每个请求之间延迟0.5秒
+                    metrics.sleep(0.5, 'throttle')  # 每个请求之间延迟0.5秒
 
                 result_fail = get_simulation_result_json(sess, alpha_id, session_manager=cfg.session_manager)
                 # 检查是否包含FAIL：只有当result_fail不为空且明确包含"FAIL"时才跳过
@@ -1282,7 +938,6 @@ while True:
 
                 if not has_fail:
                     print(f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 不包含 FAIL，继续")
-                    os_alpha_ids, os_alpha_rets = load_data()
                     self_corr = calc_self_corr(
                         alpha_id=alpha_id,
                         os_alpha_rets=os_alpha_rets,
@@ -1291,206 +946,23 @@ while True:
                     if self_corr < 0.7:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 符合条件")
-                        # 直接调用 API 获取生产相关性
-                        try:
-                            prod_corr_start_time = time.time()
-                            max_wait_time = 10 * 60  # 10分钟 = 600秒
-                            prod_corr_value = None
-                            error_count = {}  # 记录不同状态码的错误次数
-                            last_error_time = {}  # 记录上次输出错误的时间
-
-                            prod_corr_timeout = False  # 标记生产相关性检查是否超时
-                            while True:
-                                # 检查是否超过10分钟
-                                elapsed_time = time.time() - prod_corr_start_time
-                                if elapsed_time > max_wait_time:
-                                    elapsed_minutes = elapsed_time / 60
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                    prod_corr_timeout = True
-                                    break
-
-                                response = sess.get(
-                                    "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod",
-                                    timeout=5 * 60  # 5分钟 = 300秒
-                                )
-
-                                # 处理429速率限制错误
-                                if response.status_code == 429:
-                                    # 检查响应消息是否包含 rate limit exceeded
-                                    try:
-                                        response_text = response.text.lower()
-                                        if "rate limit exceeded" in response_text or "api rate limit exceeded" in response_text:
-                                            print(f"   🔄 [429] 检测到API速率限制，重新登录...")
-                                            # 使用SessionManager刷新session
-                                            if cfg.session_manager:
-                                                new_session = cfg.session_manager.refresh_on_401()
-                                                if new_session:
-                                                    sess.cookies.update(new_session.cookies)
-                                                    print("   ✅ 重新登录成功，继续获取生产相关性...")
-                                                else:
-                                                    print("   ❌ 重新登录失败，跳过此alpha")
-                                                    prod_corr_timeout = True
-                                                    break
-                                            else:
-                                                # 兼容旧代码，直接登录
-                                                new_session = sign_in(cfg.username, cfg.password)
-                                                if new_session:
-                                                    sess.cookies.update(new_session.cookies)
-                                                    print("   ✅ 重新登录成功，继续获取生产相关性...")
-                                                else:
-                                                    print("   ❌ 重新登录失败，跳过此alpha")
-                                                    prod_corr_timeout = True
-                                                    break
-                                    except:
-                                        pass  # 如果解析响应失败，继续原有逻辑
-
-                                    retry_after = float(response.headers.get("Retry-After", 60))
-                                    if elapsed_time + retry_after > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-                                    print(f"   ⚠️  [429] API速率限制，等待 {retry_after:.1f} 秒...")
-                                    time.sleep(retry_after)
-                                    continue  # 重试请求
-
-                                if "retry-after" in response.headers:
-                                    retry_after = float(response.headers["Retry-After"])
-                                    # 检查等待时间加上已用时间是否超过10分钟
-                                    if elapsed_time + retry_after > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-                                    time.sleep(retry_after)
-                                elif response.status_code == 200:
-                                    prod_corr_data = response.json()
-                                    prod_corr_value = prod_corr_data.get('max', None)
-                                    break
-                                elif response.status_code == 412:
-                                    # 412 Precondition Failed - 特殊处理
-                                    status_code = response.status_code
-                                    error_count[status_code] = error_count.get(status_code, 0) + 1
-                                    count = error_count[status_code]
-
-                                    # 检查是否有Retry-After头
-                                    retry_after = response.headers.get("Retry-After")
-                                    if retry_after:
-                                        wait_time = float(retry_after)
-                                    else:
-                                        # 412错误通常需要等待更长时间，使用递增等待时间
-                                        wait_time = min(30 + (count - 1) * 5, 120)  # 30秒起步，每次增加5秒，最多120秒
-
-                                    # 检查等待时间加上已用时间是否超过10分钟
-                                    if elapsed_time + wait_time > max_wait_time:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {elapsed_minutes:.1f} 分钟），直接进入提交检查")
-                                        prod_corr_timeout = True
-                                        break
-
-                                    # 只在特定次数输出（减少日志噪音）
-                                    if count == 1 or count % 5 == 0:
-                                        elapsed_minutes = elapsed_time / 60
-                                        print(
-                                            f"   ⚠️  [412] 前置条件不满足（已重试 {count} 次，已等待 {elapsed_minutes:.1f} 分钟），等待 {wait_time:.1f} 秒后重试...")
-
-                                    time.sleep(wait_time)
-                                    continue
-                                else:
-                                    # 其他错误状态码，等待后重试
-                                    status_code = response.status_code
-                                    error_count[status_code] = error_count.get(status_code, 0) + 1
-                                    current_time = time.time()
-
-                                    # 智能输出策略：减少重复输出
-                                    count = error_count[status_code]
-                                    # 定义输出里程碑：1, 10, 50, 100, 200, 500, 1000, 2000...
-                                    milestones = [1, 10, 50, 100, 200, 500, 1000, 2000, 5000]
-                                    is_milestone = count in milestones
-
-                                    # 时间间隔：第一次后，每60秒输出一次（而不是30秒）
-                                    time_since_last = (current_time - last_error_time.get(status_code,
-                                                                                          0)) if status_code in last_error_time else float(
-                                        'inf')
-                                    time_threshold = 60 if count > 1 else 0  # 第一次立即输出，之后每60秒
-
-                                    # 只在里程碑或时间间隔达到时输出
-                                    should_print = (
-                                            is_milestone or  # 达到里程碑次数
-                                            (count == 1) or  # 第一次
-                                            (time_since_last >= time_threshold and count > 1)  # 达到时间间隔且不是第一次
-                                    )
-
-                                    if should_print:
-                                        if count > 1:
-                                            print(
-                                                f"   ⚠️  获取生产相关性返回状态码 {status_code}（已重试 {count} 次），等待3分钟后继续重试...")
-                                        else:
-                                            print(f"   ⚠️  获取生产相关性返回状态码 {status_code}，等待3分钟后重试...")
-                                        last_error_time[status_code] = current_time
-
-                                    time.sleep(3 * 60)  # 3分钟 = 180秒
-                                    continue
-
-                            # 如果生产相关性检查超时，直接进入提交检查
-                            if prod_corr_timeout:
-                                print(
-                                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性检查超时，直接进入提交检查")
-                                alpha_bag.append(alpha_id)
-                                prod_corr_dict[alpha_id] = None  # 标记为超时，未获取到生产相关性值
-                            elif prod_corr_value is not None:
-                                if float(prod_corr_value) < 0.7:
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
-                                    alpha_bag.append(alpha_id)
-                                    prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
-                                else:
-                                    print(
-                                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
-                                    # 生产相关性 > 0.7，标记为黄色
-                                    try:
-                                        yellow_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                        yellow_tag = "PROD_CORR_HIGH"
-                                        response = set_alpha_properties(sess,
-                                                                        alpha_id,
-                                                                        name=f"{yellow_time}_{yellow_tag}",
-                                                                        description=f"生产相关性>0.7 ({prod_corr_value:.3f})",
-                                                                        combo_desc=c_d,
-                                                                        selection_desc=s_d,
-                                                                        color='YELLOW',
-                                                                        tags=[yellow_tag])
-                                        if alpha_id not in all_yellow_alphas:
-                                            all_yellow_alphas.append(alpha_id)
-                                        print(
-                                            f"   🟡 {alpha_id[:8]}... → YELLOW (生产相关性: {prod_corr_value:.3f}, 状态: {response.status_code})")
-                                    except Exception as e:
-                                        print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
-
-                        except requests.exceptions.Timeout:
-                            print(
-                                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性请求超时，跳过")
-                        except Exception as e:
-                            print(
-                                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {str(e)[:50]}")
+                        # 生产相关性交给后台轮询服务，其余候选继续做自相关检查，不再逐个阻塞等待
+                        prod_corr_futures[alpha_id] = (idx, prod_corr_service.submit(alpha_id))
                     else:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 不符合条件")
                         try:
                             purple_time = datetime.now().strftime("%Y%m%d_%H%M%S")
                             purple_tag = "SELF_CORR_FAIL"
-                            response = set_alpha_properties(sess,
-                                                            alpha_id,
-                                                            name=f"{purple_time}_{purple_tag}",
-                                                            description="自相关性过高，暂不提交",
-                                                            combo_desc=c_d,
-                                                            selection_desc=s_d,
-                                                            color='PURPLE',
-                                                            tags=[purple_tag])
-                            print(f"   🟣 {alpha_id[:8]}... → PURPLE (状态: {response.status_code})")
+                            set_alpha_properties(sess,
+                                                 alpha_id,
+                                                 name=f"{purple_time}_{purple_tag}",
+                                                 description="自相关性过高，暂不提交",
+                                                 combo_desc=c_d,
+                                                 selection_desc=s_d,
+                                                 color='PURPLE',
+                                                 tags=[purple_tag], defer=True)
+                            print(f"   🟣 {alpha_id[:8]}... → PURPLE (已排队)")
                         except Exception as e:
                             print(f"   ⚠️ 标记PURPLE失败 {alpha_id[:8]}...: {str(e)[:120]}")
                         continue
@@ -1500,17 +972,18 @@ while True:
                     try:
                         fail_mark_time = datetime.now().strftime("%Y%m%d_%H%M%S")
                         fail_tag = "FAIL_CHECK"
-                        response = set_alpha_properties(
+                        set_alpha_properties(
                             sess,
                             alpha_id,
                             name=f"{fail_mark_time}_{fail_tag}",
                             color='YELLOW',
                             description="包含 FAIL 检查项，暂时跳过",
                             selection_desc="包含 FAIL 检查项，未提交",
-                            tags=[fail_tag])
+                            tags=[fail_tag],
+                            defer=True)
                         if alpha_id not in all_yellow_alphas:
                             all_yellow_alphas.append(alpha_id)
-                        print(f"   🟡 {alpha_id[:8]}... → YELLOW (状态: {response.status_code})")
+                        print(f"   🟡 {alpha_id[:8]}... → YELLOW (已排队)")
                     except Exception as e:
                         print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
                     continue  # 包含FAIL，跳过后续处理
@@ -1521,9 +994,57 @@ while True:
                     f"[{current_time}] [{idx}/{len(alpha_ids)}] ❌ 处理 alpha_id: {alpha_id} 时出错: {type(e).__name__} - {str(e)[:100]}")
                 continue
 
+        # 按完成先后处理生产相关性结果
+        future_index = {future: (idx, alpha_id) for alpha_id, (idx, future) in prod_corr_futures.items()}
+        for future in as_completed(future_index):
+            idx, alpha_id = future_index[future]
+            prod_corr_result = future.result()
+            prod_corr_value = prod_corr_result.value
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if prod_corr_result.status == 'timeout':
+                # 如果生产相关性检查超时，直接进入提交检查
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 检查生产相关性超时（已等待 {prod_corr_result.elapsed / 60:.1f} 分钟），直接进入提交检查")
+                alpha_bag.append(alpha_id)
+                prod_corr_dict[alpha_id] = None  # 标记为超时，未获取到生产相关性值
+            elif prod_corr_result.status == 'error':
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {str(prod_corr_result.error)[:50]}")
+            elif prod_corr_value is not None:
+                if float(prod_corr_value) < 0.7:
+                    print(
+                        f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
+                    alpha_bag.append(alpha_id)
+                    prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
+                else:
+                    print(
+                        f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
+                    # 生产相关性 > 0.7，标记为黄色
+                    try:
+                        yellow_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        yellow_tag = "PROD_CORR_HIGH"
+                        set_alpha_properties(sess,
+                                             alpha_id,
+                                             name=f"{yellow_time}_{yellow_tag}",
+                                             description=f"生产相关性>0.7 ({prod_corr_value:.3f})",
+                                             combo_desc=c_d,
+                                             selection_desc=s_d,
+                                             color='YELLOW',
+                                             tags=[yellow_tag], defer=True)
+                        if alpha_id not in all_yellow_alphas:
+                            all_yellow_alphas.append(alpha_id)
+                        print(
+                            f"   🟡 {alpha_id[:8]}... → YELLOW (生产相关性: {prod_corr_value:.3f})")
+                    except Exception as e:
+                        print(f"   ⚠️ 标记YELLOW失败 {alpha_id[:8]}...: {str(e)[:120]}")
+        prod_corr_service.close()
+        print(f"   📊 [ProdCorr] {prod_corr_service.stats}")
+
         print("添加描述")
         for alpha_id in alpha_bag:
-            set_alpha_properties(sess, alpha_id, description=project_spec)
+            set_alpha_properties(sess, alpha_id, description=project_spec, defer=True)
+        # 提交检查前确保描述和本轮标记都已写到服务器
+        property_writer.flush()
         print("添加描述完成")
 
         print("提交检查")
@@ -1554,15 +1075,15 @@ while True:
             red_fail_count = 0
             for alpha in failed_alphas:
                 try:
-                    response = set_alpha_properties(sess, alpha,
-                                                    name=current_time_name,
-                                                    description=project_spec,
-                                                    combo_desc=c_d,
-                                                    color='RED',
-                                                    selection_desc=s_d,
-                                                    tags=['SUBMISSION_FAIL'])  # 标记为提交检查失败
+                    set_alpha_properties(sess, alpha,
+                                         name=current_time_name,
+                                         description=project_spec,
+                                         combo_desc=c_d,
+                                         color='RED',
+                                         selection_desc=s_d,
+                                         tags=['SUBMISSION_FAIL'], defer=True)  # 标记为提交检查失败
                     red_success_count += 1
-                    print(f"   🔴 {alpha[:8]}... → RED (状态: {response.status_code})")
+                    print(f"   🔴 {alpha[:8]}... → RED (已排队)")
                 except Exception as e:
                     red_fail_count += 1
                     error_msg = str(e)
@@ -1602,19 +1123,19 @@ while True:
                     prod_corr_value = prod_corr_dict.get(alpha, 0.0)
                     alpha_name = f"{yellow_time_name}_{prod_corr_value:.3f}"
 
-                    response = set_alpha_properties(sess, alpha,
-                                                    name=alpha_name,
-                                                    description=project_spec,
-                                                    combo_desc=c_d,
-                                                    selection_desc=s_d,
-                                                    color='YELLOW',
-                                                    tags=[tag_name])
+                    set_alpha_properties(sess, alpha,
+                                         name=alpha_name,
+                                         description=project_spec,
+                                         combo_desc=c_d,
+                                         selection_desc=s_d,
+                                         color='YELLOW',
+                                         tags=[tag_name], defer=True)
                     if alpha not in all_yellow_alphas:
                         all_yellow_alphas.append(alpha)
                     yellow_success_count += 1
                     if yellow_success_count <= 5:
                         print(
-                            f"   🟡 {alpha[:8]}... → YELLOW | Name: {alpha_name} | Tag: {tag_name} (状态: {response.status_code})")
+                            f"   🟡 {alpha[:8]}... → YELLOW | Name: {alpha_name} | Tag: {tag_name} (已排队)")
 
                 except Exception as e:
                     yellow_fail_count += 1
@@ -1646,17 +1167,17 @@ while True:
                 prod_corr_value = prod_corr_dict.get(alpha, 0.0)
                 alpha_name = f"{current_time_name}_{prod_corr_value:.3f}"
 
-                response = set_alpha_properties(sess, alpha,
-                                                name=alpha_name,
-                                                description=project_spec,
-                                                combo_desc=c_d,
-                                                selection_desc=s_d,
-                                                color='GREEN',  # ✅ 确保是GREEN
-                                                tags=[tag_name])
+                set_alpha_properties(sess, alpha,
+                                     name=alpha_name,
+                                     description=project_spec,
+                                     combo_desc=c_d,
+                                     selection_desc=s_d,
+                                     color='GREEN',  # ✅ 确保是GREEN
+                                     tags=[tag_name], defer=True)
                 green_success_count += 1
                 if green_success_count <= 5:
                     print(
-                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (状态: {response.status_code})")
+                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (已排队)")
             except Exception as e:
                 green_fail_count += 1
                 error_msg = str(e)
@@ -1671,6 +1192,7 @@ while True:
 
         print(f"   🟢 GREEN标记完成: 成功 {green_success_count}/{len(green_alphas)}，失败 {green_fail_count}")
 
+        property_writer.flush()
         print(f"\n✅ 地区 {region} 完成: 通过 {len(alpha_lis)} 个，失败 {len(failed_alphas)} 个")
         region_summaries[region] = {
             "total_candidates": len(alpha_ids),
@@ -1696,4 +1218,4 @@ while True:
     wait_minutes = 300
     print(f"\n⏰ 等待 {wait_minutes} 分钟后开始下一轮...")
     print(f"   下一轮预计开始时间: {(datetime.now() + timedelta(minutes=wait_minutes)).strftime('%Y-%m-%d %H:%M:%S')}")
-    time.sleep(wait_minutes * 60)
\ No newline at end of file
+    metrics.sleep(wait_minutes * 60, 'round_wait')
\ No newline at end of file
@@ -8,89 +8,43 @@ import warnings
 from typing import Optional, Tuple
 from typing import Tuple, Dict, List
 from typing import Union, List, Tuple
-from concurrent.futures import ThreadPoolExecutor
 import pickle
 from collections import defaultdict
 import numpy as np
 from pathlib import Path
 import json
 import os
+from concurrent.futures import as_completed
+
+from alpha_catalog import AlphaCatalog
+from brain_async import API_URL, run_sync, run_many
+from check_pipeline import FAIL, LOGGED_OUT, CheckPipeline, check_alphas
+from corr_engine import region_engine
+from metrics import metrics
+from os_store import os_store
+from os_sync import fetch_os_alphas_since, load_watermark, newest_submitted, save_watermark
+from pnl_store import open_pnl_store
+from prod_corr import ProdCorrService
+from property_writer import PropertyWriter
+from rate_limiter import limiter, paced_request
+from session_pool import AuthenticationError, get_session, refresh_session
+
+
+def sign_in(username, password):
+    """
+    登录到 WorldQuant BRAIN 平台。
 
+    返回 session_pool 中该账号共享的 Session：进程内只认证一次，令牌快过期或遇到 401 时由池自动重新认证
+    （429 重试也在池里处理）。
 
-def sign_in(username, password, max_retries: int = 5, base_delay: float = 2.0):
-    """
-    登录到 WorldQuant BRAIN 平台，带429错误重试机制
-    
-    Args:
-        username: 用户名
-        password: 密码
-        max_retries: 最大重试次数，默认5次
-        base_delay: 基础延迟时间（秒），默认2秒，使用指数退避
-    
     Returns:
         Session对象（成功）或None（失败）
     """
-    s = requests.Session()
-    s.auth = (username, password)
-    
-    for attempt in range(max_retries):
-        try:
-            response = s.post('https://api.worldquantbrain.com/authentication', timeout=30)
-            
-            # 处理429限流错误
-            if response.status_code == 429:
-                retry_after = response.headers.get("Retry-After")
-                if retry_after:
-                    wait_time = float(retry_after)
-                else:
-                    # 使用指数退避：2秒、4秒、8秒、16秒、32秒
-                    wait_time = base_delay * (2 ** attempt)
-                
-                if attempt < max_retries - 1:
-                    logging.warning(f"Login rate limited (429), waiting {wait_time:.1f}s before retry ({attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logging.error(f"Login failed after {max_retries} retries: 429 Too Many Requests")
-                    return None
-            
-            # 处理其他HTTP错误
-            if response.status_code >= 400:
-                if attempt < max_retries - 1:
-                    wait_time = base_delay * (2 ** attempt)
-                    logging.warning(f"Login failed with status {response.status_code}, retrying in {wait_time:.1f}s ({attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logging.error(f"Login failed after {max_retries} retries: HTTP {response.status_code}")
-                    return None
-            
-            # 成功登录
-            response.raise_for_status()
-            logging.info("Successfully signed in")
-            return s
-            
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                wait_time = base_delay * (2 ** attempt)
-                logging.warning(f"Login timeout, retrying in {wait_time:.1f}s ({attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            else:
-                logging.error(f"Login failed after {max_retries} retries: Timeout")
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = base_delay * (2 ** attempt)
-                logging.warning(f"Login request failed: {str(e)[:80]}, retrying in {wait_time:.1f}s ({attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            else:
-                logging.error(f"Login failed after {max_retries} retries: {e}")
-                return None
-    
-    return None
+    try:
+        return get_session(username, password)
+    except AuthenticationError as e:
+        logging.error(f"Login failed: {e}")
+        return None
 
 
 def save_obj(obj: object, name: str) -> None:
@@ -140,14 +94,17 @@ def wait_get(url: str, max_retries: int = 10) -> "requests.Response":
     retries = 0
     while retries < max_retries:
         while True:
-            simulation_progress = sess.get(url)
+            simulation_progress = paced_request(sess, 'GET', url)
+            if simulation_progress.status_code == 429:
+                # 限速器已按 Retry-After 暂停该类接口，直接重试即可
+                continue
             if simulation_progress.headers.get("Retry-After", 0) == 0:
                 break
-            time.sleep(float(simulation_progress.headers["Retry-After"]))
+            metrics.sleep(float(simulation_progress.headers["Retry-After"]), 'retry_after')
         if simulation_progress.status_code < 400:
             break
         else:
-            time.sleep(2 ** retries)
+            metrics.sleep(2 ** retries, 'backoff')
             retries += 1
     return simulation_progress
 
@@ -162,7 +119,14 @@ def _get_alpha_pnl(alpha_id: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: 包含日期和对应 PnL 数据的 DataFrame，列名为 'Date' 和 alpha_id。
     """
-    pnl = wait_get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/recordsets/pnl").json()
+    pnl = run_sync(sess, lambda c: c.get_pnl(alpha_id)).json()
+    return _pnl_to_frame(alpha_id, pnl)
+
+
+def _pnl_to_frame(alpha_id: str, pnl: dict) -> pd.DataFrame:
+    """
+    将 /recordsets/pnl 的响应转换为列名为 'Date' 和 alpha_id 的 DataFrame。
+    """
     df = pd.DataFrame(pnl['records'], columns=[item['name'] for item in pnl['schema']['properties']])
     df = df.rename(columns={'date': 'Date', 'pnl': alpha_id})
     df = df[['Date', alpha_id]]
@@ -223,17 +187,19 @@ def get_alpha_pnls(
             print(f"   ⚠️  [get_alpha_pnls] 分类alpha时出错，跳过 {item_alpha.get('id', 'unknown')}: {type(e).__name__}")
             continue
 
-    # 获取PnL数据（带错误处理）
-    def safe_get_pnl(alpha_id):
+    # 获取PnL数据：同一个事件循环内并发请求，失败的跳过
+    fetch_ids = [item['id'] for item in new_alphas]
+    responses = run_many(sess, lambda c, alpha_id: c.get_pnl(alpha_id), fetch_ids, limit=20)
+
+    results = []
+    for alpha_id, response in zip(fetch_ids, responses):
         try:
-            return _get_alpha_pnl(alpha_id).set_index('Date')
+            if isinstance(response, Exception):
+                raise response
+            results.append(_pnl_to_frame(alpha_id, response.json()).set_index('Date'))
         except Exception as e:
             print(f"   ⚠️  [get_alpha_pnls] 获取 {alpha_id} 的PnL失败，跳过: {type(e).__name__} - {str(e)[:50]}")
-            return None
-
-    fetch_pnl_func = safe_get_pnl
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = executor.map(fetch_pnl_func, [item['id'] for item in new_alphas])
+            results.append(None)
 
     # 过滤掉None结果
     valid_results = [r for r in results if r is not None]
@@ -244,90 +210,6 @@ def get_alpha_pnls(
     return alpha_ids, alpha_pnls
 
 
-def get_os_alphas(limit: int = 100, get_first: bool = False) -> List[Dict]:
-    """
-    获取OS阶段的alpha列表。
-    此函数通过调用WorldQuant Brain API获取用户的alpha列表，支持分页获取，并可以选择只获取第一个结果。
-    Args:
-        limit (int, optional): 每次请求获取的alpha数量限制。默认为100。
-        get_first (bool, optional): 是否只获取第一次请求的alpha结果。如果为True，则只请求一次。默认为False。
-    Returns:
-        List[Dict]: 包含alpha信息的字典列表，每个字典表示一个alpha。
-    """
-    fetched_alphas = []
-    offset = 0
-    retries = 0
-    total_alphas = 100
-
-    try:
-        while len(fetched_alphas) < total_alphas:
-            print(f"Fetching alphas from offset {offset} to {offset + limit}")
-            url = f"https://api.worldquantbrain.com/users/self/alphas?stage=OS&limit={limit}&offset={offset}&order=-dateSubmitted"
-
-            try:
-                res = wait_get(url).json()
-            except Exception as e:
-                print(f"   ⚠️  [get_os_alphas] API请求失败: {type(e).__name__} - {str(e)[:100]}")
-                break
-
-            # 检查响应格式
-            if not isinstance(res, dict):
-                print(f"   ⚠️  [get_os_alphas] API响应不是字典格式: {type(res)}")
-                break
-
-            # 检查是否有错误信息
-            if 'error' in res or 'message' in res:
-                error_msg = res.get('error', res.get('message', 'Unknown error'))
-                print(f"   ⚠️  [get_os_alphas] API返回错误: {error_msg}")
-                break
-
-            # 检查是否有 'count' 字段（只在第一次请求时）
-            if offset == 0:
-                if 'count' not in res:
-                    print(f"   ⚠️  [get_os_alphas] API响应缺少'count'字段，使用实际获取的数量")
-                    # 如果没有count字段，尝试从results长度推断，或使用默认值
-                    if 'results' in res and isinstance(res['results'], list):
-                        total_alphas = len(res['results'])
-                        if len(res['results']) < limit:
-                            # 如果第一次获取的数量小于limit，说明已经获取完了
-                            fetched_alphas.extend(res['results'])
-                            break
-                    else:
-                        total_alphas = limit * 10  # 设置一个合理的上限
-                else:
-                    total_alphas = res['count']
-
-            # 检查是否有 'results' 字段
-            if 'results' not in res:
-                print(f"   ⚠️  [get_os_alphas] API响应缺少'results'字段")
-                print(f"   响应keys: {list(res.keys())[:10]}")
-                break
-
-            alphas = res["results"]
-            if not isinstance(alphas, list):
-                print(f"   ⚠️  [get_os_alphas] 'results'不是列表格式: {type(alphas)}")
-                break
-
-            fetched_alphas.extend(alphas)
-
-            if len(alphas) < limit:
-                break
-
-            offset += limit
-            if get_first:
-                break
-
-    except Exception as e:
-        print(f"   ⚠️  [get_os_alphas] 处理过程中出错: {type(e).__name__} - {str(e)[:100]}")
-
-    # 如果获取到了数据，返回数据；否则返回空列表
-    if fetched_alphas:
-        return fetched_alphas[:total_alphas] if total_alphas > 0 else fetched_alphas
-    else:
-        print(f"   ⚠️  [get_os_alphas] 未获取到任何alpha数据")
-        return []
-
-
 def calc_self_corr(
         alpha_id: str,
         os_alpha_rets: pd.DataFrame | None = None,
@@ -352,7 +234,7 @@ def calc_self_corr(
     try:
         if alpha_result is None:
             print(f"   [calc_self_corr] 获取 alpha {alpha_id} 的详细信息...")
-            alpha_result = wait_get(f"https://api.worldquantbrain.com/alphas/{alpha_id}").json()
+            alpha_result = wait_get(f"{API_URL}/alphas/{alpha_id}").json()
 
         # 验证alpha_result数据结构
         if not isinstance(alpha_result, dict):
@@ -394,39 +276,9 @@ def calc_self_corr(
             print(f"   ⚠️  [calc_self_corr] 区域 {region} 没有可用的OS alpha数据")
             return 0.0 if not return_alpha_pnls else (0.0, alpha_pnls)
 
-        region_os_rets = os_alpha_rets[os_alpha_ids[region]]
-
-        # 过滤掉标准差为0或NaN的alpha（避免除以零警告）
-        valid_cols = region_os_rets.columns[
-            (region_os_rets.std() > 1e-10) & (region_os_rets.std().notna())
-            ]
-
-        # 检查目标alpha的标准差是否有效
-        if len(alpha_rets.dropna()) > 0 and alpha_rets.std() > 1e-10:
-            # 只计算与有效alpha的相关性
-            if len(valid_cols) > 0:
-                region_os_rets_valid = region_os_rets[valid_cols]
-
-                # 使用警告上下文管理器抑制预期的除以零警告
-                with warnings.catch_warnings():
-                    warnings.filterwarnings('ignore', category=RuntimeWarning, message='invalid value encountered')
-                    corr_results = region_os_rets_valid.corrwith(alpha_rets)
-                    corr_results = corr_results.dropna()  # 移除NaN结果
-
-                    if len(corr_results) > 0:
-                        corr_results.sort_values(ascending=False).round(4).to_csv(
-                            str(cfg.data_path / 'os_alpha_corr.csv'))
-                        self_corr = corr_results.max()
-                    else:
-                        self_corr = 0
-            else:
-                self_corr = 0
-        else:
-            # 目标alpha标准差无效，无法计算相关性
-            self_corr = 0
-
-        if np.isnan(self_corr):
-            self_corr = 0
+        # 在该区域预先标准化好的OS收益率矩阵上一次矩阵乘法求相关（缺失日期按掩码成对对齐）
+        engine = region_engine(os_alpha_rets, os_alpha_ids, region)
+        self_corr, _ = engine.max_corr(alpha_rets)[0]
 
         if return_alpha_pnls:
             return self_corr, alpha_pnls
@@ -449,67 +301,71 @@ def download_data(flag_increment=True):
     """
     下载数据并保存到指定路径。
     此函数会检查数据是否已经存在，如果不存在，则从 API 下载数据并保存到指定路径。
+    PnL 按列追加到 cfg.data_path/os_pnl，只写入新下载的 alpha。
     Args:
         flag_increment (bool): 是否使用增量下载，默认为 True。
     """
+    pnl_store = open_pnl_store(cfg.data_path)
     if flag_increment:
         try:
             os_alpha_ids = load_obj(str(cfg.data_path / 'os_alpha_ids'))
-            os_alpha_pnls = load_obj(str(cfg.data_path / 'os_alpha_pnls'))
             ppac_alpha_ids = load_obj(str(cfg.data_path / 'ppac_alpha_ids'))
-            exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids]
+            exist_alpha = {alpha for ids in os_alpha_ids.values() for alpha in ids}
         except Exception as e:
             logging.error(f"Failed to load existing data: {e}")
             os_alpha_ids = None
-            os_alpha_pnls = None
-            exist_alpha = []
+            exist_alpha = set()
             ppac_alpha_ids = []
     else:
         os_alpha_ids = None
-        os_alpha_pnls = None
-        exist_alpha = []
+        exist_alpha = set()
         ppac_alpha_ids = []
+        pnl_store.clear()
 
-    if os_alpha_ids is None:
-        alphas = get_os_alphas(limit=100, get_first=False)
-    else:
-        alphas = get_os_alphas(limit=30, get_first=True)
+    # 按 dateSubmitted 倒序翻页直到越过上次的水位线；没有已有数据时全量翻页
+    watermark_file = cfg.data_path / 'os_sync.json'
+    watermark = load_watermark(watermark_file) if os_alpha_ids is not None else None
+    alphas, complete = fetch_os_alphas_since(sess, watermark)
+    new_watermark = newest_submitted(alphas, watermark) if complete else watermark
 
     alphas = [item for item in alphas if item['id'] not in exist_alpha]
     ppac_alpha_ids += [item['id'] for item in alphas for item_match in item['classifications'] if
                        item_match['name'] == 'Power Pool Alpha']
 
-    os_alpha_ids, os_alpha_pnls = get_alpha_pnls(alphas, alpha_pnls=os_alpha_pnls, alpha_ids=os_alpha_ids)
+    if not alphas and os_alpha_ids is not None:
+        # 没有新alpha：磁盘文件不变，内存中的收益率也不必重算
+        if not os_store.loaded:
+            os_store.load(cfg.data_path)
+        if new_watermark and new_watermark != watermark:
+            save_watermark(watermark_file, new_watermark)
+        print(f'新下载的alpha数量: 0, 目前总共alpha数量: {len(pnl_store)}')
+        return
+
+    reload = os_alpha_ids is None or not os_store.loaded
+    os_alpha_ids, new_pnls = get_alpha_pnls(alphas, alpha_ids=os_alpha_ids)
+    pnl_store.append(new_pnls)
     save_obj(os_alpha_ids, str(cfg.data_path / 'os_alpha_ids'))
-    save_obj(os_alpha_pnls, str(cfg.data_path / 'os_alpha_pnls'))
     save_obj(ppac_alpha_ids, str(cfg.data_path / 'ppac_alpha_ids'))
-    print(f'新下载的alpha数量: {len(alphas)}, 目前总共alpha数量: {os_alpha_pnls.shape[1]}')
+    if new_watermark:
+        save_watermark(watermark_file, new_watermark)
+    if reload:
+        os_store.load(cfg.data_path)
+    else:
+        os_store.extend(os_alpha_ids, new_pnls, ppac_alpha_ids)
+    print(f'新下载的alpha数量: {len(alphas)}, 目前总共alpha数量: {len(pnl_store)}')
 
 
 def load_data(tag=None):
     """
     加载数据。
-    此函数会检查数据是否已经存在，如果不存在，则从 API 下载数据并保存到指定路径。
+    返回内存中 OS 收益率数据的视图，只在本进程第一次调用时读取 download_data 保存的文件；
+    download_data 下载到新 alpha 后视图自动更新。
     Args:
-        tag (str): 数据标记，默认为 None。
+        tag (str): 数据标记，默认为 None；'PPAC' 只保留 Power Pool alpha，'SelfCorr' 排除 Power Pool alpha。
     """
-    os_alpha_ids = load_obj(str(cfg.data_path / 'os_alpha_ids'))
-    os_alpha_pnls = load_obj(str(cfg.data_path / 'os_alpha_pnls'))
-    ppac_alpha_ids = load_obj(str(cfg.data_path / 'ppac_alpha_ids'))
-    if tag == 'PPAC':
-        for item in os_alpha_ids:
-            os_alpha_ids[item] = [alpha for alpha in os_alpha_ids[item] if alpha in ppac_alpha_ids]
-    elif tag == 'SelfCorr':
-        for item in os_alpha_ids:
-            os_alpha_ids[item] = [alpha for alpha in os_alpha_ids[item] if alpha not in ppac_alpha_ids]
-    else:
-        os_alpha_ids = os_alpha_ids
-    exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids]
-    os_alpha_pnls = os_alpha_pnls[exist_alpha]
-    os_alpha_rets = os_alpha_pnls - os_alpha_pnls.ffill().shift(1)
-    os_alpha_rets = os_alpha_rets[
-        pd.to_datetime(os_alpha_rets.index) > pd.to_datetime(os_alpha_rets.index).max() - pd.DateOffset(years=4)]
-    return os_alpha_ids, os_alpha_rets
+    if not os_store.loaded:
+        os_store.load(cfg.data_path)
+    return os_store.view(tag)
 
 
 def get_simulation_result_json(s, alpha_id, max_retries: int = 5, base_delay: float = 2.0):
@@ -518,17 +374,12 @@ def get_simulation_result_json(s, alpha_id, max_retries: int = 5, base_delay: fl
     """
     for attempt in range(max_retries):
         try:
-            response = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id, timeout=30)
+            response = paced_request(s, 'GET', API_URL + "/alphas/" + alpha_id, timeout=30)
 
-            # 429 限流处理
+            # 429 限流处理：限速器已暂停该类接口，下一次请求会自动等待
             if response.status_code == 429:
-                retry_after = response.headers.get("Retry-After")
-                if retry_after:
-                    wait_time = float(retry_after)
-                else:
-                    wait_time = base_delay * (2 ** attempt)
-                print(f"   ⏳  [get_simulation_result_json] {alpha_id} 限流，等待 {wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
+                wait_time = limiter.delay('alpha')
+                print(f"   ⏳  [get_simulation_result_json] {alpha_id} 限流，{wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
                 continue
 
             # 401/403 重新登录
@@ -547,12 +398,12 @@ def get_simulation_result_json(s, alpha_id, max_retries: int = 5, base_delay: fl
         except requests.exceptions.Timeout:
             wait_time = base_delay * (2 ** attempt)
             print(f"   ⏰  [get_simulation_result_json] {alpha_id} 请求超时，{wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+            metrics.sleep(wait_time, 'backoff')
 
         except requests.exceptions.RequestException as e:
             wait_time = base_delay * (2 ** attempt)
             print(f"   ⚠️  [get_simulation_result_json] {alpha_id} 网络异常: {str(e)[:80]}，{wait_time:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+            metrics.sleep(wait_time, 'backoff')
 
         except Exception as e:
             print(f"   ⚠️  [get_simulation_result_json] 获取 {alpha_id} 失败: {type(e).__name__} - {str(e)[:80]}")
@@ -568,14 +419,7 @@ def get_prod_corr(s, alpha_id):
     and save result to dataframe
     """
 
-    while True:
-        result = s.get(
-            "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod"
-        )
-        if "retry-after" in result.headers:
-            time.sleep(float(result.headers["Retry-After"]))
-        else:
-            break
+    result = run_sync(s, lambda c: c.get_correlations(alpha_id, 'prod'))
     if result.json().get("records", 0) == 0:
         return pd.DataFrame()
     columns = [dct["name"] for dct in result.json()["schema"]["properties"]]
@@ -593,9 +437,12 @@ def set_alpha_properties(
         combo_desc: str = "322222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222222",
         description: str = 'None',
         tags=['c1'],
+        defer: bool = False,
 ):
     """
     Function changes alpha's description parameters
+
+    defer=True 时只把请求体交给后台 property_writer 合并发送，立即返回 None
     """
 
     if tags is None:
@@ -610,13 +457,19 @@ def set_alpha_properties(
         "selection": {"description": selection_desc},
     }
 
+    if defer:
+        property_writer.enqueue(alpha_id, params)
+        return None
+
     # 处理Retry-After头
     while True:
-        response = s.patch(
-            "https://api.worldquantbrain.com/alphas/" + alpha_id, json=params
+        response = paced_request(
+            s, 'PATCH', API_URL + "/alphas/" + alpha_id, json=params
         )
+        if response.status_code == 429:
+            continue
         if "retry-after" in response.headers:
-            time.sleep(float(response.headers["Retry-After"]))
+            metrics.sleep(float(response.headers["Retry-After"]), 'retry_after')
         else:
             break
 
@@ -627,122 +480,39 @@ def set_alpha_properties(
     return response
 
 
-def check_submission(alpha_bag, gold_bag, start):
-    depot = []
+def check_submission(alpha_bag, gold_bag, start, concurrency=10):
+    """并发检查 alpha_bag[start:]，通过的 (alpha_id, PROD_CORRELATION) 追加到 gold_bag"""
     s = sign_in(cfg.username, cfg.password)
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
-            continue
-        if idx % 5 == 0:
-            print(idx)
-        if idx % 200 == 0:
-            s = sign_in(cfg.username, cfg.password)
-        # print(idx)
-        pc = get_check_submission(s, g)
-        if pc == "sleep":
-            time.sleep(100)
-            s = sign_in(cfg.username, cfg.password)
-            alpha_bag.append(g)
-        elif pc != pc:
-            # pc is nan
-            print("check self-corrlation error")
-            time.sleep(100)
-            alpha_bag.append(g)
-        elif pc == "fail":
-            continue
-        elif pc == "error":
-            depot.append(g)
-        else:
-            # print('g')
-            # print(g)
-            gold_bag.append((g, pc))
-    # print('depot')
-    # print(depot)
+    outcomes = check_alphas(s, alpha_bag[start:], concurrency=concurrency,
+                            relogin=lambda: refresh_session(s))
+    for outcome in outcomes:
+        if outcome.ok:
+            gold_bag.append((outcome.alpha_id, outcome.pc))
     return gold_bag
 
 
 def get_check_submission(s, alpha_id, max_retries=3):
     """
-    获取alpha的提交检查结果，包含重试逻辑
+    获取alpha的提交检查结果（单个 alpha，走 check_pipeline）
 
     Args:
         s: session对象
         alpha_id: alpha ID
-        max_retries: 最大重试次数，默认3次
+        max_retries: 最大检查次数，默认3次
 
     Returns:
         pc: PROD_CORRELATION值（成功）
         "fail": 检查失败
         "sleep": 登出状态
-        "error": 错误（重试失败后）
+        "error": 错误（重试失败后或超时）
     """
-    for attempt in range(max_retries):
-        try:
-            # 获取检查结果（带重试等待）
-            while True:
-                result = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/check")
-                if "retry-after" in result.headers:
-                    time.sleep(float(result.headers["Retry-After"]))
-                else:
-                    break
-
-            # 检查是否登出
-            if result.json().get("is", 0) == 0:
-                print(f"   ⚠️  {alpha_id}: logged out")
-                return "sleep"
-
-            # 解析检查结果
-            checks_df = pd.DataFrame(
-                result.json()["is"]["checks"]
-            )
-
-            # 获取PROD_CORRELATION值
-            pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
-            if len(pc_rows) == 0:
-                raise ValueError("PROD_CORRELATION field not found in checks")
-
-            pc = pc_rows["value"].values[0]
-
-            # 检查是否有FAIL结果
-            if not any(checks_df["result"] == "FAIL"):
-                print(f"   ✅ {alpha_id}: PC={pc}")
-                return pc
-            else:
-                print(f"   ❌ {alpha_id}: 检查失败 (PC={pc})")
-                return "fail"
-
-        except KeyError as e:
-            # 数据结构错误
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): 字段缺失 {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # 指数退避：1秒、2秒、4秒
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error"
-
-        except ValueError as e:
-            # PROD_CORRELATION字段不存在
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error"
-
-        except Exception as e:
-            # 其他未知错误
-            error_type = type(e).__name__
-            print(f"   ⚠️  catch {alpha_id} (尝试 {attempt + 1}/{max_retries}): {error_type} - {str(e)[:50]}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                print(f"   🔄 等待 {2 ** attempt} 秒后重试...")
-            else:
-                print(f"   ❌ {alpha_id}: 重试失败，返回error")
-                return "error"
-
-    # 理论上不会到这里
+    outcome = CheckPipeline(s, max_attempts=max_retries, backoff=1).run([alpha_id])[0]
+    if outcome.ok:
+        return outcome.pc
+    if outcome.status == LOGGED_OUT:
+        return "sleep"
+    if outcome.status == FAIL:
+        return "fail"
     return "error"
 
 
@@ -752,118 +522,70 @@ def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_
     s = sign_in(cfg.username, cfg.password)
     output = []
     count = 0
+    started = time.time()
 
-    for i in range(0, alpha_num, 40):
-        offset_start = time.time()
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 地区 {region} API请求，offset={i}")
-
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2026-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2026-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(
-            sharpe_th) + "&settings.region=" + region + "&is.color!=RED&is.color!=YELLOW" + "&order=-is.sharpe&hidden=false&type=SUPER"
-
-        urls = [url_e]
-
-        for url in urls:  # 修复缩进，确保这个循环正确执行
-            req_start = time.time()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 发送API请求到: {url}")  # 打印完整URL
-
-            try:
-                # 添加超时30秒，避免无限挂起；如果需要重试机制，可以用wait_get替换
-                response = s.get(url, timeout=30)
-                req_time = time.time() - req_start
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API响应状态: {response.status_code}，响应时间: {req_time:.2f}秒")
-
-                if response.status_code != 200:
-                    print(
-                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API错误 {response.status_code}: {response.text[:200]}")  # 只打印前200字符错误信息
-                    # 如果非200，尝试重登录
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 尝试重新登录...")
-                    s = sign_in(cfg.username, cfg.password)
-                    continue  # 重试这个请求
-
-                # 检查Retry-After头，如果有等待时间
-                retry_after = response.headers.get("Retry-After", 0)
-                if int(retry_after) > 0:
-                    wait_time = int(retry_after)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API要求等待 {wait_time} 秒...")
-                    time.sleep(wait_time)
-
-                alpha_list = response.json()["results"]
-                offset_count = len(alpha_list)
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 获取到 {offset_count} 个alpha，总计数: {count + offset_count}")
-
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-
-                    # SUPER类型的alpha使用combo代码，REGULAR类型使用regular代码
-                    if 'combo' in alpha_list[j] and alpha_list[j]['combo']:
-                        exp = alpha_list[j]['combo'].get('code', 'SUPER_ALPHA')
-                    elif 'regular' in alpha_list[j] and alpha_list[j]['regular']:
-                        exp = alpha_list[j]['regular'].get('code', 'REGULAR_ALPHA')
-                    else:
-                        exp = 'UNKNOWN'
-
-                    count += 1
-
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s" % exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(
-                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 添加alpha {alpha_id} (Sharpe: {sharpe:.3f})")
-
-                        if turnover > 0.7:
-                            rec.append(decay * 4)
-                        elif turnover > 0.6:
-                            rec.append(decay * 3 + 3)
-                        elif turnover > 0.5:
-                            rec.append(decay * 3)
-                        elif turnover > 0.4:
-                            rec.append(decay * 2)
-                        elif turnover > 0.35:
-                            rec.append(decay + 4)
-                        elif turnover > 0.3:
-                            rec.append(decay + 2)
-                        output.append(rec)
-
-                offset_time = time.time() - offset_start
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 处理完成，耗时: {offset_time:.2f}秒")
-
-            except requests.exceptions.Timeout:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求超时 (30秒)，offset={i}，跳过")
-                continue
-            except requests.exceptions.RequestException as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求异常: {e}，offset={i}")
-                # 尝试重登录
-                try:
-                    s = sign_in(cfg.username, cfg.password)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录成功，继续")
-                except Exception as login_e:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录失败: {login_e}，跳过此offset")
-                continue
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] JSON解析或其他错误: {e}")
-                # 原有重登录逻辑
-                s = sign_in(cfg.username, cfg.password)
-                continue
+    # 候选从本地 alpha 目录筛选：先增量同步（只翻上次之后有改动的 alpha），再走本地索引查询
+    created_from = "2026-" + start_date + "T00:00:00-04:00"
+    catalog = AlphaCatalog()
+    try:
+        try:
+            catalog.sync(s, since=created_from)
+        except requests.exceptions.RequestException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] alpha目录同步失败，使用本地已有数据: {e}")
+        alpha_list = catalog.select(
+            region=region, super_alpha=True, exclude_colors=('RED', 'YELLOW'),
+            min_sharpe=sharpe_th, min_fitness=fitness_th,
+            created_from=created_from, created_to="2026-" + end_date + "T00:00:00-04:00",
+            limit=alpha_num)
+    finally:
+        catalog.close()
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 地区 {region} 本地筛选到 {len(alpha_list)} 个alpha")
+
+    for j in range(len(alpha_list)):
+        alpha_id = alpha_list[j]["id"]
+        name = alpha_list[j]["name"]
+        dateCreated = alpha_list[j]["dateCreated"]
+        sharpe = alpha_list[j]["is"]["sharpe"]
+        fitness = alpha_list[j]["is"]["fitness"]
+        turnover = alpha_list[j]["is"]["turnover"]
+        margin = alpha_list[j]["is"]["margin"]
+        longCount = alpha_list[j]["is"]["longCount"]
+        shortCount = alpha_list[j]["is"]["shortCount"]
+        decay = alpha_list[j]["settings"]["decay"]
+
+        # SUPER类型的alpha使用combo代码，REGULAR类型使用regular代码
+        if 'combo' in alpha_list[j] and alpha_list[j]['combo']:
+            exp = alpha_list[j]['combo'].get('code', 'SUPER_ALPHA')
+        elif 'regular' in alpha_list[j] and alpha_list[j]['regular']:
+            exp = alpha_list[j]['regular'].get('code', 'REGULAR_ALPHA')
+        else:
+            exp = 'UNKNOWN'
+
+        count += 1
+
+        if (longCount + shortCount) > 100:
+            if sharpe < -sharpe_th:
+                exp = "-%s" % exp
+            rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
+            print(
+                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 添加alpha {alpha_id} (Sharpe: {sharpe:.3f})")
+
+            if turnover > 0.7:
+                rec.append(decay * 4)
+            elif turnover > 0.6:
+                rec.append(decay * 3 + 3)
+            elif turnover > 0.5:
+                rec.append(decay * 3)
+            elif turnover > 0.4:
+                rec.append(decay * 2)
+            elif turnover > 0.35:
+                rec.append(decay + 4)
+            elif turnover > 0.3:
+                rec.append(decay + 2)
+            output.append(rec)
 
-    total_time = time.time() - offset_start  # 注意：这里offset_start是最后一个循环的，实际应从函数开始计算
     print(
-        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，总计数: {count}，输出: {len(output)}，总耗时约: {total_time:.2f}秒 (估算)")
+        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，总计数: {count}，输出: {len(output)}，总耗时: {time.time() - started:.2f}秒")
     return output
 
 
@@ -996,6 +718,8 @@ def get_date_range_from_user():
 
 
 sess = sign_in(cfg.username, cfg.password)
+# 颜色/标签等属性修改交给后台合并发送，候选循环不再被 PATCH 阻塞
+property_writer = PropertyWriter(sess, relogin=lambda: refresh_session(sess))
 
 # 在循环开始前获取日期范围设置
 print("\n" + "🎯" * 40)
@@ -1013,6 +737,7 @@ while True:
 
     # 每轮开始时更新数据
     download_data(flag_increment=True)
+    os_alpha_ids, os_alpha_rets = load_data()
 
     # 如果是滚动窗口模式，每轮更新日期范围
     if rolling_window and isinstance(rolling_window, int):
@@ -1043,6 +768,10 @@ while True:
         gold_bag = []
         prod_corr_dict = {}  # 存储每个alpha的生产相关性值
 
+        # 生产相关性按各 alpha 的下次轮询时间统一调度，每个 alpha 独立计10分钟
+        prod_corr_service = ProdCorrService(sess)
+        prod_corr_futures = {}
+
         # 检查是否有fail
         for idx, alpha_id in enumerate(alpha_ids, 1):
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -1050,7 +779,6 @@ while True:
                 result_fail = get_simulation_result_json(sess, alpha_id)
                 if result_fail and "FAIL" not in str(result_fail).upper():
                     print(f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 不包含 FAIL，继续")
-                    os_alpha_ids, os_alpha_rets = load_data()
                     self_corr = calc_self_corr(
                         alpha_id=alpha_id,
                         os_alpha_rets=os_alpha_rets,
@@ -1059,81 +787,8 @@ while True:
                     if self_corr < 0.7:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 符合条件")
-                        # 直接调用 API 获取生产相关性
-                        try:
-                            # 记录开始时间，用于超时检查
-                            start_time = time.time()
-                            timeout_seconds = 600  # 10分钟 = 600秒
-                            
-                            while True:
-                                # 检查是否超时
-                                elapsed_time = time.time() - start_time
-                                if elapsed_time > timeout_seconds:
-                                    raise TimeoutError(f"获取生产相关性超时（超过{timeout_seconds}秒）")
-                                
-                                response = sess.get(
-                                    "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod"
-                                )
-                                if "retry-after" in response.headers:
-                                    retry_after = float(response.headers["Retry-After"])
-                                    # 检查等待后是否会超时
-                                    if elapsed_time + retry_after > timeout_seconds:
-                                        raise TimeoutError(f"获取生产相关性超时（等待Retry-After后超过{timeout_seconds}秒）")
-                                    time.sleep(retry_after)
-                                else:
-                                    break
-
-                            # 从 JSON 响应中直接获取 max 值
-                            prod_corr_data = response.json()
-                            prod_corr_value = prod_corr_data.get('max', None)
-
-                            # print(f"生产相关性响应: {prod_corr_data}")
-
-                            if prod_corr_value is not None and float(prod_corr_value) < 0.7:
-                                print(
-                                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
-                                alpha_bag.append(alpha_id)
-                                prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
-                            else:
-                                print(
-                                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
-                                # 标记为黄色，name里写上时间和生产相关性
-                                try:
-                                    current_time_name = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    prod_corr_str = f"{float(prod_corr_value):.3f}" if prod_corr_value is not None else "None"
-                                    alpha_name = f"{current_time_name}_{prod_corr_str}"  # 格式：20250127_123456_0.750
-                                    set_alpha_properties(sess, alpha_id,
-                                                        name=alpha_name,
-                                                        color='YELLOW',
-                                                        tags=['prod_corr_fail'])
-                                    print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 生产相关性 {prod_corr_str} 不符合条件, Name: {alpha_name})")
-                                except Exception as tag_e:
-                                    print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
-
-                        except TimeoutError as e:
-                            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            print(
-                                f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性超时: {str(e)[:50]}")
-                            # 标记为黄色，tag记录超时原因
-                            try:
-                                set_alpha_properties(sess, alpha_id,
-                                                    color='YELLOW',
-                                                    tags=['prod_corr_timeout'])
-                                print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 获取生产相关性超时)")
-                            except Exception as tag_e:
-                                print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
-                        except Exception as e:
-                            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            print(
-                                f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {str(e)[:50]}")
-                            # 标记为黄色，tag记录原因
-                            try:
-                                set_alpha_properties(sess, alpha_id,
-                                                    color='YELLOW',
-                                                    tags=['prod_corr_error'])
-                                print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 获取生产相关性失败)")
-                            except Exception as tag_e:
-                                print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
+                        # 生产相关性交给后台轮询服务，其余候选继续做自相关检查，不再逐个阻塞等待
+                        prod_corr_futures[alpha_id] = (idx, prod_corr_service.submit(alpha_id))
                     else:
                         print(
                             f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 自相关性: {self_corr} 不符合条件")
@@ -1142,7 +797,7 @@ while True:
                             tag_name = f"self_corr_{self_corr:.2f}"  # 格式：self_corr_0.75
                             set_alpha_properties(sess, alpha_id,
                                                 color='YELLOW',
-                                                tags=[tag_name])
+                                                tags=[tag_name], defer=True)
                             print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 自相关性 {self_corr:.3f} 不符合条件)")
                         except Exception as tag_e:
                             print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
@@ -1155,7 +810,7 @@ while True:
                         set_alpha_properties(sess, alpha_id,
                                             name=alpha_name,
                                             color='YELLOW',
-                                            tags=['has_fail'])
+                                            tags=['has_fail'], defer=True)
                         print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 包含FAIL, Name: {alpha_name})")
                     except Exception as tag_e:
                         print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
@@ -1166,6 +821,59 @@ while True:
                     f"[{current_time}] [{idx}/{len(alpha_ids)}] ❌ 处理 alpha_id: {alpha_id} 时出错: {type(e).__name__} - {str(e)[:100]}")
                 continue
 
+        # 按完成先后处理生产相关性结果
+        future_index = {future: (idx, alpha_id) for alpha_id, (idx, future) in prod_corr_futures.items()}
+        for future in as_completed(future_index):
+            idx, alpha_id = future_index[future]
+            prod_corr_result = future.result()
+            prod_corr_value = prod_corr_result.value
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if prod_corr_result.status == 'timeout':
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性超时（超过{prod_corr_service.max_wait}秒）")
+                # 标记为黄色，tag记录超时原因
+                try:
+                    set_alpha_properties(sess, alpha_id,
+                                        color='YELLOW',
+                                        tags=['prod_corr_timeout'], defer=True)
+                    print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 获取生产相关性超时)")
+                except Exception as tag_e:
+                    print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
+            elif prod_corr_result.status == 'error':
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 获取生产相关性失败: {str(prod_corr_result.error)[:50]}")
+                # 标记为黄色，tag记录原因
+                try:
+                    set_alpha_properties(sess, alpha_id,
+                                        color='YELLOW',
+                                        tags=['prod_corr_error'], defer=True)
+                    print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 获取生产相关性失败)")
+                except Exception as tag_e:
+                    print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
+            elif prod_corr_value is not None and float(prod_corr_value) < 0.7:
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 符合条件")
+                alpha_bag.append(alpha_id)
+                prod_corr_dict[alpha_id] = prod_corr_value  # 保存生产相关性值
+            else:
+                print(
+                    f"[{current_time}] [{idx}/{len(alpha_ids)}] alpha_id: {alpha_id} 生产相关性: {prod_corr_value} 不符合条件")
+                # 标记为黄色，name里写上时间和生产相关性
+                try:
+                    current_time_name = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    prod_corr_str = f"{float(prod_corr_value):.3f}" if prod_corr_value is not None else "None"
+                    alpha_name = f"{current_time_name}_{prod_corr_str}"  # 格式：20250127_123456_0.750
+                    set_alpha_properties(sess, alpha_id,
+                                        name=alpha_name,
+                                        color='YELLOW',
+                                        tags=['prod_corr_fail'], defer=True)
+                    print(f"   🟡 {alpha_id[:8]}... → YELLOW (原因: 生产相关性 {prod_corr_str} 不符合条件, Name: {alpha_name})")
+                except Exception as tag_e:
+                    print(f"   ⚠️  标记YELLOW失败 {alpha_id[:8]}...: {str(tag_e)[:50]}")
+        prod_corr_service.close()
+        print(f"   📊 [ProdCorr] {prod_corr_service.stats}")
+
+
         print("添加描述")
         project_spec = "Idea: 111111111111111\n" + \
                        "Rationale for data used: 11111111111111\n" + \
@@ -1174,7 +882,9 @@ while True:
         s_d = "1Short descriptions of your Selection Expression and Combo Expression are required to submit this SuperAlpha."
 
         for alpha_id in alpha_bag:
-            set_alpha_properties(sess, alpha_id, description=project_spec)
+            set_alpha_properties(sess, alpha_id, description=project_spec, defer=True)
+        # 提交检查前确保描述和本轮标记都已写到服务器
+        property_writer.flush()
         print("添加描述完成")
 
         print("提交检查")
@@ -1205,15 +915,15 @@ while True:
                     # 使用同一时间戳 + 生产相关性作为name
                     alpha_name = f"{current_time_name}_{prod_corr_value:.3f}"  # 格式：20250127_123456_0.350
 
-                    response = set_alpha_properties(sess, alpha,
-                                                    name=alpha_name,
-                                                    description=project_spec,
-                                                    combo_desc=c_d,
-                                                    color='YELLOW',
-                                                    selection_desc=s_d,
-                                                    tags=['c1'])  # 设置tags参数
+                    set_alpha_properties(sess, alpha,
+                                         name=alpha_name,
+                                         description=project_spec,
+                                         combo_desc=c_d,
+                                         color='YELLOW',
+                                         selection_desc=s_d,
+                                         tags=['c1'], defer=True)  # 设置tags参数
                     yellow_success_count += 1
-                    print(f"   🟡 {alpha[:8]}... → YELLOW (状态: {response.status_code})")
+                    print(f"   🟡 {alpha[:8]}... → YELLOW (已排队)")
                 except Exception as e:
                     yellow_fail_count += 1
                     error_msg = str(e)
@@ -1265,19 +975,19 @@ while True:
                 alpha_name = f"{current_time_name}_{prod_corr_value:.3f}"  # 格式：20250129_143020_0.350
 
                 # ✅ 设置为GREEN色
-                response = set_alpha_properties(sess, alpha,
-                                                name=alpha_name,
-                                                description=project_spec,
-                                                combo_desc=c_d,
-                                                selection_desc=s_d,
-                                                color='GREEN',  # ✅ 确保是GREEN
-                                                tags=[tag_name])
+                set_alpha_properties(sess, alpha,
+                                     name=alpha_name,
+                                     description=project_spec,
+                                     combo_desc=c_d,
+                                     selection_desc=s_d,
+                                     color='GREEN',  # ✅ 确保是GREEN
+                                     tags=[tag_name], defer=True)
                 green_success_count += 1
 
                 # 打印前5个确认信息
                 if green_success_count <= 5:
                     print(
-                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (状态: {response.status_code})")
+                        f"   ✅ {alpha[:8]}... → GREEN | Name: {alpha_name} | Tag: {tag_name} (已排队)")
 
             except Exception as e:
                 green_fail_count += 1
@@ -1291,6 +1001,7 @@ while True:
 
         print(f"   🟢 GREEN标记完成: 成功 {green_success_count}/{len(alpha_lis)}，失败 {green_fail_count}")
 
+        property_writer.flush()
         print(f"\n✅ 地区 {region} 完成: 通过 {len(alpha_lis)} 个，失败 {len(failed_alphas)} 个")
         print("=" * 60)
 
@@ -1303,4 +1014,4 @@ while True:
     wait_minutes = 240
     print(f"\n⏰ 等待 {wait_minutes} 分钟后开始下一轮...")
     print(f"   下一轮预计开始时间: {(datetime.now() + timedelta(minutes=wait_minutes)).strftime('%Y-%m-%d %H:%M:%S')}")
-    time.sleep(wait_minutes * 60)
+    metrics.sleep(wait_minutes * 60, 'round_wait')
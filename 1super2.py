@@ -22,6 +22,9 @@ from requests.auth import HTTPBasicAuth
 import logging
 from pathlib import Path
 import getpass  # 用于安全输入密码
+from account_pool import get_account_pool
+from metrics import metrics
+from session_pool import AuthenticationError, get_session, refresh_session
 import builtins
 
 
@@ -383,37 +386,8 @@ simple_selections = []
 #     return session
 
 def relogin(username: str, password: str):
-    """重新登录并保存cookie"""
-
-    session = requests.Session()
-
-    session.auth = (username, password)
-
-    while True:
-
-        try:
-
-            response = session.post("https://api.worldquantbrain.com/authentication")
-
-            response.raise_for_status()
-
-            print("登录成功, cookie文件更新")
-
-            session.cookies = response.cookies
-
-            cookie_path = os.path.join(os.path.dirname(__file__), "cookie.json")
-
-            with open(cookie_path, "w") as f:
-
-                json.dump(requests.utils.dict_from_cookiejar(response.cookies), f)
-
-            return session
-
-        except requests.exceptions.RequestException as e:
-
-            print("登录失败，等待10s后再次尝试登录")
-
-            time.sleep(10)
+    """强制重新认证（由 session_pool 统一处理），返回共享的 Session"""
+    return refresh_session(get_session(username, password))
 
 
 def get_simple_selection():
@@ -590,8 +564,8 @@ def get_combo_code_list():
 
 
 class cfg:
-    # 从当前目录下的 brain.txt 文件读取账号密码
-    brain_file = os.path.join(os.path.dirname(__file__), 'brain.txt')
+    # 从当前目录下的 brain.txt 文件读取账号密码（环境变量 BRAIN_CREDENTIALS 可指定其他路径）
+    brain_file = os.environ.get('BRAIN_CREDENTIALS') or os.path.join(os.path.dirname(__file__), 'brain.txt')
     
     # 检查文件是否存在
     if not os.path.exists(brain_file):
@@ -626,123 +600,19 @@ class cfg:
     data_path = Path('.')
 
 
-def sign_in(username, password, max_retries=5):
-    """登录WorldQuant BRAIN平台，带重试机制"""
-    last_error_type = None
-    last_status_code = None
-
-    for attempt in range(max_retries):
-        try:
-            s = requests.Session()
-            s.auth = (username, password)
-            response = s.post('https://api.worldquantbrain.com/authentication', timeout=30)
-
-            last_status_code = response.status_code
-
-            if response.status_code in [200, 201]:
-                print(f"✅ 登录成功 (状态码: {response.status_code}, 尝试 {attempt + 1}/{max_retries})")
-                logging.info(f"Successfully signed in with status code {response.status_code}")
-                return s
-
-            elif response.status_code in [401, 403]:
-                last_error_type = "认证错误"
-                print(f"❌ 登录失败：认证信息错误 (状态码: {response.status_code})")
-                print(f"   📧 账号: {username}")
-                print(f"   🔑 请检查账号密码是否正确")
-                print(f"   💡 提示: 如果密码包含特殊字符，请确认是否正确转义")
-                # 认证错误不需要重试，直接返回
-                return None
-
-            elif response.status_code == 429:
-                last_error_type = "限流"
-                # 特殊处理429限流错误
-                retry_after = response.headers.get('Retry-After')
-                if retry_after:
-                    wait_time = int(retry_after)
-                else:
-                    # 如果没有Retry-After，使用更长的等待时间
-                    wait_time = 60 * (attempt + 1)  # 60秒, 120秒, 180秒...
-
-                print(f"🚦 登录受限：请求过于频繁 (429) (尝试 {attempt + 1}/{max_retries})")
-
-                if attempt < max_retries - 1:
-                    print(f"   ⏰ 等待 {wait_time} 秒后重试...")
-                    print(f"   💡 建议：减少登录频率，避免频繁请求")
-                    time.sleep(wait_time)
-                else:
-                    print(f"   ❌ 已达到最大重试次数")
-                    print(f"   ⏰ 请稍后再试（建议等待5-10分钟）")
-                    print(f"   💡 原因: API限流保护，频繁登录被暂时限制")
-
-            else:
-                last_error_type = "HTTP错误"
-                print(f"⚠️ 登录失败：HTTP {response.status_code} (尝试 {attempt + 1}/{max_retries})")
-                print(f"   响应内容: {response.text[:200]}")
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"   ⏰ 等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-
-        except requests.exceptions.Timeout:
-            last_error_type = "超时"
-            print(f"⏰ 登录超时 (30秒) (尝试 {attempt + 1}/{max_retries})")
-            print(f"   💡 可能原因: 网络连接慢或服务器响应慢")
-            if attempt < max_retries - 1:
-                wait_time = 10
-                print(f"   ⏰ 等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-
-        except requests.exceptions.ConnectionError as e:
-            last_error_type = "连接错误"
-            print(f"🌐 连接失败: {e} (尝试 {attempt + 1}/{max_retries})")
-            print(f"   💡 可能原因: 网络断开或无法访问API服务器")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"   ⏰ 等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-
-        except requests.exceptions.RequestException as e:
-            last_error_type = "网络异常"
-            print(f"❌ 登录异常: {e} (尝试 {attempt + 1}/{max_retries})")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                print(f"   ⏰ 等待 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-
-    # 最终失败总结
-    logging.error(
-        f"Login failed after {max_retries} attempts. Last error: {last_error_type}, Status: {last_status_code}")
-    print(f"\n{'=' * 60}")
-    print(f"❌ 登录失败：已达到最大重试次数 ({max_retries})")
-    print(f"{'=' * 60}")
-    print(f"📊 失败原因分析:")
-    print(f"   • 错误类型: {last_error_type or '未知'}")
-    print(f"   • HTTP状态码: {last_status_code or 'N/A'}")
-    print(f"   • 账号: {username}")
-
-    if last_error_type == "认证错误":
-        print(f"\n💡 解决方案:")
-        print(f"   1. 检查账号密码是否正确")
-        print(f"   2. 确认密码中特殊字符是否正确输入")
-        print(f"   3. 尝试在浏览器中登录平台验证账号")
-    elif last_error_type == "限流":
-        print(f"\n💡 解决方案:")
-        print(f"   1. 等待5-10分钟后重试")
-        print(f"   2. 减少登录频率，避免频繁请求")
-        print(f"   3. 检查是否有其他程序也在使用相同账号")
-    elif last_error_type in ["超时", "连接错误", "网络异常"]:
-        print(f"\n💡 解决方案:")
-        print(f"   1. 检查网络连接是否正常")
-        print(f"   2. 检查防火墙/代理设置")
-        print(f"   3. 尝试使用VPN或更换网络")
-    else:
-        print(f"\n💡 建议:")
-        print(f"   1. 等待几分钟后重新运行脚本")
-        print(f"   2. 检查WorldQuant BRAIN平台是否正常")
-        print(f"   3. 查看错误日志获取更多信息")
+def sign_in(username, password):
+    """
+    登录WorldQuant BRAIN平台。
 
-    print(f"{'=' * 60}\n")
-    return None
+    返回 session_pool 中该账号共享的 Session：进程内只认证一次，429/网络错误的重试、
+    令牌过期前的重新认证和 401 时的重新认证都由池统一处理。
+    """
+    try:
+        return get_session(username, password)
+    except AuthenticationError as e:
+        logging.error(f"Login failed: {e}")
+        print(f"❌ {e}")
+        return None
 
 
 def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_limits, selection_handling_options):
@@ -752,30 +622,54 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
     保持并发数恒定，通过进度监控动态提交新任务
 
+    配置了多个账号（accounts.json，见 account_pool）时每个账号各有 3 个并发槽位（或 accounts.json 中的 concurrency），
+    新任务交给空闲槽位最多的账号，状态检查由提交它的账号发出
+
     """
 
     global s
 
-    print(f"🔐 正在登录 WorldQuant BRAIN 平台...")
-    s = sign_in(cfg.username, cfg.password)
-
-    if s is None:
-        print("❌ 登录失败，无法继续执行模拟")
-        raise Exception("登录失败，请检查账号密码")
+    accounts = get_account_pool()
+    print(f"🔐 正在登录 WorldQuant BRAIN 平台... ({len(accounts)} 个账号)")
+    for account in accounts:
+        try:
+            account.session
+        except AuthenticationError as e:
+            print(f"❌ {e}")
+            print("❌ 登录失败，无法继续执行模拟")
+            raise Exception("登录失败，请检查账号密码")
+    s = accounts.default.session
+    slots = {account.username: account.concurrency or 3 for account in accounts}
 
-    brain_api_url = 'https://api.worldquantbrain.com'
+    brain_api_url = API_URL
 
     all_sa_pairs = alpha_pools[0]
 
     total_tasks = len(all_sa_pairs)
 
-    print(f'📊 总任务数: {total_tasks}, 开始位置: {start}, 并发限制: 3')
+    print(f'📊 总任务数: {total_tasks}, 开始位置: {start}, 并发限制: {sum(slots.values())}')
 
-    task_queue = all_sa_pairs[start:]
+    # 任务先写入持久化队列，任务编号即队列id；中断后重新运行会挂接上次已提交的进度URL
+    sim_queue = SimQueue()
+    batch = 'SUPER/%s/%s/%s' % (region, universe, neut)
+    sim_queue.enqueue(batch, (
+        generate_sim_data_sa([task_data], region, universe, neut, selection_limits, selection_handling_options)[0]
+        for task_data in all_sa_pairs[start:]
+    ))
+    print(f'📦 队列 {batch}: {sim_queue.counts(batch)}')
+    task_queue = sim_queue.pending(batch)
+    queue_exhausted = False
 
     active_tasks = {}  # {task_index: progress_url}
+    task_accounts = {}  # {task_index: Account} - 提交该任务的账号，状态检查必须用它
     task_check_counts = {}  # {task_index: check_count} - 记录每个任务的检查次数
     task_start_times = {}  # {task_index: start_time} - 记录每个任务的开始时间
+    for task_index, progress_url, _, username in sim_queue.in_flight(batch):
+        print(f"🔁 挂接上次在途任务{task_index}: {progress_url}")
+        active_tasks[task_index] = progress_url
+        task_accounts[task_index] = accounts.get(username)
+        task_check_counts[task_index] = 0
+        task_start_times[task_index] = time.time()
     max_task_duration = 3600  # 最大任务时长（秒），30分钟 = 1800秒，这里设为1小时
     max_check_count = 240  # 最大检查次数（15秒一次，240次 = 1小时）
 
@@ -801,8 +695,8 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
         rate_limit_log[key] = entry
         return False
 
-    def submit_simulation(task_index, task_data):
-        global s  # 必须在函数开头声明global
+    def submit_simulation(task_index, sim_data, account):
+        s = account.session
 
         max_retries = 5
 
@@ -812,39 +706,23 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
             try:
 
-                sim_data_list = generate_sim_data_sa([task_data], region, universe, neut, selection_limits,
-                                                     selection_handling_options)
-
-                sim_data = sim_data_list[0]
-
-                simulation_response = s.post('https://api.worldquantbrain.com/simulations', json=sim_data)
+                simulation_response = paced_request(s, 'POST', API_URL + '/simulations', json=sim_data)
 
                 # 检查认证错误
                 if simulation_response.status_code in [401, 403]:
                     print(f"🔐 任务{task_index} 认证失败，重新登录...")
-                    s = sign_in(cfg.username, cfg.password)
+                    s = sign_in(account.username, account.password)
                     if s is None:
                         print(f"❌ 任务{task_index} 重新登录失败")
                         return None
                     # 重新提交
-                    simulation_response = s.post('https://api.worldquantbrain.com/simulations', json=sim_data)
+                    simulation_response = paced_request(s, 'POST', API_URL + '/simulations', json=sim_data)
 
                 if simulation_response.status_code == 429:
 
                     if attempt < max_retries - 1:
 
-                        retry_after = simulation_response.headers.get('Retry-After')
-
-                        if retry_after:
-
-                            delay = int(retry_after)
-
-                        else:
-
-                            delay = base_delay * (2 ** attempt)
-
-                        time.sleep(delay)
-
+                        # 限速器已按 Retry-After 暂停提交类接口，下一次提交会自动等待
                         continue
 
                     else:
@@ -870,7 +748,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                 if progress_url:
                     full_progress_url = progress_url if progress_url.startswith(
                         'http') else f"{brain_api_url}{progress_url}"
-                    ui_progress_url = full_progress_url.replace('https://api.worldquantbrain.com',
+                    ui_progress_url = full_progress_url.replace(API_URL,
                                                                 'https://platform.worldquantbrain.com')
 
                     print(f"✅ 任务{task_index} 已提交: {full_progress_url}")
@@ -892,7 +770,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
                     print(f"❌ 任务{task_index} 提交异常: {e}，{delay}秒后重试 ({attempt + 1}/{max_retries})")
 
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'backoff')
 
                     continue
 
@@ -904,8 +782,8 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
         return None
 
-    def check_simulation_status(task_index, progress_url):
-        global s  # 必须在函数开头声明global
+    def check_simulation_status(task_index, progress_url, account):
+        s = account.session
 
         max_retries = 3
 
@@ -917,7 +795,9 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
             try:
                 # 处理Retry-After头
                 while True:
-                    response = s.get(progress_url, timeout=base_timeout)
+                    response = paced_request(s, 'GET', progress_url, timeout=base_timeout)
+                    if response.status_code == 429:
+                        continue  # 限速器已暂停轮询类接口，下一次请求会自动等待
 
                     # 检查Retry-After头
                     if "retry-after" in response.headers or "Retry-After" in response.headers:
@@ -926,27 +806,29 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                         if retry_after > 0:
                             message = f"   ⏰ 任务{task_index} API限流，等待 {retry_after:.1f} 秒..."
                             log_with_throttle((task_index, "status_rate_limit"), message, once=True)
-                            time.sleep(retry_after)
+                            metrics.sleep(retry_after, 'retry_after')
                             continue  # 继续重试同一个请求
                     break  # 没有Retry-After，退出循环
 
                 # 检查认证错误
                 if response.status_code in [401, 403]:
                     print(f"🔐 任务{task_index} 状态检查认证失败，重新登录...")
-                    s = sign_in(cfg.username, cfg.password)
+                    s = sign_in(account.username, account.password)
                     if s is None:
                         print(f"❌ 任务{task_index} 重新登录失败")
                         return "ERROR"
                     # 重新检查（也需要处理Retry-After）
                     while True:
-                        response = s.get(progress_url, timeout=base_timeout)
+                        response = paced_request(s, 'GET', progress_url, timeout=base_timeout)
+                        if response.status_code == 429:
+                            continue
                         if "retry-after" in response.headers or "Retry-After" in response.headers:
                             retry_after = float(
                                 response.headers.get("retry-after") or response.headers.get("Retry-After", 0))
                             if retry_after > 0:
                                 message = f"   ⏰ 任务{task_index} API限流，等待 {retry_after:.1f} 秒..."
                                 log_with_throttle((task_index, "status_rate_limit"), message, once=True)
-                                time.sleep(retry_after)
+                                metrics.sleep(retry_after, 'retry_after')
                                 continue
                         break
 
@@ -958,7 +840,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
                         print(f"⏳ 任务{task_index} 504超时，{delay}秒后重试 ({attempt + 1}/{max_retries})")
 
-                        time.sleep(delay)
+                        metrics.sleep(delay, 'backoff')
 
                         continue
 
@@ -1062,7 +944,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                     delay = base_delay * (2 ** attempt)
                     print(
                         f"⏰ 任务{task_index} 请求超时 ({base_timeout}秒)，{delay}秒后重试 ({attempt + 1}/{max_retries})")
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'backoff')
                     continue
                 else:
                     print(f"❌ 任务{task_index} 请求超时，已达到最大重试次数")
@@ -1072,7 +954,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                 if attempt < max_retries - 1:
                     delay = base_delay * (2 ** attempt)
                     print(f"❌ 任务{task_index} 网络异常: {e}，{delay}秒后重试 ({attempt + 1}/{max_retries})")
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'backoff')
                     continue
                 else:
                     print(f"❌ 任务{task_index} 网络异常，已达到最大重试次数: {e}")
@@ -1086,7 +968,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
                     print(f"❌ 任务{task_index} 异常: {e}，{delay}秒后重试 ({attempt + 1}/{max_retries})")
 
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'backoff')
 
                     continue
 
@@ -1098,23 +980,35 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
         return "ERROR"
 
-    while task_queue or active_tasks:
+    while not queue_exhausted or active_tasks:
 
-        while len(active_tasks) < 3 and task_queue:
+        while True:
 
-            task_data = task_queue.pop(0)
+            # 交给空闲槽位最多的账号，所有账号都满了就先去检查状态
+            free = dict(slots)
+            for owner in task_accounts.values():
+                free[owner.username] -= 1
+            account = max(accounts, key=lambda candidate: free[candidate.username])
+            if free[account.username] <= 0:
+                break
 
-            task_index = start + completed_count + failed_count + len(active_tasks)
+            next_task = next(task_queue, None)
+            if next_task is None:
+                queue_exhausted = True
+                break
+
+            task_index, sim_data = next_task
 
-            progress_url = submit_simulation(task_index, task_data)
+            progress_url = submit_simulation(task_index, sim_data, account)
 
             if progress_url:
+                sim_queue.mark_submitted(task_index, progress_url, account.username)
                 active_tasks[task_index] = progress_url
+                task_accounts[task_index] = account
                 task_check_counts[task_index] = 0
                 task_start_times[task_index] = time.time()
-
-            if task_queue:
-                time.sleep(2)
+            else:
+                sim_queue.mark_failed(task_index, "submit failed")
 
         completed_tasks = []
 
@@ -1132,39 +1026,35 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
             if elapsed_time > max_task_duration:
                 print(f"⏰ 任务{task_index} 运行时间过长 ({elapsed_time / 60:.1f}分钟)，标记为超时")
-                completed_tasks.append(task_index)
+                completed_tasks.append((task_index, False))
                 failed_count += 1
                 continue
 
             if check_count > max_check_count:
                 print(f"⏰ 任务{task_index} 检查次数过多 ({check_count}次)，标记为超时")
-                completed_tasks.append(task_index)
+                completed_tasks.append((task_index, False))
                 failed_count += 1
                 continue
 
             print(f"🔍 检查任务{task_index}状态... (第{check_count}次检查, 已运行{elapsed_time / 60:.1f}分钟)")
-            status = check_simulation_status(task_index, progress_url)
+            status = check_simulation_status(task_index, progress_url, task_accounts[task_index])
 
             if status == "COMPLETE":
 
                 print(f"✅ 任务{task_index} 完成")
 
-                completed_tasks.append(task_index)
+                completed_tasks.append((task_index, True))
 
                 completed_count += 1
 
-                time.sleep(15)
-
             elif status in ["ERROR", "FAILED"]:
 
                 print(f"❌ 任务{task_index} 失败")
 
-                completed_tasks.append(task_index)
+                completed_tasks.append((task_index, False))
 
                 failed_count += 1
 
-                time.sleep(5)
-
             elif status == "RUNNING":
 
                 print(f"⏳ 任务{task_index} 运行中 (已检查{check_count}次, 已运行{elapsed_time / 60:.1f}分钟)")
@@ -1174,7 +1064,7 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                 warning_threshold_minutes = 30  # WARNING状态超过30分钟视为完成
                 if elapsed_time > warning_threshold_minutes * 60:
                     print(f"⚠️ 任务{task_index} WARNING状态持续{elapsed_time / 60:.1f}分钟，视为完成（有警告）")
-                    completed_tasks.append(task_index)
+                    completed_tasks.append((task_index, True))
                     completed_count += 1
                 else:
                     print(
@@ -1187,11 +1077,16 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
                 # 如果状态是UNKNOWN且持续很长时间，标记为错误
                 if status == "UNKNOWN" and elapsed_time > 1800:  # 30分钟
                     print(f"⏰ 任务{task_index} UNKNOWN状态持续30分钟，标记为错误")
-                    completed_tasks.append(task_index)
+                    completed_tasks.append((task_index, False))
                     failed_count += 1
 
-        for task_index in completed_tasks:
+        for task_index, succeeded in completed_tasks:
+            if succeeded:
+                sim_queue.mark_complete(task_index)
+            else:
+                sim_queue.mark_failed(task_index, "timeout or error")
             del active_tasks[task_index]
+            del task_accounts[task_index]
             if task_index in task_check_counts:
                 del task_check_counts[task_index]
             if task_index in task_start_times:
@@ -1199,18 +1094,13 @@ def multi_simulate2_sa(alpha_pools, neut, region, universe, start, selection_lim
 
         if active_tasks:
             print(f"⏳ 等待 {len(active_tasks)} 个任务完成...")
-            time.sleep(15)
+            metrics.set_gauge('super_active_tasks', len(active_tasks))
+            metrics.sleep(15, 'poll_interval')
         else:
             print(f"✅ 所有任务已完成或失败")
 
-        # 每20个任务后重新登录，防止session过期
-        if (completed_count + failed_count) % 20 == 0 and (completed_count + failed_count) > 0:
-            print(f"🔄 已完成 {completed_count + failed_count} 个任务，重新登录以刷新session...")
-            s = sign_in(cfg.username, cfg.password)
-            if s is None:
-                print("❌ 重新登录失败，停止处理")
-                break
-
+    sim_queue.close()
+    metrics.set_gauge('super_active_tasks', 0)
     print(f"🎉 模拟完成! 成功: {completed_count}, 失败: {failed_count}, 总计: {completed_count + failed_count}")
 
 
@@ -1642,7 +1532,7 @@ if __name__ == '__main__':
                             print(f"🚦 检测到登录限流问题，等待 {wait_minutes} 分钟后继续...")
                             print(
                                 f"   预计恢复时间: {(datetime.datetime.now() + datetime.timedelta(minutes=wait_minutes)).strftime('%Y-%m-%d %H:%M:%S')}")
-                            time.sleep(wait_minutes * 60)
+                            metrics.sleep(wait_minutes * 60, 'login_backoff')
                             print(f"⏰ 等待完成，继续处理...")
 
                         # 检查是否达到错误阈值
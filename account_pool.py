@@ -0,0 +1,168 @@
+"""
+多账号池
+
+团队有多个账号时，每个账号各自一份登录会话、限速器和模拟并发上限，调度器把模拟队列分摊到各账号上，
+总吞吐随账号数增长，不必手动为每个账号各开一份脚本：
+    - 会话：session_pool 里该账号的共享 Session，Session 上挂着该账号自己的限速器，
+      paced_request / AsyncBrainClient 用这个 Session 发请求时自动走该账号的令牌桶
+    - 并发上限：每个账号同时在途的 simulation 数，未配置时用调用方给的默认值
+    - 归属：alpha 只有创建它的账号能轮询、检查和修改。模拟完成后记下 alpha id → 账号，
+      之后的检查/PATCH 通过 session_for(alpha_id) 发给拥有它的账号
+
+账号列表文件默认是脚本目录下的 accounts.json，可用环境变量 BRAIN_ACCOUNTS 指定路径，格式为 JSON 数组：
+    [["user1@example.com", "password1"],
+     {"username": "user2@example.com", "password": "password2", "concurrency": 8, "rates": {"simulate": 2}}]
+文件不存在时退化为 brain.txt 中的单个账号，行为与原来相同（使用进程级的 rate_limiter.limiter）。
+
+多账号时 alpha 归属保存在 SQLite（默认 alpha_owner.db，可用 BRAIN_ALPHA_OWNERS 指定），
+模拟脚本和之后的检查脚本可以在不同进程里共用。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from rate_limiter import RateLimiter, limiter
+from session_pool import load_credentials, pool
+
+ACCOUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'accounts.json')
+
+
+class Account:
+    """
+    Args:
+        username, password: 账号密码
+        concurrency: 该账号同时在途的 simulation 上限，None 表示用调用方的默认值
+        rates: 覆盖该账号限速器各类别速率的字典
+        rate_limiter: 直接指定限速器（单账号时沿用进程级的 limiter）
+    """
+
+    def __init__(self, username, password, concurrency=None, rates=None, rate_limiter=None):
+        self.username = username
+        self.password = password
+        self.concurrency = concurrency
+        self.limiter = rate_limiter or RateLimiter(rates=rates, state_file=_state_file(username))
+
+    @property
+    def session(self):
+        """该账号的共享 Session（第一次访问时登录），请求经过该账号自己的限速器"""
+        s = pool.get(self.username, self.password)
+        s.limiter = self.limiter
+        return s
+
+    def refresh(self):
+        """强制重新认证，返回同一个 Session"""
+        return pool.refresh(self.session)
+
+    def __repr__(self):
+        return f"Account({self.username})"
+
+
+def _state_file(username):
+    """设置了 BRAIN_RATE_STATE 时每个账号的桶状态各存一个文件"""
+    base = os.environ.get('BRAIN_RATE_STATE')
+    if not base:
+        return None
+    return '%s.%s' % (base, re.sub(r'[^\w.-]', '_', username))
+
+
+def load_accounts(path=None):
+    """
+    读取账号列表；文件不存在时返回 brain.txt 中的单个账号。
+
+    Returns:
+        list: Account 列表
+    """
+    path = path or os.environ.get('BRAIN_ACCOUNTS') or ACCOUNTS_FILE
+    if not os.path.exists(path):
+        username, password = load_credentials()
+        return [Account(username, password, rate_limiter=limiter)]
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    accounts = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            accounts.append(Account(entry['username'], entry['password'], entry.get('concurrency'), entry.get('rates')))
+        else:
+            username, password = entry
+            accounts.append(Account(username, password))
+    if not accounts:
+        raise ValueError(f"账号列表 {path} 为空")
+    if len({account.username for account in accounts}) != len(accounts):
+        raise ValueError(f"账号列表 {path} 中有重复的账号")
+    return accounts
+
+
+class AccountPool:
+    """
+    Args:
+        accounts: Account 列表，第一个为默认账号
+        owners_path: alpha 归属数据库路径；单账号时不使用
+    """
+
+    def __init__(self, accounts, owners_path=None):
+        self.accounts = list(accounts)
+        self.default = self.accounts[0]
+        self._by_name = {account.username: account for account in self.accounts}
+        self._lock = threading.Lock()
+        self._conn = None
+        if len(self.accounts) > 1:
+            path = owners_path or os.environ.get('BRAIN_ALPHA_OWNERS', 'alpha_owner.db')
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS alpha_owner (alpha_id TEXT PRIMARY KEY, username TEXT NOT NULL)')
+            self._conn.commit()
+            print(f"   👥 [AccountPool] {len(self.accounts)} 个账号: {', '.join(self._by_name)}")
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def get(self, username):
+        """按用户名取账号；username 为空或不在池里时返回默认账号"""
+        return self._by_name.get(username, self.default)
+
+    def claim(self, alpha_ids, account):
+        """记录一批 alpha 属于 account（Account 或用户名）"""
+        if self._conn is None:
+            return
+        username = getattr(account, 'username', account)
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO alpha_owner VALUES (?, ?)',
+                                   [(alpha_id, username) for alpha_id in alpha_ids if alpha_id])
+
+    def owner(self, alpha_id):
+        """拥有该 alpha 的账号；没有归属记录时返回 None"""
+        if self._conn is None:
+            return self.default
+        with self._lock:
+            row = self._conn.execute('SELECT username FROM alpha_owner WHERE alpha_id = ?', (alpha_id,)).fetchone()
+        return self._by_name.get(row[0]) if row else None
+
+    def session_for(self, alpha_id, default=None):
+        """
+        拥有该 alpha 的账号的 Session。
+
+        Args:
+            default: 单账号或没有归属记录时返回的 Session，为 None 时用默认账号的
+        """
+        account = self.owner(alpha_id) if self._conn is not None else None
+        if account is None:
+            return default or self.default.session
+        return account.session
+
+
+_account_pool = None
+_account_pool_lock = threading.Lock()
+
+
+def get_account_pool():
+    """进程内共享的账号池，第一次调用时读取账号列表"""
+    global _account_pool
+    with _account_pool_lock:
+        if _account_pool is None:
+            _account_pool = AccountPool(load_accounts())
+        return _account_pool
@@ -0,0 +1,201 @@
+"""
+本地 alpha 目录
+
+把 /users/self/alphas 的记录（id、表达式、settings、IS 指标、颜色、tags、状态、dateCreated）镜像到 SQLite，
+按 dateModified 水位线增量同步：每次只翻到上次同步之后有改动的 alpha，改颜色/打标签/提交也会被同步到。
+候选筛选（地区、sharpe/fitness 阈值、颜色、日期区间、SUPER/REGULAR）和 prune 都在本地带索引的表上查询，
+检查脚本每轮循环不再反复请求列表接口。
+
+数据库默认是当前目录下的 alpha_catalog.db，可用环境变量 BRAIN_ALPHA_CATALOG 指定路径。
+"""
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from os_sync import fetch_alphas_since, newest_submitted
+
+# 与服务器 status=UNSUBMITTED%1FIS_FAIL 一致
+CANDIDATE_STATUSES = ('UNSUBMITTED', 'IS_FAIL')
+ORDER_COLUMNS = ('sharpe', 'fitness', 'turnover', 'margin', 'date_created', 'date_modified')
+
+
+def _utc(date_text):
+    """带时区的时间字符串 → 统一的 UTC ISO 字符串，保证按字符串比较即按时间比较"""
+    if not date_text:
+        return None
+    moment = datetime.fromisoformat(date_text.replace('Z', '+00:00'))
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _code(alpha):
+    """REGULAR 用 regular.code，SUPER 用 combo.code"""
+    for key in ('regular', 'combo'):
+        if isinstance(alpha.get(key), dict) and alpha[key].get('code'):
+            return alpha[key]['code']
+    return ''
+
+
+def _field_key(code, prefix, sharpe):
+    """prune 的分组键：表达式中 prefix 之后的字段名，sharpe 为负时加 '-'"""
+    field = code.split(prefix)[-1].split(",")[0]
+    return "-%s" % field if sharpe is not None and sharpe < 0 else field
+
+
+class AlphaCatalog:
+    """
+    Args:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('BRAIN_ALPHA_CATALOG', 'alpha_catalog.db')
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.create_function('field_key', 3, _field_key, deterministic=True)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS alpha ('
+            ' id TEXT PRIMARY KEY,'
+            ' type TEXT,'
+            ' code TEXT,'
+            ' region TEXT,'
+            ' universe TEXT,'
+            ' delay INTEGER,'
+            ' status TEXT,'
+            ' color TEXT,'
+            ' hidden INTEGER,'
+            ' sharpe REAL,'
+            ' fitness REAL,'
+            ' turnover REAL,'
+            ' margin REAL,'
+            ' long_count INTEGER,'
+            ' short_count INTEGER,'
+            ' tags TEXT,'
+            ' date_created TEXT,'
+            ' date_modified TEXT,'
+            ' record TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_alpha_select ON alpha (region, status, sharpe)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_alpha_created ON alpha (region, date_created)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    def _state(self, key):
+        row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (key, value))
+
+    def upsert(self, alphas):
+        """写入/更新一批 API 返回的 alpha 记录"""
+        rows = []
+        for alpha in alphas:
+            metrics = alpha.get('is') or {}
+            settings = alpha.get('settings') or {}
+            rows.append((
+                alpha['id'], alpha.get('type'), _code(alpha), settings.get('region'), settings.get('universe'),
+                settings.get('delay'), alpha.get('status'), alpha.get('color') or metrics.get('color'),
+                int(bool(alpha.get('hidden'))), metrics.get('sharpe'), metrics.get('fitness'),
+                metrics.get('turnover'), metrics.get('margin'), metrics.get('longCount'), metrics.get('shortCount'),
+                json.dumps(alpha.get('tags') or []), _utc(alpha.get('dateCreated')),
+                _utc(alpha.get('dateModified')), json.dumps(alpha),
+            ))
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO alpha VALUES (%s)' % ', '.join('?' * 19), rows)
+        return len(rows)
+
+    def sync(self, s, since=None, min_interval=60):
+        """
+        增量同步：按 dateModified 倒序翻页直到越过上次的水位线。
+
+        Args:
+            s: 已登录的 requests.Session
+            since: 需要覆盖的最早时间（带时区的时间字符串），None 表示全部历史。
+                第一次同步或 since 早于已覆盖的范围时，从 since 开始补齐；之后只翻上次水位线之后的改动
+            min_interval: 距上次同步不足该秒数时跳过
+
+        Returns:
+            int: 本次写入的 alpha 数
+        """
+        floor = self._state('floor')
+        wanted = _utc(since) if since else ''
+        backfill = floor is None or wanted < floor
+        if not backfill and time.time() - float(self._state('last_sync') or 0) < min_interval:
+            return 0
+        watermark = since if backfill else self._state('date_modified')
+        alphas, complete = fetch_alphas_since(s, '', 'dateModified', watermark)
+        count = self.upsert(alphas)
+        if complete:
+            new_watermark = newest_submitted(alphas, self._state('date_modified'), field='dateModified')
+            with self.conn:
+                if new_watermark:
+                    self._set_state('date_modified', new_watermark)
+                if backfill:
+                    self._set_state('floor', wanted)
+                self._set_state('last_sync', str(time.time()))
+        print(f"   📚 [AlphaCatalog] 同步 {count} 个alpha，目录共 {self.count()} 个")
+        return count
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM alpha').fetchone()[0]
+
+    def select(self, region=None, super_alpha=None, statuses=CANDIDATE_STATUSES, colors=(), exclude_colors=(),
+               min_sharpe=None, max_sharpe=None, min_fitness=None, max_fitness=None,
+               created_from=None, created_to=None, include_hidden=False, order='-sharpe', limit=None,
+               per_field=None):
+        """
+        本地筛选，条件语义与服务器查询参数一致（阈值为严格不等，created_from 含、created_to 不含）。
+
+        Args:
+            super_alpha: True 只要 SUPER，False 排除 SUPER，None 不限
+            order: 'sharpe' / '-sharpe' 等，'-' 表示降序
+            per_field: (prefix, keep_num) 时按 prune 规则每个字段（区分正负）只保留 |sharpe| 最大的 keep_num 个
+
+        Returns:
+            list: 与 API 相同结构的 alpha 字典
+        """
+        conditions, params = [], []
+        if region:
+            conditions.append('region = ?')
+            params.append(region)
+        if super_alpha is not None:
+            conditions.append("type = 'SUPER'" if super_alpha else "type IS NOT 'SUPER'")
+        if statuses:
+            conditions.append('status IN (%s)' % ', '.join('?' * len(statuses)))
+            params.extend(statuses)
+        if colors:
+            conditions.append('color IN (%s)' % ', '.join('?' * len(colors)))
+            params.extend(colors)
+        if exclude_colors:
+            conditions.append('color IS NULL OR color NOT IN (%s)' % ', '.join('?' * len(exclude_colors)))
+            params.extend(exclude_colors)
+        for column, op, value in (('sharpe', '>', min_sharpe), ('sharpe', '<', max_sharpe),
+                                  ('fitness', '>', min_fitness), ('fitness', '<', max_fitness),
+                                  ('date_created', '>=', _utc(created_from)), ('date_created', '<', _utc(created_to))):
+            if value is not None:
+                conditions.append('%s %s ?' % (column, op))
+                params.append(value)
+        if not include_hidden:
+            conditions.append('hidden = 0')
+
+        where = ' AND '.join('(%s)' % c for c in conditions) or '1'
+        column = order.lstrip('-')
+        if column not in ORDER_COLUMNS:
+            raise ValueError(f"不支持的排序字段: {order}")
+        direction = 'DESC' if order.startswith('-') else 'ASC'
+        if per_field:
+            prefix, keep_num = per_field
+            sql = ('SELECT record FROM (SELECT record, %s AS ord, ROW_NUMBER() OVER ('
+                   ' PARTITION BY field_key(code, ?, sharpe) ORDER BY ABS(sharpe) DESC) AS rank'
+                   ' FROM alpha WHERE %s) WHERE rank <= ? ORDER BY ord %s' % (column, where, direction))
+            params = [prefix] + params + [keep_num]
+        else:
+            sql = 'SELECT record FROM alpha WHERE %s ORDER BY %s %s' % (where, column, direction)
+        if limit is not None:
+            sql += ' LIMIT %d' % int(limit)
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,340 @@
+"""
+端到端基准测试
+
+TASK_POOL_SIZE、CONCURRENT_SIMS 和各处的 sleep 以前都凭感觉调。这里在本地模拟服务器（mock_brain）上
+用给定的延迟分布跑真实的调度代码，输出可以跨提交比较的数字：
+    - multi_simulate        machine_lib 的滑动窗口 multi-simulation
+    - multi_simulate2_sa    1super2 的 Super Alpha 模拟循环
+    - check                 check_pipeline 的并发提交检查
+    - prod_corr             prod_corr 的生产相关性轮询服务
+
+每个场景指标：
+    per_hour                每小时完成的模拟（或检查）数
+    mean_in_flight          服务器端平均在途模拟数（按时间加权），slot_utilisation = mean_in_flight / slot_cap
+    completion_lag          模拟完成到客户端查到结果的平均秒数
+    sleep_seconds           主线程 time.sleep 总时长及按模块拆分；后台线程和 asyncio.sleep 单独统计
+    requests_per_completed  每个完成的模拟/检查平均发出的请求数
+    peak_rss_mb             客户端进程的峰值内存
+
+每个场景在独立的子进程里运行（独立的模块状态、限速器和峰值内存），工作目录是临时目录，不会碰到本地的
+sim_cache.db / sim_queue.db；模拟服务器在父进程的后台线程里运行，每个场景重新启动。
+
+用法：
+    python benchmark.py                                   # 全部场景，结果写到 benchmark_<提交>.json
+    python benchmark.py --scenarios multi_simulate --concurrent-sims 4 --task-pool-size 10
+    python benchmark.py --profile recorded.json --compare benchmark_abc1234.json
+
+--profile 是 mock_brain 的配置项 JSON，如 {"sim_time": [31.2, 18.5, ...], "retry_after": "const:2"}，
+列表形式的分布表示从实测样本中随机抽取。
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ('multi_simulate', 'multi_simulate2_sa', 'check', 'prod_corr')
+
+# 比真实服务器快，让一次完整基准在几分钟内跑完；需要贴近线上时用 --profile 传实测分布
+DEFAULT_PROFILE = {
+    'sim_time': 'lognormal:10,0.4',
+    'retry_after': 'const:2',
+    'check_time': 'uniform:3,10',
+    'corr_time': 'uniform:1,5',
+}
+
+COMPARE_KEYS = ('per_hour', 'slot_utilisation', 'completion_lag', 'sleep_share', 'requests_per_completed',
+                'peak_rss_mb')
+
+
+# ---------- 子进程：运行一个场景 ----------
+
+class SleepMeter:
+    """替换 time.sleep / asyncio.sleep，按调用模块统计实际睡眠时长"""
+
+    def __init__(self):
+        self.main = defaultdict(float)
+        self.background = defaultdict(float)
+        self.async_total = 0.0
+        self._lock = threading.Lock()
+
+    def install(self):
+        import asyncio
+        real_sleep = time.sleep
+        real_async_sleep = asyncio.sleep
+
+        def sleep(seconds):
+            # metrics.sleep 只是转发，算到它的调用方头上
+            frame = sys._getframe(1)
+            while frame.f_back and os.path.basename(frame.f_code.co_filename) == 'metrics.py':
+                frame = frame.f_back
+            caller = os.path.basename(frame.f_code.co_filename)
+            started = time.perf_counter()
+            real_sleep(seconds)
+            elapsed = time.perf_counter() - started
+            totals = self.main if threading.current_thread() is threading.main_thread() else self.background
+            with self._lock:
+                totals[caller] += elapsed
+
+        async def async_sleep(delay, result=None):
+            started = time.perf_counter()
+            try:
+                return await real_async_sleep(delay, result)
+            finally:
+                with self._lock:
+                    self.async_total += time.perf_counter() - started
+
+        time.sleep = sleep
+        asyncio.sleep = async_sleep
+
+    def summary(self):
+        return {
+            'main': round(sum(self.main.values()), 3),
+            'background': round(sum(self.background.values()), 3),
+            'async': round(self.async_total, 3),
+            'by_module': {name: round(value, 3) for name, value in sorted(self.main.items(), key=lambda kv: -kv[1])},
+        }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _expressions(count):
+    """互不相同的 (表达式, decay)，保证不会命中 sim_cache"""
+    fields = ('close', 'volume', 'returns', 'vwap', 'cap')
+    return [(f"ts_rank(ts_delta({fields[i % len(fields)]}, {i // len(fields) % 20 + 1}), {i // 100 + 5})", i % 10)
+            for i in range(count)]
+
+
+def _seeded_alpha_ids(count):
+    from os_sync import fetch_alphas_since
+    from session_pool import get_session
+    alphas, _ = fetch_alphas_since(get_session(), '', 'dateCreated')
+    return [alpha['id'] for alpha in alphas[:count]]
+
+
+def run_multi_simulate(params):
+    import machine_lib
+    pools = machine_lib.load_task_pool(_expressions(params['alphas']), params['task_pool_size'],
+                                       params['concurrent_sims'])
+    machine_lib.multi_simulate(pools, 'SUBINDUSTRY', params['region'], params['universe'], 0, 1)
+    return {'slot_cap': params['concurrent_sims'] * params['accounts']}
+
+
+def run_multi_simulate2_sa(params):
+    import importlib
+    super2 = importlib.import_module('1super2')
+    pairs = [(f"turnover < {0.05 + i * 0.001:.3f}", f"combo_a(alpha, nlength={i % 250 + 10})")
+             for i in range(params['sa_alphas'])]
+    super2.multi_simulate2_sa([pairs], 'SUBINDUSTRY', params['region'], params['universe'], 0, [300], ['POSITIVE'])
+    return {'slot_cap': 3 * params['accounts']}
+
+
+def run_check(params):
+    from check_pipeline import check_alphas
+    from session_pool import get_session
+    ids = _seeded_alpha_ids(params['checks'])
+    outcomes = check_alphas(get_session(), ids, concurrency=params['check_concurrency'])
+    return {'completed': len(outcomes), 'slot_cap': params['check_concurrency']}
+
+
+def run_prod_corr(params):
+    from prod_corr import ProdCorrService
+    from session_pool import get_session
+    ids = _seeded_alpha_ids(params['checks'])
+    with ProdCorrService(get_session(), concurrency=params['check_concurrency']) as service:
+        results = [future.result() for future in service.submit_many(ids).values()]
+    return {'completed': sum(1 for result in results if result.ok), 'slot_cap': params['check_concurrency']}
+
+
+RUNNERS = {
+    'multi_simulate': run_multi_simulate,
+    'multi_simulate2_sa': run_multi_simulate2_sa,
+    'check': run_check,
+    'prod_corr': run_prod_corr,
+}
+
+
+def child_main(scenario, params, result_path, verbose):
+    meter = SleepMeter()
+    meter.install()
+    sys.path.insert(0, REPO_DIR)
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+    started = time.time()
+    result = RUNNERS[scenario](params)
+    result['wall_seconds'] = round(time.time() - started, 3)
+    result['sleep_seconds'] = meter.summary()
+    if 'metrics' in sys.modules:
+        result['sleep_seconds']['by_reason'] = sys.modules['metrics'].metrics.snapshot()['sleep_seconds']
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+
+# ---------- 父进程：模拟服务器 + 汇总 ----------
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return git('rev-parse', '--short', 'HEAD') or 'unknown', bool(git('status', '--porcelain', '--untracked-files=no'))
+    except OSError:
+        return 'unknown', False
+
+
+def run_scenario(scenario, params, profile, workdir, verbose):
+    from mock_brain import start_mock_server
+
+    with start_mock_server(**profile) as server:
+        result_path = os.path.join(workdir, scenario + '.json')
+        env = dict(os.environ)
+        env.pop('BRAIN_RATE_STATE', None)
+        env.pop('BRAIN_ACCOUNTS', None)
+        if params['accounts'] > 1:
+            env['BRAIN_ACCOUNTS'] = os.path.join(workdir, 'accounts.json')
+        env.update({
+            'BRAIN_API_URL': server.url,
+            'BRAIN_CREDENTIALS': os.path.join(workdir, 'brain.txt'),
+            'BRAIN_SIM_CACHE': os.path.join(workdir, scenario + '_sim_cache.db'),
+            'BRAIN_SIM_QUEUE': os.path.join(workdir, scenario + '_sim_queue.db'),
+            'BRAIN_PROPERTY_QUEUE': os.path.join(workdir, scenario + '_property_queue.db'),
+            'BRAIN_ALPHA_CATALOG': os.path.join(workdir, scenario + '_alpha_catalog.db'),
+            'BRAIN_ALPHA_OWNERS': os.path.join(workdir, scenario + '_alpha_owner.db'),
+        })
+        command = [sys.executable, os.path.abspath(__file__), '--child', scenario, '--params', json.dumps(params),
+                   '--result', result_path] + (['--verbose'] if verbose else [])
+        completed = subprocess.run(command, cwd=workdir, env=env)
+        stats = server.stats()
+    if completed.returncode != 0:
+        return {'error': f'子进程退出码 {completed.returncode}'}
+
+    with open(result_path) as f:
+        result = json.load(f)
+    counters = stats['counters']
+    wall = result['wall_seconds']
+    done = result.pop('completed', counters.get('alphas_created', 0))
+    requests_total = counters.get('requests', 0)
+    result.update({
+        'completed': done,
+        'per_hour': round(done / wall * 3600, 1) if wall else None,
+        'requests': requests_total,
+        'requests_per_completed': round(requests_total / done, 2) if done else None,
+        'sleep_share': round(result['sleep_seconds']['main'] / wall, 3) if wall else None,
+        'logins': counters.get('logins', 0),
+        'faults': {key: value for key, value in counters.items() if key.startswith('fault_')},
+        'status_counts': {key: value for key, value in sorted(counters.items()) if key.count(' ') == 2},
+    })
+    if stats['simulations']:
+        mean_in_flight = stats['busy_slot_seconds'] / wall if wall else 0.0
+        result.update({
+            'simulations': stats['simulations'],
+            'mean_in_flight': round(mean_in_flight, 3),
+            'peak_in_flight': stats['peak_concurrent_sims'],
+            'slot_utilisation': round(mean_in_flight / result['slot_cap'], 3),
+            'completion_lag': round(stats['completion_lag'], 3) if stats['completion_lag'] is not None else None,
+        })
+    return result
+
+
+def print_report(report, baseline=None):
+    print(f"\n📊 基准结果 ({report['commit']}{' +改动' if report['dirty'] else ''})")
+    for scenario, result in report['scenarios'].items():
+        if 'error' in result:
+            print(f"   ❌ {scenario}: {result['error']}")
+            continue
+        print(f"   ▶ {scenario}: 完成 {result['completed']} 个，用时 {result['wall_seconds']:.0f} 秒")
+        old = (baseline or {}).get('scenarios', {}).get(scenario, {})
+        for key in COMPARE_KEYS:
+            value = result.get(key)
+            if value is None:
+                continue
+            line = f"      {key:<24} {value}"
+            if isinstance(old.get(key), (int, float)) and old[key]:
+                line += f"   (基线 {old[key]}, {(value - old[key]) / old[key] * 100:+.1f}%)"
+            print(line)
+        print(f"      {'sleep_by_module':<24} {result['sleep_seconds']['by_module']}")
+        if result['sleep_seconds'].get('by_reason'):
+            print(f"      {'sleep_by_reason':<24} {result['sleep_seconds']['by_reason']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在本地模拟服务器上测量调度吞吐')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔，可选: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--profile', help='mock_brain 配置 JSON（延迟分布、故障率等），覆盖默认的快速配置')
+    parser.add_argument('--alphas', type=int, default=160, help='multi_simulate 的表达式数量')
+    parser.add_argument('--task-pool-size', type=int, default=8, help='每个 multi-simulation 的子模拟数')
+    parser.add_argument('--concurrent-sims', type=int, default=3, help='同时在途的 multi-simulation 数')
+    parser.add_argument('--sa-alphas', type=int, default=12, help='multi_simulate2_sa 的 Super Alpha 数量')
+    parser.add_argument('--checks', type=int, default=60, help='check / prod_corr 的 alpha 数量')
+    parser.add_argument('--check-concurrency', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=1, help='账号数，大于1时各账号分摊模拟任务')
+    parser.add_argument('--region', default='USA')
+    parser.add_argument('--universe', default='TOP3000')
+    parser.add_argument('--output', help='结果 JSON 路径，默认 benchmark_<提交>.json')
+    parser.add_argument('--compare', help='与之前的结果 JSON 对比')
+    parser.add_argument('--verbose', action='store_true', help='显示被测代码的输出')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--params', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.child, json.loads(args.params), args.result, args.verbose)
+        return
+
+    sys.path.insert(0, REPO_DIR)
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+    profile = dict(DEFAULT_PROFILE)
+    if args.profile:
+        with open(args.profile) as f:
+            profile.update(json.load(f))
+    params = {key: getattr(args, key) for key in ('alphas', 'task_pool_size', 'concurrent_sims', 'sa_alphas',
+                                                    'checks', 'check_concurrency', 'accounts', 'region', 'universe')}
+    commit, dirty = git_revision()
+    report = {'commit': commit, 'dirty': dirty, 'created': datetime.now().isoformat(timespec='seconds'),
+              'profile': profile, 'parameters': params, 'scenarios': {}}
+
+    workdir = tempfile.mkdtemp(prefix='brain_bench_')
+    try:
+        with open(os.path.join(workdir, 'brain.txt'), 'w') as f:
+            json.dump(['benchmark', 'benchmark'], f)
+        with open(os.path.join(workdir, 'accounts.json'), 'w') as f:
+            json.dump([['benchmark%d' % i, 'benchmark'] for i in range(1, args.accounts + 1)], f)
+        for scenario in scenarios:
+            print(f"🏁 运行场景 {scenario} ...")
+            report['scenarios'][scenario] = run_scenario(scenario, params, profile, workdir, args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or f'benchmark_{commit}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\n💾 结果已写入 {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+基于 asyncio 的 WorldQuant BRAIN 客户端
+
+所有请求共用一个事件循环：每个在途请求是一个协程，Retry-After 用 asyncio.sleep 非阻塞等待，
+因此几百个待轮询的进度/检查可以在一个进程、一个线程内同时挂起。
+
+同步代码通过 run_sync / run_many / run_paged 调用，复用已有 requests.Session 的 cookie，不额外登录。
+这些调用提交到后台线程上常驻的同一个事件循环，每个 Session 对应一个长期存活的客户端（连接池），
+连续的单次调用不再各自新建事件循环、重新握手；在其他事件循环里调用也不会报错。
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+
+import aiohttp
+from yarl import URL
+
+from metrics import metrics
+from rate_limiter import classify, limiter
+
+# 所有模块共用的API根地址；设置环境变量 BRAIN_API_URL 可整体指向其他服务器（如本地的 mock_brain.py）
+API_URL = os.environ.get('BRAIN_API_URL', 'https://api.worldquantbrain.com').rstrip('/')
+
+
+class BrainResponse:
+    """与 requests.Response 用法一致的最小响应对象（status_code / headers / text / json()）"""
+
+    def __init__(self, status_code, headers, text, timed_out=False):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.timed_out = timed_out
+
+    def json(self):
+        return json.loads(self.text) if self.text else {}
+
+
+class AsyncBrainClient:
+    """
+    异步 BRAIN 客户端。
+
+    Args:
+        username, password: 账号密码；为空时只能依赖传入的 cookie
+        api_url: API根地址
+        cookies: 初始 cookie 字典（通常来自已登录的 requests.Session）
+        max_connections: 连接池上限
+        rate_limiter: 共享的令牌桶限速器，默认用进程级的 rate_limiter.limiter
+    """
+
+    def __init__(self, username=None, password=None, api_url=API_URL, cookies=None,
+                 max_connections=100, rate_limiter=None):
+        self.username = username
+        self.password = password
+        self.api_url = api_url
+        self.rate_limiter = rate_limiter or limiter
+        self._cookies = cookies or {}
+        self._max_connections = max_connections
+        self.session = None
+        self.source_session = None
+        self._auth_seen = 0.0
+
+    @classmethod
+    def from_session(cls, s, **kwargs):
+        """从已登录的 requests.Session 构造，沿用其 cookie、账号和该账号的限速器"""
+        pool = getattr(s, 'pool', None)
+        if pool is not None:
+            # session_pool 管理的 Session：先确认令牌未过期再复制 cookie，401 时也交给池统一重新认证
+            pool.ensure_fresh(s)
+        username, password = s.auth if isinstance(s.auth, tuple) else (None, None)
+        kwargs.setdefault('rate_limiter', getattr(s, 'limiter', None))
+        client = cls(username, password, cookies=s.cookies.get_dict(), **kwargs)
+        if pool is not None:
+            client.source_session = s
+            client._auth_seen = s.authenticated_at
+        return client
+
+    async def __aenter__(self):
+        # unsafe=True: 允许 IP 地址形式的主机（如 http://127.0.0.1:8765 的本地模拟服务器）保存 cookie
+        jar = aiohttp.CookieJar(unsafe=True)
+        if self._cookies:
+            jar.update_cookies(self._cookies, URL(self.api_url))
+        connector = aiohttp.TCPConnector(limit=self._max_connections)
+        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=jar)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def sync_cookies(self):
+        """来源 Session 在别处重新登录过时，把新 cookie 复制过来（需在事件循环线程里调用）"""
+        s = self.source_session
+        if s is not None and s.authenticated_at > self._auth_seen:
+            self._auth_seen = s.authenticated_at
+            self.session.cookie_jar.update_cookies(s.cookies.get_dict(), URL(self.api_url))
+
+    async def authenticate(self):
+        """POST /authentication，成功返回 True"""
+        if self.source_session is not None:
+            s = self.source_session
+            seen = self._auth_seen
+            try:
+                # 池里已经有更新的登录就直接沿用，否则由池重新认证一次
+                await asyncio.get_running_loop().run_in_executor(None, lambda: s.pool.refresh(s, stale_before=seen))
+            except Exception:
+                return False
+            self._auth_seen = s.authenticated_at
+            self.session.cookie_jar.update_cookies(s.cookies.get_dict(), URL(self.api_url))
+            return True
+        if not self.username:
+            return False
+        auth = aiohttp.BasicAuth(self.username, self.password)
+        started = time.perf_counter()
+        async with self.session.post(self.api_url + '/authentication', auth=auth) as resp:
+            await resp.read()
+        metrics.observe_request('POST', self.api_url + '/authentication', resp.status, time.perf_counter() - started)
+        return resp.status in (200, 201)
+
+    async def request(self, method, url, json_body=None, follow_retry_after=True, max_wait=None):
+        """
+        发送请求并处理 Retry-After / 401。
+
+        Args:
+            method: HTTP 方法
+            url: 完整URL或以 / 开头的路径
+            json_body: 请求体
+            follow_retry_after: 为 True 时遇到 Retry-After 就等待后重发（进度/检查类接口）；
+                为 False 时只在 429 时等待（如 POST /simulations 成功响应也会带 Retry-After）
+            max_wait: 累计等待上限（秒），超过后返回 timed_out=True 的响应
+
+        Returns:
+            BrainResponse
+        """
+        if not url.startswith('http'):
+            url = self.api_url + url
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        reauthed = False
+        cls = classify(method, url)
+
+        while True:
+            delay = self.rate_limiter.reserve(cls)
+            metrics.observe_sleep('rate_limit', delay)
+            await asyncio.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                async with self.session.request(method, url, json=json_body) as resp:
+                    text = await resp.text()
+                    response = BrainResponse(resp.status, resp.headers.copy(), text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.observe_error(method, url, e)
+                raise
+            metrics.observe_request(method, url, response.status_code, time.perf_counter() - sent,
+                                    response.headers.get('Retry-After'))
+            throttled = self.rate_limiter.observe(cls, response.status_code, response.headers.get('Retry-After'))
+
+            if response.status_code == 401 and not reauthed and await self.authenticate():
+                reauthed = True
+                continue
+
+            if response.status_code == 429:
+                # 限速器已暂停该类别，下一轮 reserve 会自动等待
+                retry_after = throttled
+            else:
+                retry_after = float(response.headers.get('Retry-After', 0) or 0)
+                if retry_after <= 0 or not follow_retry_after:
+                    return response
+
+            if max_wait is not None and loop.time() - started + retry_after > max_wait:
+                response.timed_out = True
+                return response
+            if response.status_code != 429:
+                metrics.observe_sleep('retry_after', retry_after)
+                await asyncio.sleep(retry_after)
+
+    async def post_simulation(self, payload):
+        """提交模拟，返回 (progress_url, 响应)"""
+        response = await self.request('POST', '/simulations', json_body=payload, follow_retry_after=False)
+        return response.headers.get('Location'), response
+
+    async def wait_progress(self, progress_url, max_wait=None):
+        """轮询进度URL直到没有 Retry-After"""
+        return await self.request('GET', progress_url, max_wait=max_wait)
+
+    async def get_alpha(self, alpha_id):
+        return await self.request('GET', '/alphas/' + alpha_id)
+
+    async def get_check(self, alpha_id, max_wait=None):
+        return await self.request('GET', '/alphas/' + alpha_id + '/check', max_wait=max_wait)
+
+    async def get_correlations(self, alpha_id, kind='prod', max_wait=None):
+        """kind: 'prod' 或 'self'"""
+        return await self.request('GET', '/alphas/' + alpha_id + '/correlations/' + kind, max_wait=max_wait)
+
+    async def get_pnl(self, alpha_id):
+        return await self.request('GET', '/alphas/' + alpha_id + '/recordsets/pnl')
+
+
+class _LoopThread:
+    """后台线程上常驻的事件循环，以及按 Session 缓存的 AsyncBrainClient"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._clients = weakref.WeakKeyDictionary()  # Session -> 已进入的 AsyncBrainClient
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='brain-async', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _client(self, s):
+        pool = getattr(s, 'pool', None)
+        with self._lock:
+            if self._loop is None:
+                self._start()
+            client = self._clients.get(s)
+            if client is None:
+                client = AsyncBrainClient.from_session(s)
+                asyncio.run_coroutine_threadsafe(client.__aenter__(), self._loop).result()
+                self._clients[s] = client
+                # Session 被回收时关闭对应的连接池；进程退出时由 close() 统一关闭
+                weakref.finalize(s, self._close_client, client).atexit = False
+            elif pool is not None:
+                pool.ensure_fresh(s)
+        return client
+
+    def _close_client(self, client):
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.__aexit__(None, None, None), self._loop)
+
+    def run(self, s, coroutine_fn):
+        """在常驻事件循环上执行 coroutine_fn(client) 并等待结果"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('不能在 brain_async 的事件循环线程里同步等待请求，请直接 await 客户端方法')
+        client = self._client(s)
+
+        async def _main():
+            client.sync_cookies()
+            return await coroutine_fn(client)
+
+        return asyncio.run_coroutine_threadsafe(_main(), self._loop).result()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None or not self._loop.is_running():
+                return
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+            async def _close_all():
+                await asyncio.gather(*(client.__aexit__(None, None, None) for client in clients),
+                                     return_exceptions=True)
+
+            try:
+                asyncio.run_coroutine_threadsafe(_close_all(), self._loop).result(timeout=5)
+            except Exception:
+                pass
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_loop_thread = _LoopThread()
+
+
+def run_sync(s, call):
+    """
+    在常驻事件循环上执行一次客户端调用。
+
+    Args:
+        s: 已登录的 requests.Session
+        call: call(client) -> 协程
+
+    Example:
+        run_sync(s, lambda c: c.get_alpha(alpha_id))
+    """
+
+    return _loop_thread.run(s, call)
+
+
+def run_many(s, call, items, limit=20):
+    """
+    在常驻事件循环上并发执行 call(client, item)，最多 limit 个同时在途。
+
+    Returns:
+        list: 与 items 顺序一致的结果；失败的位置是对应的异常对象
+    """
+
+    async def _main(client):
+        semaphore = asyncio.Semaphore(limit)
+
+        async def _one(item):
+            async with semaphore:
+                return await call(client, item)
+
+        return await asyncio.gather(*(_one(item) for item in items), return_exceptions=True)
+
+    return _loop_thread.run(s, _main)
+
+
+def run_paged(s, url, limit=50, count=None, max_items=None, concurrency=8, max_retries=3):
+    """
+    并发获取 offset 分页接口的全部结果。
+
+    先取第一页拿到 count，其余页在常驻事件循环上最多 concurrency 个同时在途；
+    每页遇到 Retry-After/429 由客户端自动等待，其他错误按指数退避重试。
+
+    Args:
+        s: 已登录的 requests.Session
+        url: 不带 limit/offset 的接口URL（可带其他查询参数）
+        limit: 每页数量
+        count: 已知的总数；为 None 时用第一页返回的 count
+        max_items: 最多取多少条（如 alpha 列表只要前 N 个）
+        concurrency: 同时在途的页数
+
+    Returns:
+        list: 按 offset 顺序拼接的 results
+    """
+    separator = '&' if '?' in url else '?'
+
+    async def _page(client, offset):
+        for attempt in range(max_retries):
+            response = await client.request('GET', f"{url}{separator}limit={limit}&offset={offset}")
+            if response.status_code < 400:
+                return response.json()
+            metrics.observe_sleep('backoff', min(2 ** attempt, 30))
+            await asyncio.sleep(min(2 ** attempt, 30))
+        raise RuntimeError(f"分页请求失败 offset={offset}: HTTP {response.status_code} {response.text[:100]}")
+
+    async def _main(client):
+        total = count
+        if total is None:
+            first = await _page(client, 0)
+            total = first.get('count', len(first.get('results', [])))
+            pages = [first]
+            offsets = range(limit, total, limit)
+        else:
+            pages = []
+            offsets = range(0, total, limit)
+        if max_items is not None:
+            offsets = [offset for offset in offsets if offset < max_items]
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _bounded(offset):
+            async with semaphore:
+                return await _page(client, offset)
+
+        pages += await asyncio.gather(*(_bounded(offset) for offset in offsets))
+        results = [item for page in pages for item in page.get('results', [])]
+        return results if max_items is None else results[:max_items]
+
+    return _loop_thread.run(s, _main)
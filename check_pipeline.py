@@ -0,0 +1,325 @@
+"""
+并发提交检查流水线
+
+/alphas/{id}/check 常常要在 Retry-After 里挂好几分钟。这里用一个事件循环里的固定数量 worker 协程
+同时轮询多个 alpha 的检查，取代逐个阻塞的 check_submission：
+    - worker 池：最多 concurrency 个检查同时在途，在 brain_async 的常驻事件循环上共用该 Session 的
+      AsyncBrainClient 和进程级限速器
+    - 重试队列：解析失败、PROD_CORRELATION 为 NaN、登出等可重试情况按指数退避重新入队，
+      等待期间 worker 去处理其他 alpha，不再原地修改正在遍历的列表
+    - 结构化结果：每个 alpha 返回一个 CheckOutcome（状态、PC、失败项、尝试次数、耗时）
+
+每个 alpha 的检查累计等待超过 max_check_time（默认10分钟）记为 overtime。
+多账号时 check_alphas(route=...) 把 alpha 按所属账号分组，每个账号一条流水线并行运行。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from yarl import URL
+
+from brain_async import run_sync
+from metrics import metrics
+from session_pool import refresh_session
+
+MAX_CHECK_TIME = 10 * 60
+
+SUCCESS = 'success'
+FAIL = 'fail'
+ERROR = 'error'
+OVERTIME = 'overtime'
+LOGGED_OUT = 'logged_out'
+
+
+class CheckOutcome:
+    """
+    单个 alpha 的提交检查结果。
+
+    Attributes:
+        alpha_id: alpha ID
+        status: 'success' / 'fail' / 'error' / 'overtime' / 'logged_out'
+        pc: PROD_CORRELATION 值（能解析到时）
+        has_false: 检查项中是否出现 False
+        failed: FAIL 的检查项名称列表
+        attempts: 发起检查的次数
+        elapsed: 从第一次检查到出结果的秒数
+        error: 最后一次出错的说明
+    """
+
+    def __init__(self, alpha_id, status, pc=None, has_false=False, failed=(), attempts=0, elapsed=0.0, error=None):
+        self.alpha_id = alpha_id
+        self.status = status
+        self.pc = pc
+        self.has_false = has_false
+        self.failed = list(failed)
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == SUCCESS
+
+    def __repr__(self):
+        return f"CheckOutcome({self.alpha_id}, {self.status}, pc={self.pc}, attempts={self.attempts})"
+
+
+class _Retry(Exception):
+    """可重试的检查结果（字段缺失、PC 为 NaN 等）"""
+
+
+def parse_check(data):
+    """
+    解析 /check 返回的 JSON。
+
+    Returns:
+        (status, pc, has_false, failed)，status 为 success / fail / logged_out
+
+    Raises:
+        _Retry: 数据不完整，需要稍后重试
+    """
+    if data.get("is", 0) == 0:
+        return LOGGED_OUT, None, False, []
+    try:
+        checks_df = pd.DataFrame(data["is"]["checks"])
+    except (KeyError, TypeError) as e:
+        raise _Retry(f"字段缺失 {e}")
+    if "name" not in checks_df.columns or "result" not in checks_df.columns:
+        raise _Retry("checks 字段不完整")
+
+    pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
+    if len(pc_rows) == 0:
+        raise _Retry("PROD_CORRELATION field not found in checks")
+    pc = pc_rows["value"].values[0] if "value" in checks_df.columns else None
+
+    has_false = False
+    for field in ("result", "value"):
+        if field not in checks_df.columns:
+            continue
+        for cell in checks_df[field]:
+            if isinstance(cell, (bool, np.bool_)):
+                if not cell:
+                    has_false = True
+                    break
+            elif isinstance(cell, str) and "false" in cell.lower():
+                has_false = True
+                break
+        if has_false:
+            break
+
+    failed = checks_df.loc[checks_df["result"] == "FAIL", "name"].tolist()
+    if failed:
+        return FAIL, pc, has_false, failed
+    if pc is None or pd.isna(pc):
+        raise _Retry("check self-correlation error (PC 为 NaN)")
+    return SUCCESS, pc, has_false, []
+
+
+class CheckPipeline:
+    """
+    提交检查 worker 池。
+
+    Args:
+        s: 已登录的 requests.Session
+        concurrency: 同时在途的检查数
+        max_check_time: 每个 alpha 累计等待上限（秒），超过记为 overtime
+        max_attempts: 每个 alpha 最多检查次数（含重试）
+        backoff: 第一次重试的等待秒数，之后翻倍
+        max_backoff: 单次重试等待上限
+        relogin: 检测到登出时调用的无参函数，返回新的 session；为 None 时登出直接记为 logged_out
+        on_outcome: 每个 alpha 出结果时的回调 on_outcome(outcome)
+        verbose: 是否逐个打印结果
+    """
+
+    def __init__(self, s, concurrency=10, max_check_time=MAX_CHECK_TIME, max_attempts=5,
+                 backoff=5, max_backoff=120, relogin=None, on_outcome=None, verbose=True):
+        self.s = s
+        self.concurrency = max(1, int(concurrency))
+        self.max_check_time = max_check_time
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.relogin = relogin
+        self.on_outcome = on_outcome
+        self.verbose = verbose
+        self.stats = {'checked': 0, 'retried': 0, 'relogin': 0}
+
+    def run(self, alpha_ids):
+        """
+        检查一批 alpha。
+
+        Returns:
+            list: 与 alpha_ids 顺序一致的 CheckOutcome（重复的 id 只检查一次）
+        """
+        alpha_ids = list(dict.fromkeys(alpha_ids))
+        if not alpha_ids:
+            return []
+        # 在 brain_async 的常驻事件循环上运行，复用该 Session 缓存的客户端和连接池
+        outcomes = run_sync(self.s, lambda client: self._main(client, alpha_ids))
+        return [outcomes[alpha_id] for alpha_id in alpha_ids]
+
+    def _delay(self, attempt):
+        return min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+
+    async def _main(self, client, alpha_ids):
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+        for alpha_id in alpha_ids:
+            pending.put_nowait(alpha_id)
+        outcomes = {}
+        attempts = dict.fromkeys(alpha_ids, 0)
+        started = {}
+        finished = asyncio.Event()
+        relogin_lock = asyncio.Lock()
+        busy = 0
+
+        def _gauges():
+            metrics.set_gauge('check_queue', pending.qsize())
+            metrics.set_gauge('check_in_flight', busy)
+            metrics.set_gauge('check_remaining', len(alpha_ids) - len(outcomes))
+
+        def _finish(alpha_id, status, pc=None, has_false=False, failed=(), error=None):
+            outcome = CheckOutcome(alpha_id, status, pc, has_false, failed, attempts[alpha_id],
+                                   loop.time() - started[alpha_id], error)
+            outcomes[alpha_id] = outcome
+            self._report(outcome, len(outcomes), len(alpha_ids))
+            if self.on_outcome is not None:
+                self.on_outcome(outcome)
+            if len(outcomes) == len(alpha_ids):
+                finished.set()
+
+        def _retry(alpha_id, reason):
+            if attempts[alpha_id] >= self.max_attempts:
+                print(f"   ❌ {alpha_id}: 重试 {attempts[alpha_id]} 次仍失败，返回error ({reason})")
+                _finish(alpha_id, ERROR, error=reason)
+                return
+            delay = self._delay(attempts[alpha_id])
+            if loop.time() - started[alpha_id] + delay > self.max_check_time:
+                _finish(alpha_id, OVERTIME, error=reason)
+                return
+            self.stats['retried'] += 1
+            print(f"   🔄 {alpha_id}: {reason}，{delay:.0f} 秒后重试 ({attempts[alpha_id]}/{self.max_attempts})")
+            # 退避期间不占用 worker，到点后重新入队
+            loop.call_later(delay, pending.put_nowait, alpha_id)
+
+        async def _relogin(seen_login):
+            async with relogin_lock:
+                # 其他 worker 已经重新登录过就直接沿用
+                if self.stats['relogin'] != seen_login:
+                    return True
+                new_session = await loop.run_in_executor(None, self.relogin)
+                if new_session is None:
+                    return False
+                self.s = new_session
+                client.session.cookie_jar.update_cookies(new_session.cookies.get_dict(), URL(client.api_url))
+                self.stats['relogin'] += 1
+                return True
+
+        async def _worker():
+            nonlocal busy
+            while True:
+                alpha_id = await pending.get()
+                if alpha_id in outcomes:
+                    continue
+                started.setdefault(alpha_id, loop.time())
+                attempts[alpha_id] += 1
+                remaining = self.max_check_time - (loop.time() - started[alpha_id])
+                seen_login = self.stats['relogin']
+                busy += 1
+                _gauges()
+                try:
+                    if remaining <= 0:
+                        _finish(alpha_id, OVERTIME)
+                        continue
+                    response = await client.get_check(alpha_id, max_wait=remaining)
+                    self.stats['checked'] += 1
+                    if response.timed_out:
+                        _finish(alpha_id, OVERTIME)
+                        continue
+                    if response.status_code >= 400 and response.status_code != 401:
+                        _retry(alpha_id, f"HTTP {response.status_code}")
+                        continue
+                    status, pc, has_false, failed = parse_check(response.json())
+                    if status == LOGGED_OUT:
+                        if self.relogin is not None and await _relogin(seen_login):
+                            _retry(alpha_id, "登出状态，已重新登录")
+                        else:
+                            _finish(alpha_id, LOGGED_OUT)
+                        continue
+                    _finish(alpha_id, status, pc, has_false, failed)
+                except _Retry as e:
+                    _retry(alpha_id, str(e))
+                except Exception as e:
+                    _retry(alpha_id, f"{type(e).__name__} - {str(e)[:50]}")
+                finally:
+                    busy -= 1
+                    _gauges()
+
+        workers = [asyncio.create_task(_worker()) for _ in range(min(self.concurrency, len(alpha_ids)))]
+        try:
+            await finished.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return outcomes
+
+    def _report(self, outcome, done, total):
+        if not self.verbose:
+            return
+        progress = f"[{done}/{total}]"
+        if outcome.status == SUCCESS:
+            if outcome.has_false:
+                print(f"   🟡 {progress} {outcome.alpha_id}: PC={outcome.pc} 包含 False 检查项")
+            else:
+                print(f"   ✅ {progress} {outcome.alpha_id}: PC={outcome.pc}")
+        elif outcome.status == FAIL:
+            print(f"   ❌ {progress} {outcome.alpha_id}: 检查失败 (PC={outcome.pc}) {', '.join(outcome.failed[:3])}")
+        elif outcome.status == OVERTIME:
+            print(f"   ⚠️  {progress} {outcome.alpha_id}: 提交检查超时（已等待 {outcome.elapsed / 60:.1f} 分钟）")
+        elif outcome.status == LOGGED_OUT:
+            print(f"   ⚠️  {progress} {outcome.alpha_id}: logged out")
+
+
+def check_alphas(s, alpha_ids, concurrency=10, route=None, **kwargs):
+    """
+    并发检查一批 alpha，参数同 CheckPipeline。
+
+    Args:
+        route: 多账号时的 route(alpha_id) -> 拥有该 alpha 的账号的 Session。按账号分组后
+            每组各开一条流水线同时运行（各自 concurrency 个 worker），登出时重新认证该组的 Session
+
+    Returns:
+        list: 与 alpha_ids 顺序一致的 CheckOutcome
+    """
+    started = time.time()
+    alpha_ids = list(dict.fromkeys(alpha_ids))
+    groups = {}
+    for alpha_id in alpha_ids:
+        groups.setdefault(route(alpha_id) if route is not None else s, []).append(alpha_id)
+
+    if len(groups) <= 1:
+        pipelines = [CheckPipeline(session, concurrency=concurrency, **kwargs) for session in groups or [s]]
+        by_id = {outcome.alpha_id: outcome for outcome in pipelines[0].run(alpha_ids)}
+    else:
+        kwargs.pop('relogin', None)
+        pipelines = [CheckPipeline(session, concurrency=concurrency,
+                                   relogin=lambda session=session: refresh_session(session), **kwargs)
+                     for session in groups]
+        by_id = {}
+        with ThreadPoolExecutor(max_workers=len(pipelines)) as executor:
+            for outcomes in executor.map(lambda pair: pair[0].run(pair[1]), zip(pipelines, groups.values())):
+                by_id.update((outcome.alpha_id, outcome) for outcome in outcomes)
+    outcomes = [by_id[alpha_id] for alpha_id in alpha_ids]
+
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome.status] = counts.get(outcome.status, 0) + 1
+    summary = ', '.join(f"{status}={count}" for status, count in sorted(counts.items()))
+    retried = sum(pipeline.stats['retried'] for pipeline in pipelines)
+    accounts = f"，{len(groups)} 个账号" if len(groups) > 1 else ""
+    print(f"   📋 [CheckPipeline] {len(outcomes)} 个alpha检查完成 ({summary})，"
+          f"重试 {retried} 次{accounts}，耗时 {time.time() - started:.1f} 秒")
+    return outcomes
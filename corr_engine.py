@@ -0,0 +1,151 @@
+"""
+基于 NumPy 的自相关计算引擎
+
+把一个区域的 OS alpha 收益率矩阵（日期 × alpha）预先去均值、标准化成连续的 float64 矩阵并缓存，
+候选 alpha 的收益率按列拼成一批，一次矩阵乘法算出候选与全部 OS alpha 的相关系数，
+每个候选返回最大相关系数及对应的 alpha id。
+
+缺失值按掩码处理：每一对 (候选, OS alpha) 只在两者都有值的日期上计算相关系数，
+结果与 pandas DataFrame.corrwith 一致。OS 矩阵和候选都没有缺失时走单次 Z^T·Y 的快速路径。
+"""
+import numpy as np
+
+# 标准差低于该值的序列视为常数，不参与相关性计算
+MIN_STD = 1e-10
+
+
+def _standardize(values):
+    """按列去均值、除以标准差，缺失位置填 0；返回 (标准化矩阵, 掩码, 有效列)"""
+    mask = ~np.isnan(values)
+    count = mask.sum(axis=0)
+    filled = np.where(mask, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=0) / count
+        centered = np.where(mask, values - mean, 0.0)
+        std = np.sqrt((centered ** 2).sum(axis=0) / (count - 1))
+    valid = (count > 1) & (std > MIN_STD)
+    scaled = centered[:, valid] / std[valid]
+    return scaled, mask[:, valid], valid
+
+
+class SelfCorrEngine:
+    """
+    单个区域 OS 收益率矩阵上的相关性引擎。
+
+    Args:
+        os_rets: 日期为索引、alpha id 为列的收益率 DataFrame（通常是 load_data 返回值按区域取列）
+    """
+
+    def __init__(self, os_rets):
+        values = np.asarray(os_rets.to_numpy(dtype=float), dtype=np.float64)
+        scaled, mask, valid = _standardize(values)
+
+        self.index = os_rets.index
+        self.alpha_ids = [alpha_id for alpha_id, ok in zip(os_rets.columns, valid) if ok]
+        self.dense = bool(mask.all())
+        if self.dense:
+            # 无缺失：列范数归一后，相关系数就是单位向量的内积
+            self.norms = np.linalg.norm(scaled, axis=0)
+            self.unit = np.ascontiguousarray(scaled / self.norms)
+        else:
+            # 有缺失：把 [x, 1, x²] 三块并排缓存，一次乘法得到成对相关所需的全部和式
+            n = scaled.shape[1]
+            self.stacked = np.empty((scaled.shape[0], 3 * n))
+            self.stacked[:, :n] = scaled
+            self.stacked[:, n:2 * n] = mask
+            self.stacked[:, 2 * n:] = scaled ** 2
+
+    def __len__(self):
+        return len(self.alpha_ids)
+
+    def _align(self, candidates):
+        """候选收益率对齐到 OS 日期索引，返回 (标准化矩阵, 掩码, 有效列)"""
+        if getattr(candidates, 'ndim', 2) == 1:
+            candidates = candidates.to_frame()
+        values = candidates.reindex(self.index).to_numpy(dtype=float)
+        return _standardize(np.asarray(values, dtype=np.float64))
+
+    def corr_matrix(self, candidates):
+        """
+        候选与全部 OS alpha 的相关系数矩阵。
+
+        Args:
+            candidates: 候选收益率（Series 或以候选 id 为列的 DataFrame）
+
+        Returns:
+            (corr, valid): corr 形状为 (OS alpha 数, 有效候选数)，无法计算的位置为 NaN；
+                valid 标记哪些候选的标准差有效
+        """
+        y, y_mask, valid = self._align(candidates)
+        n = len(self.alpha_ids)
+        if n == 0 or y.shape[1] == 0:
+            return np.full((n, y.shape[1]), np.nan), valid
+
+        if self.dense and y_mask.all():
+            y_norms = np.linalg.norm(y, axis=0)
+            return self.unit.T @ (y / y_norms), valid
+
+        if self.dense:
+            x = self.unit * self.norms
+            stacked = np.hstack([x, np.ones_like(x), x ** 2])
+        else:
+            stacked = self.stacked
+        k = y.shape[1]
+        rhs = np.empty((y.shape[0], 3 * k))
+        rhs[:, :k] = y
+        rhs[:, k:2 * k] = y_mask
+        rhs[:, 2 * k:] = y ** 2
+        sums = stacked.T @ rhs
+
+        s_xy = sums[:n, :k]
+        s_x = sums[:n, k:2 * k]
+        s_y = sums[n:2 * n, :k]
+        count = sums[n:2 * n, k:2 * k]
+        s_yy = sums[n:2 * n, 2 * k:]
+        s_xx = sums[2 * n:, k:2 * k]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (count * s_xx - s_x ** 2) * (count * s_yy - s_y ** 2)
+            corr = (count * s_xy - s_x * s_y) / np.sqrt(var)
+        corr[(count < 2) | ~(var > 0)] = np.nan
+        return corr, valid
+
+    def max_corr(self, candidates):
+        """
+        每个候选的最大相关系数及对应的 OS alpha。
+
+        Returns:
+            list: 与候选列顺序一致的 (最大相关系数, alpha_id)；无法计算时为 (0.0, None)
+        """
+        corr, valid = self.corr_matrix(candidates)
+        results = [(0.0, None)] * len(valid)
+        columns = np.flatnonzero(valid)
+        if corr.shape[0] == 0:
+            return results
+        scores = np.where(np.isnan(corr), -np.inf, corr)
+        best = scores.argmax(axis=0)
+        for position, column, row in zip(range(len(columns)), columns, best):
+            value = scores[row, position]
+            if np.isfinite(value):
+                results[column] = (float(value), self.alpha_ids[row])
+        return results
+
+
+_region_engines = {}
+
+
+def region_engine(os_alpha_rets, os_alpha_ids, region):
+    """
+    取某区域的引擎；同一份 os_alpha_rets 上只构建一次。
+
+    Args:
+        os_alpha_rets: load_data 返回的收益率 DataFrame
+        os_alpha_ids: load_data 返回的 {region: [alpha_id]} 映射
+        region: 区域代码
+    """
+    ids = list(os_alpha_ids.get(region) or [])
+    cached = _region_engines.get(region)
+    if cached is not None and cached[0] is os_alpha_rets and cached[1] == ids:
+        return cached[2]
+    engine = SelfCorrEngine(os_alpha_rets[ids])
+    _region_engines[region] = (os_alpha_rets, ids, engine)
+    return engine
@@ -0,0 +1,508 @@
+"""
+FASTEXPR 表达式解析与规范化
+
+把表达式字符串解析成以元组表示的语法树，再按固定规则改写成规范形式：
+    - 去掉所有多余空白，关键字参数按名字排序，字符串参数统一用双引号、逗号两侧不留空格
+    - 符号折叠：reverse(x) → -x，-(-x) → x，-(数字) → 负数字面量，abs(-x) → abs(x)
+    - 幂等操作符只保留一层：rank(rank(x)) → rank(x) 等
+    - 一元负号结合得比 ^ 松：-x^2 → -(x^2)，(-x)^2 保持不变，两者不会被判为重复
+    - 交换律操作符（add/multiply/max/min、+、*）的参数排序
+
+规范形式只用于判重（哈希键），提交给平台的仍是原始表达式。
+
+ExpressionValidator 在提交前离线检查参数个数与参数类型（数据 / 分组 / VECTOR 字段），
+能修复的（漏写权重的 group_mean、未经 vec_* 的 VECTOR 字段）直接修复，其余丢弃并按来源计数。
+
+语法树节点:
+    ('num', text) ('name', text) ('str', text)
+    ('neg', x) ('not', x) ('bin', op, left, right) ('cond', test, a, b)
+    ('call', name, (位置参数...), ((关键字, 值), ...))
+    ('assign', name, x) ('seq', (语句...))
+"""
+import hashlib
+import re
+from collections import Counter, defaultdict
+
+from operators_config_full import PARAM_0, PARAM_1, PARAM_2, PARAM_3, PARAM_4, SPECIAL, GROUP_FIELDS
+
+# 操作符 → 参数个数（取自 operators_config_full）
+ARITY = {op: n for n, ops in enumerate([PARAM_0, PARAM_1, PARAM_2, PARAM_3, PARAM_4]) for op in ops}
+
+# f(f(x)) == f(x) 的单参数操作符
+# （只在内外两层都只有一个参数、没有命名参数时折叠：round_down(round_down(x, 0.5)) 不等于 round_down(x, 0.5)）
+IDEMPOTENT = {'rank', 'zscore', 'scale', 'normalize', 'sign', 'abs', 'densify', 'round', 'round_down',
+              'pasteurize', 'purify'} & set(PARAM_1)
+
+# 参数顺序无关的操作符
+COMMUTATIVE = {'add', 'multiply', 'max', 'min', '+', '*', '==', '!=', '&&', '||', 'and', 'or'}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+      | (?P<str>"[^"]*"|'[^']*')
+      | (?P<op>==|!=|>=|<=|&&|\|\||[-+*/^<>(),=?:!;])
+    )''', re.VERBOSE)
+
+# 二元运算符优先级（数值越大结合越紧）
+_BINARY = {'||': 1, '&&': 2, '==': 3, '!=': 3, '<': 3, '>': 3, '<=': 3, '>=': 3,
+           '+': 4, '-': 4, '*': 5, '/': 5, '^': 6}
+
+
+class ParseError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise ParseError('无法识别的字符: %r' % expression[pos:pos + 10])
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        token = self.peek()
+        if token[0] is None:
+            raise ParseError('表达式不完整')
+        if value is not None and token[1] != value:
+            raise ParseError('期望 %r，实际 %r' % (value, token[1]))
+        self.pos += 1
+        return token
+
+    def program(self):
+        statements = []
+        while self.peek()[0] is not None:
+            if self.peek()[1] == ';':
+                self.take(';')
+                continue
+            if self.peek()[0] == 'name' and self.peek(1)[1] == '=':
+                name = self.take()[1]
+                self.take('=')
+                statements.append(('assign', name, self.expression()))
+            else:
+                statements.append(self.expression())
+            if self.peek()[0] is not None:
+                self.take(';')
+        if not statements:
+            raise ParseError('空表达式')
+        return statements[0] if len(statements) == 1 else ('seq', tuple(statements))
+
+    def expression(self):
+        test = self.binary(1)
+        if self.peek()[1] == '?':
+            self.take('?')
+            a = self.expression()
+            self.take(':')
+            b = self.expression()
+            return ('cond', test, a, b)
+        return test
+
+    def binary(self, min_prec):
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            prec = _BINARY.get(value) if kind == 'op' else None
+            if prec is None or prec < min_prec:
+                return left
+            self.take()
+            right = self.binary(prec + 1)
+            left = ('bin', value, left, right)
+
+    def unary(self):
+        kind, value = self.peek()
+        # 正负号的操作数包括其后的 ^：-x^2 是 -(x^2)
+        if value == '-':
+            self.take()
+            return ('neg', self.binary(_BINARY['^']))
+        if value == '+':
+            self.take()
+            return self.binary(_BINARY['^'])
+        if value == '!':
+            self.take()
+            return ('not', self.unary())
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'num':
+            return ('num', value)
+        if kind == 'str':
+            return ('str', value)
+        if kind == 'name':
+            if self.peek()[1] == '(':
+                return self.call(value)
+            return ('name', value)
+        if value == '(':
+            node = self.expression()
+            self.take(')')
+            return node
+        raise ParseError('意外的符号 %r' % value)
+
+    def call(self, name):
+        self.take('(')
+        args, kwargs = [], []
+        while self.peek()[1] != ')':
+            if self.peek()[0] == 'name' and self.peek(1)[1] == '=':
+                key = self.take()[1]
+                self.take('=')
+                kwargs.append((key, self.expression()))
+            else:
+                args.append(self.expression())
+            if self.peek()[1] != ')':
+                self.take(',')
+        self.take(')')
+        return ('call', name, tuple(args), tuple(kwargs))
+
+
+def parse(expression):
+    """解析表达式，失败时抛出 ParseError"""
+    parser = _Parser(tokenize(expression))
+    node = parser.program()
+    if parser.peek()[0] is not None:
+        raise ParseError('多余的内容: %r' % parser.peek()[1])
+    return node
+
+
+def _number(text):
+    value = float(text)
+    return str(int(value)) if value.is_integer() and 'e' not in text.lower() and abs(value) < 1e15 else repr(value)
+
+
+def _negate(node):
+    """对已规范化的节点取负并折叠"""
+    if node[0] == 'neg':
+        return node[1]
+    if node[0] == 'num':
+        text = node[1]
+        return ('num', text[1:] if text.startswith('-') else '-' + text) if text not in ('0', '-0') else ('num', '0')
+    return ('neg', node)
+
+
+def normalize(node):
+    """返回规范化后的语法树"""
+    kind = node[0]
+    if kind == 'num':
+        return ('num', _number(node[1]))
+    if kind == 'str':
+        inner = re.sub(r'\s*,\s*', ',', node[1][1:-1].strip())
+        return ('str', '"%s"' % inner)
+    if kind == 'name':
+        return node
+    if kind == 'neg':
+        return _negate(normalize(node[1]))
+    if kind == 'not':
+        return ('not', normalize(node[1]))
+    if kind == 'cond':
+        return ('cond',) + tuple(normalize(child) for child in node[1:])
+    if kind == 'assign':
+        return ('assign', node[1], normalize(node[2]))
+    if kind == 'seq':
+        return ('seq', tuple(normalize(child) for child in node[1]))
+    if kind == 'bin':
+        op, left, right = node[1], normalize(node[2]), normalize(node[3])
+        if op == '-' and right[0] == 'neg':
+            op, right = '+', right[1]
+        if op in COMMUTATIVE:
+            left, right = sorted((left, right), key=to_string)
+        return ('bin', op, left, right)
+
+    # call
+    name = node[1]
+    args = tuple(normalize(arg) for arg in node[2])
+    kwargs = tuple(sorted((key, normalize(value)) for key, value in node[3]))
+    if name == 'reverse' and len(args) == 1 and not kwargs:
+        return _negate(args[0])
+    if not kwargs and len(args) == 1:
+        inner = args[0]
+        if name == 'abs' and inner[0] == 'neg':
+            inner = inner[1]
+        if name in IDEMPOTENT and inner[0] == 'call' and inner[1] == name and len(inner[2]) == 1 and not inner[3]:
+            return inner
+        args = (inner,)
+    if name in COMMUTATIVE and not kwargs:
+        args = tuple(sorted(args, key=to_string))
+    return ('call', name, args, kwargs)
+
+
+def _wrap(node):
+    text = to_string(node)
+    return '(%s)' % text if node[0] in ('bin', 'cond', 'neg') else text
+
+
+def to_string(node):
+    """把语法树输出为紧凑的表达式字符串"""
+    kind = node[0]
+    if kind in ('num', 'name', 'str'):
+        return node[1]
+    if kind == 'neg':
+        return '-' + _wrap(node[1])
+    if kind == 'not':
+        return '!' + _wrap(node[1])
+    if kind == 'bin':
+        return '%s%s%s' % (_wrap(node[2]), node[1], _wrap(node[3]))
+    if kind == 'cond':
+        return '%s?%s:%s' % tuple(_wrap(child) for child in node[1:])
+    if kind == 'assign':
+        return '%s=%s' % (node[1], to_string(node[2]))
+    if kind == 'seq':
+        return ';'.join(to_string(child) for child in node[1])
+    parts = [to_string(arg) for arg in node[2]] + ['%s=%s' % (key, to_string(value)) for key, value in node[3]]
+    return '%s(%s)' % (node[1], ','.join(parts))
+
+
+def canonical(expression):
+    """表达式的规范形式；无法解析时退化为去掉空白的原串"""
+    try:
+        return to_string(normalize(parse(expression)))
+    except ParseError:
+        return re.sub(r'\s+', '', expression)
+
+
+def dedupe(expressions, label='表达式'):
+    """
+    按规范形式的哈希去重，逐个产出第一次出现的原始表达式（生成器）。
+
+    只保存16字节摘要，流式处理几十万条表达式时内存也很小。
+    expressions 里的元素也可以是 (表达式, ...) 元组，按第一个元素判重。
+    """
+    seen = set()
+    dropped = 0
+    for item in expressions:
+        expression = item[0] if isinstance(item, tuple) else item
+        digest = hashlib.blake2b(canonical(expression).encode('utf-8'), digest_size=16).digest()
+        if digest in seen:
+            dropped += 1
+            continue
+        seen.add(digest)
+        yield item
+    print(f"  ✓ {label}去重: 保留 {len(seen)} | 丢弃重复 {dropped}")
+
+
+# ==================== 签名校验 ====================
+
+# 已知的分组字段（其余未知名字按"任意类型"处理）
+KNOWN_GROUPS = {'market', 'sector', 'industry', 'subindustry', 'country', 'exchange'} | set(GROUP_FIELDS)
+
+# 分组参数所在的位置参数下标
+GROUP_ARG = {op: 1 for op in PARAM_2 if op.startswith('group_')}
+GROUP_ARG.update({'group_mean': 2, 'group_extra': 2, 'group_vector_neut': 2, 'group_backfill': 1})
+
+# 结果是分组的操作符
+GROUP_RESULT = {'bucket', 'group_cartesian_product'}
+
+# 严格只接受一个位置参数的操作符（其余操作符允许附加的可选位置参数）
+STRICT_UNARY = {'abs', 'arc_tan', 'inverse', 'is_nan', 'is_not_finite', 'log', 'not', 'reverse', 's_log_1p',
+                'sigmoid', 'sign', 'sqrt', 'tanh', 'to_nan', 'densify', 'purify', 'pasteurize'}
+
+# 不按配置表检查参数个数的操作符
+_FREE_ARITY = set(PARAM_0) | set(SPECIAL)
+
+# 接受任意多个（至少2个）位置参数的操作符，配置表里的参数个数对它们不适用
+VARIADIC = {'min', 'max', 'add', 'multiply'}
+
+
+class _Invalid(Exception):
+    pass
+
+
+def _check(node, vector_fields):
+    """返回节点类型: 'group' / 'vector' / 'data' / 'const' / 'any'，不合法时抛出 _Invalid"""
+    kind = node[0]
+    if kind in ('num', 'str'):
+        return 'const'
+    if kind == 'name':
+        if node[1] in KNOWN_GROUPS:
+            return 'group'
+        if node[1] in vector_fields:
+            return 'vector'
+        return 'any'
+    if kind == 'assign':
+        return _check(node[2], vector_fields)
+    if kind == 'seq':
+        types = [_check(child, vector_fields) for child in node[1]]
+        return types[-1]
+    if kind in ('neg', 'not', 'bin', 'cond'):
+        children = node[1:] if kind in ('neg', 'not', 'cond') else node[2:]
+        for child in children:
+            _data_arg(child, vector_fields, kind)
+        return 'data'
+
+    name, args, kwargs = node[1], node[2], node[3]
+    if name not in ARITY:
+        raise _Invalid('未知操作符 %s' % name)
+    if name in VARIADIC:
+        if len(args) < 2:
+            raise _Invalid('%s 至少需要 2 个参数，实际 %d' % (name, len(args)))
+    elif name not in _FREE_ARITY:
+        if len(args) < ARITY[name]:
+            raise _Invalid('%s 需要 %d 个参数，实际 %d' % (name, ARITY[name], len(args)))
+        if name in STRICT_UNARY and len(args) > 1:
+            raise _Invalid('%s 只接受 1 个参数' % name)
+    for _, value in kwargs:
+        _check(value, vector_fields)
+
+    if name.startswith('vec_'):
+        for arg in args:
+            if _check(arg, vector_fields) not in ('vector', 'any'):
+                raise _Invalid('%s 的参数不是 VECTOR 字段' % name)
+        return 'data'
+    if name == 'densify':
+        arg_type = _check(args[0], vector_fields)
+        if arg_type == 'vector':
+            raise _Invalid('VECTOR 字段需要先经过 vec_* 操作符')
+        return arg_type
+    if name == 'group_cartesian_product':
+        for arg in args:
+            if _check(arg, vector_fields) not in ('group', 'any'):
+                raise _Invalid('group_cartesian_product 的参数必须是分组')
+        return 'group'
+
+    group_index = GROUP_ARG.get(name)
+    for i, arg in enumerate(args):
+        if i == group_index:
+            if _check(arg, vector_fields) not in ('group', 'any'):
+                raise _Invalid('%s 的第 %d 个参数必须是分组' % (name, i + 1))
+        else:
+            _data_arg(arg, vector_fields, name)
+    return 'group' if name in GROUP_RESULT else 'data'
+
+
+def _data_arg(node, vector_fields, owner):
+    arg_type = _check(node, vector_fields)
+    if arg_type == 'group':
+        raise _Invalid('分组表达式不能作为 %s 的数据参数' % owner)
+    if arg_type == 'vector':
+        raise _Invalid('VECTOR 字段需要先经过 vec_* 操作符才能用于 %s' % owner)
+
+
+def _repair(node, vector_fields):
+    """修复可以自动修复的问题，返回新的语法树"""
+    kind = node[0]
+    if kind == 'name':
+        return node
+    if kind in ('num', 'str'):
+        return node
+    if kind in ('neg', 'not'):
+        return (kind, _repair(node[1], vector_fields))
+    if kind == 'bin':
+        return ('bin', node[1], _repair(node[2], vector_fields), _repair(node[3], vector_fields))
+    if kind == 'cond':
+        return ('cond',) + tuple(_repair(child, vector_fields) for child in node[1:])
+    if kind == 'assign':
+        return ('assign', node[1], _repair(node[2], vector_fields))
+    if kind == 'seq':
+        return ('seq', tuple(_repair(child, vector_fields) for child in node[1]))
+
+    name = node[1]
+    args = []
+    for arg in node[2]:
+        arg = _repair(arg, vector_fields)
+        # 未经 vec_* 的 VECTOR 字段：用 vec_avg 聚合
+        if arg[0] == 'name' and arg[1] in vector_fields and not name.startswith('vec_'):
+            arg = ('call', 'vec_avg', (arg,), ())
+        args.append(arg)
+    # group_mean(x, group) 漏写权重：补上等权 1
+    if name == 'group_mean' and len(args) == 2:
+        args.insert(1, ('num', '1'))
+    kwargs = tuple((key, _repair(value, vector_fields)) for key, value in node[3])
+    return ('call', name, tuple(args), kwargs)
+
+
+class ExpressionValidator:
+    """
+    提交前的表达式校验器。
+
+    Args:
+        vector_fields: VECTOR 类型字段名集合（这些字段必须先经过 vec_* 操作符）
+
+    Example:
+        validator = ExpressionValidator(fields if DATA_TYPE == 'VECTOR' else ())
+        for expr in validator.filter(generator_method(), '_generate_ts_operators'):
+            ...
+        validator.report()
+    """
+
+    def __init__(self, vector_fields=()):
+        self.vector_fields = set(vector_fields)
+        self.kept = Counter()
+        self.fixed = Counter()
+        self.rejected = Counter()
+        self.reasons = defaultdict(Counter)
+
+    def check(self, expression):
+        """
+        Returns:
+            (expression, error): 合法时 error 为 None，expression 可能是修复后的表达式；
+            不合法时 expression 为 None
+        """
+        try:
+            node = parse(expression)
+        except ParseError as e:
+            return None, '语法错误: %s' % e
+        repaired = _repair(node, self.vector_fields)
+        try:
+            result = _check(repaired, self.vector_fields)
+        except _Invalid as e:
+            return None, str(e)
+        if result == 'group':
+            return None, '分组表达式不能直接作为 alpha'
+        if result == 'vector':
+            return None, 'VECTOR 字段不能直接作为 alpha'
+        if repaired != node:
+            return to_string(repaired), None
+        return expression, None
+
+    def filter(self, expressions, label=None, title=None):
+        """
+        逐个产出合法（或已修复）的表达式（生成器）。
+
+        Args:
+            expressions: 表达式流
+            label: 统计用的来源名；为 None 时按表达式最外层操作符分组统计
+            title: 不为 None 时，表达式流结束后打印统计
+        """
+        for expression in expressions:
+            source = label or _outer_op(expression)
+            checked, error = self.check(expression)
+            if error is not None:
+                self.rejected[source] += 1
+                self.reasons[source][error] += 1
+                continue
+            if checked != expression:
+                self.fixed[source] += 1
+            self.kept[source] += 1
+            yield checked
+        if title is not None:
+            self.report(title)
+
+    def report(self, title='表达式校验'):
+        """打印各来源的保留 / 修复 / 丢弃数量"""
+        sources = sorted(set(self.kept) | set(self.rejected))
+        print(f"  {title}: 保留 {sum(self.kept.values())} | 修复 {sum(self.fixed.values())} | "
+              f"丢弃 {sum(self.rejected.values())}")
+        for source in sources:
+            if self.rejected[source] or self.fixed[source]:
+                top_reason = self.reasons[source].most_common(1)
+                print(f"    {source}: 保留 {self.kept[source]} 修复 {self.fixed[source]} 丢弃 {self.rejected[source]}"
+                      + (f" ({top_reason[0][0]})" if top_reason else ''))
+
+
+def _outer_op(expression):
+    match = re.match(r'\s*-?\s*([A-Za-z_][A-Za-z0-9_]*)\s*\(', expression)
+    return match.group(1) if match else '(field)'
@@ -8,7 +8,7 @@ import json
 import pandas as pd
 import random
 import pickle
-from itertools import product
+from itertools import product, islice, chain
 from itertools import combinations
 from collections import defaultdict
 import pickle
@@ -17,6 +17,18 @@ from dateutil.relativedelta import relativedelta
 import numpy as np
 import os
 
+from account_pool import get_account_pool
+from alpha_catalog import AlphaCatalog
+from brain_async import API_URL, run_many, run_paged, run_sync
+from check_pipeline import FAIL, LOGGED_OUT, CheckPipeline, check_alphas
+from fastexpr import ExpressionValidator, canonical, dedupe
+from metrics import metrics
+from rate_limiter import paced_request
+from session_pool import refresh_session
+from sim_cache import CacheRecorder, SimCache
+from sim_dispatcher import SimulationDispatcher
+from sim_queue import SimQueue
+
 
 def time_it(func):
     def wrapper(*args, **kwargs):
@@ -28,6 +40,7 @@ def time_it(func):
         print('end_time')
         print(end_time)
         print(f"Function {func.__name__} took {end_time - start_time}")
+        metrics.observe_duration(func.__name__, (end_time - start_time).total_seconds())
         return result
 
     return wrapper
@@ -87,53 +100,13 @@ ops_set = basic_ops + ts_ops + group_ac_ops + group_ac_ops
 
 
 def login():
-    brain_file = os.path.join(os.path.dirname(__file__), 'brain.txt')
-
-
-    # 检查文件是否存在
-    if not os.path.exists(brain_file):
-        raise FileNotFoundError(
-            f"配置文件 {brain_file} 不存在！\n"
-            f"请在该路径创建 brain.txt 文件，内容格式为 JSON 数组：\n"
-            f'["your_username", "your_password"]\n'
-            f"用户名和密码用双引号包围，不要有额外空格或换行。\n"
-            f"例如：[\"john.doe@example.com\", \"your_password\"]"
-        )
-
-    with open(brain_file) as f:
-        credentials = json.load(f)
-
-    # Extract username and password from the list
-    username, password = credentials
-
-    # Create a session to persistently store the headers
-    s = requests.Session()
-
-    # Save credentials into session
-    s.auth = (username, password)
-
-    # Send a POST request to the /authentication API
-    response = s.post('https://api.worldquantbrain.com/authentication')
-    print(f"登录响应状态: {response.status_code}")
-    # 修复：HTTP 201 Created 也是成功的认证响应
-    if response.status_code in [200, 201]:
-        print("✅ 登录成功！")
-        # 额外验证：测试一个简单API调用
-        try:
-            test_resp = s.get('https://api.worldquantbrain.com/users/self/alphas?limit=1&offset=0')
-            print(f"   API测试响应: {test_resp.status_code}（如果为200，表示认证完全正常）")
-            if test_resp.status_code == 200:
-                test_data = test_resp.json()
-                print(f"   测试数据: {len(test_data.get('results', []))} 个alpha可用")
-            else:
-                print(f"   ⚠️  API测试警告: {test_resp.status_code} - {test_resp.text[:100]}")
-        except Exception as test_e:
-            print(f"   ⚠️  API测试异常: {test_e}")
-    else:
-        print(f"❌ 登录失败 (状态码 {response.status_code}): {response.text[:200]}")
-        print("请检查用户名和密码是否正确，或联系WorldQuant BRAIN支持")
+    """
+    默认账号（brain.txt，或 accounts.json 中的第一个账号）的已登录 Session。
 
-    return s
+    由 session_pool 统一管理：进程内只登录一次，令牌快过期或遇到 401 时自动重新认证，
+    各函数入口反复调用 login() 不再产生额外的认证请求。
+    """
+    return get_account_pool().default.session
 
 
 # def locate_alpha(s, alpha_id):
@@ -157,14 +130,7 @@ def get_prod_corr(s, alpha_id):
     and save result to dataframe
     """
 
-    while True:
-        result = s.get(
-            "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/prod"
-        )
-        if "retry-after" in result.headers:
-            time.sleep(float(result.headers["Retry-After"]))
-        else:
-            break
+    result = run_sync(s, lambda c: c.get_correlations(alpha_id, 'prod'))
     if result.json().get("records", 0) == 0:
         return pd.DataFrame()
     columns = [dct["name"] for dct in result.json()["schema"]["properties"]]
@@ -179,15 +145,7 @@ def get_self_corr(s, alpha_id):
     and save result to dataframe
     """
 
-    while True:
-
-        result = s.get(
-            "https://api.worldquantbrain.com/alphas/" + alpha_id + "/correlations/self"
-        )
-        if "retry-after" in result.headers:
-            time.sleep(float(result.headers["Retry-After"]))
-        else:
-            break
+    result = run_sync(s, lambda c: c.get_correlations(alpha_id, 'self'))
     if result.json().get("records", 0) == 0:
         return pd.DataFrame()
 
@@ -225,18 +183,11 @@ def check_self_corr_test(s, alpha_id, threshold: float = 0.7):
 
 
 def get_simulation_result_json(s, alpha_id):
-    return s.get("https://api.worldquantbrain.com/alphas/" + alpha_id).json()
+    return s.get(API_URL + "/alphas/" + alpha_id).json()
 
 
 def locate_alpha(s, alpha_id):
-    while True:
-        alpha = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id)
-        if "retry-after" in alpha.headers:
-            time.sleep(float(alpha.headers["Retry-After"]))
-        else:
-            break
-    string = alpha.content.decode('utf-8')
-    metrics = json.loads(string)
+    metrics = run_sync(s, lambda c: c.get_alpha(alpha_id)).json()
     # print(metrics["regular"]["code"])
 
     dateCreated = metrics["dateCreated"]
@@ -270,7 +221,10 @@ def set_alpha_properties(
 ):
     """
     Function changes alpha's description parameters
+
+    多账号时 PATCH 由拥有该 alpha 的账号发送
     """
+    s = get_account_pool().session_for(alpha_id, s)
 
     # 如果tags为None，则不在请求中包含tags字段（避免设置空标签）
     params = {
@@ -286,126 +240,52 @@ def set_alpha_properties(
     if tags is not None:
         params["tags"] = tags
 
-    response = s.patch(
-        "https://api.worldquantbrain.com/alphas/" + alpha_id, json=params
+    response = paced_request(
+        s, 'PATCH', API_URL + "/alphas/" + alpha_id, json=params
     )
 
 
-def check_submission(alpha_bag, gold_bag, start):
-    depot = []
+def check_submission(alpha_bag, gold_bag, start, concurrency=10):
+    """
+    并发检查 alpha_bag[start:]，通过检查的 (alpha_id, PROD_CORRELATION) 追加到 gold_bag。
+
+    Retry-After、登出重登、PC 为 NaN 等重试都在 check_pipeline 的 worker 池里处理，
+    不再修改 alpha_bag。多账号时每个 alpha 由拥有它的账号检查。
+    """
     s = login()
-    progress_summary = []  # 收集进度信息，避免频繁输出
-
-    for idx, g in enumerate(alpha_bag):
-        if idx < start:
-            continue
-        if idx % 5 == 0:
-            print(f"   检查进度: {idx}/{len(alpha_bag)} ({idx / len(alpha_bag) * 100:.1f}%)", end="\r")
-        if idx % 200 == 0:
-            s = login()
-        # print(idx)
-        pc = get_check_submission(s, g)
-        if pc == "sleep":
-            sleep(100)
-            s = login()
-            alpha_bag.append(g)
-        elif pc != pc:
-            # pc is nan
-            print(f"\n   ⚠️  check self-correlation error at {idx}")
-            sleep(100)
-            alpha_bag.append(g)
-        elif pc == "fail":
-            continue
-        elif pc == "error":
-            depot.append((g, pc, "检查错误"))  # 添加错误信息
-        else:
-            # print('g')
-            # print(g)
-            gold_bag.append((g, pc))
-
-    print()  # 换行，结束进度显示
-    # print('depot')
-    # if depot:
-    #     print(f"   错误的alpha数量: {len(depot)}")
+    accounts = get_account_pool()
+    route = (lambda alpha_id: accounts.session_for(alpha_id, s)) if len(accounts) > 1 else None
+    outcomes = check_alphas(s, alpha_bag[start:], concurrency=concurrency, relogin=refresh_session, route=route,
+                            verbose=False)
+    for outcome in outcomes:
+        if outcome.ok:
+            gold_bag.append((outcome.alpha_id, outcome.pc))
     return gold_bag
 
 
 def get_check_submission(s, alpha_id, max_retries=3):
     """
-    获取alpha的提交检查结果，包含重试逻辑
+    获取alpha的提交检查结果（单个 alpha，走同一条检查流水线）
 
     Args:
         s: session对象
         alpha_id: alpha ID
-        max_retries: 最大重试次数，默认3次
+        max_retries: 最大检查次数，默认3次
 
     Returns:
         pc: PROD_CORRELATION值（成功）
         "fail": 检查失败
         "sleep": 登出状态
-        "error": 错误（重试失败后）
+        "error": 错误（重试失败后或超时）
     """
-    for attempt in range(max_retries):
-        try:
-            # 获取检查结果（带重试等待）
-            while True:
-                result = s.get("https://api.worldquantbrain.com/alphas/" + alpha_id + "/check")
-                if "retry-after" in result.headers:
-                    time.sleep(float(result.headers["Retry-After"]))
-                else:
-                    break
-
-            # 检查是否登出
-            if result.json().get("is", 0) == 0:
-                print(f"   ⚠️  {alpha_id[:8]}: 登出状态，需要重新登录")
-                return "sleep"
-
-            # 解析检查结果
-            checks_df = pd.DataFrame(
-                result.json()["is"]["checks"]
-            )
-
-            # 获取PROD_CORRELATION值
-            pc_rows = checks_df[checks_df.name == "PROD_CORRELATION"]
-            if len(pc_rows) == 0:
-                raise ValueError("PROD_CORRELATION field not found in checks")
-
-            pc = pc_rows["value"].values[0]
-
-            # 检查是否有FAIL结果
-            if not any(checks_df["result"] == "FAIL"):
-                # 成功时不打印，减少输出（由调用者统一打印）
-                return pc
-            else:
-                # 失败时只记录简要信息（由调用者统一打印）
-                failed_checks = checks_df[checks_df["result"] == "FAIL"]
-                failed_names = ", ".join(failed_checks['name'].tolist()[:3])  # 只取前3个
-                # print(f"   ❌ {alpha_id[:8]}: 检查失败 - {failed_names}")
-                return "fail"
-
-        except KeyError as e:
-            # 数据结构错误（减少输出，只在最后一次重试失败时打印）
-            if attempt == max_retries - 1:
-                print(f"   ⚠️  {alpha_id[:8]}: 字段缺失 {str(e)}")
-                return "error"
-            time.sleep(2 ** attempt)  # 指数退避：1秒、2秒、4秒
-
-        except ValueError as e:
-            # PROD_CORRELATION字段不存在
-            if attempt == max_retries - 1:
-                print(f"   ⚠️  {alpha_id[:8]}: {str(e)}")
-                return "error"
-            time.sleep(2 ** attempt)
-
-        except Exception as e:
-            # 其他未知错误
-            if attempt == max_retries - 1:
-                error_type = type(e).__name__
-                print(f"   ⚠️  {alpha_id[:8]}: {error_type} - {str(e)[:50]}")
-                return "error"
-            time.sleep(2 ** attempt)
-
-    # 理论上不会到这里
+    s = get_account_pool().session_for(alpha_id, s)
+    outcome = CheckPipeline(s, max_attempts=max_retries, backoff=1, verbose=False).run([alpha_id])[0]
+    if outcome.ok:
+        return outcome.pc
+    if outcome.status == LOGGED_OUT:
+        return "sleep"
+    if outcome.status == FAIL:
+        return "fail"
     return "error"
 
 
@@ -426,61 +306,138 @@ def get_vec_fields(fields):
 
 @time_it
 def multi_simulate(alpha_pools, neut, region, universe, start, delay):
-    x = 0
-    s = login()
-
-    brain_api_url = 'https://api.worldquantbrain.com'
+    """
+    滑动窗口方式跑完 load_task_pool 生成的任务池。
 
-    for x, pool in enumerate(alpha_pools):
-        if x < start: continue
-        progress_urls = []
-        for y, task in enumerate(pool):
-            # 10 tasks, 10 alpha in each task
-            sim_data_list = generate_sim_data(task, region, universe, neut, delay)
-            try:
-                simulation_response = s.post('https://api.worldquantbrain.com/simulations', json=sim_data_list)
-                simulation_progress_url = simulation_response.headers['Location']
-                progress_urls.append(simulation_progress_url)
-            except:
-                print("loc key error: %s" % simulation_response.content)
-                sleep(600)
-                s = login()
-        print(progress_urls)
-        print("pool %d task %d post done" % (x, y))
-
-        for j, progress in enumerate(progress_urls):
-            try:
-                while True:
-                    simulation_progress = s.get(progress)
-                    if simulation_progress.headers.get("Retry-After", 0) == 0:
-                        break
-                    # print("Sleeping for " + simulation_progress.headers["Retry-After"] + " seconds")
-                    sleep(float(simulation_progress.headers["Retry-After"]))
-
-                status = simulation_progress.json().get("status", 0)
-                if status != "COMPLETE":
-                    print("Not complete : %s" % (progress))
-
-                """
-                #alpha_id = simulation_progress.json()["alpha"]
-                children = simulation_progress.json().get("children", 0)
-                children_list = []
-                for child in children:
-                    child_progress = s.get(brain_api_url + "/simulations/" + child)
-                    alpha_id = child_progress.json()["alpha"]
-
-                    set_alpha_properties(s,
-                            alpha_id,
-                            name = "%s"%name,
-                            color = None,)
-                """
-            except KeyError:
-                print("look into: %s" % progress)
-            except:
-                print("other")
-        print("pool %d task %d simulate done" % (x, j))
+    每个池的任务数即并发上限(CONCURRENT_SIMS)；池与池之间不再互相等待，
+    任意一个 multi-simulation 结束后立刻提交下一个任务。
+    alpha_pools 可以是列表也可以是生成器：调度器有空槽时才向下游拉取任务，表达式按需生成。
+    提交前先查本地 sim_cache，已经跑过的 (表达式, 设置) 组合直接命中，不再提交。
+    未命中的任务先写入持久化队列 sim_queue 再由调度器消费，中断后重新运行会挂接上次在途的任务。
+    """
+    cache = SimCache()
+    queue = SimQueue()
+    batch = '%s/%s/D%s/%s' % (region, universe, delay, neut)
+
+    pools = islice(iter(alpha_pools), start, None)
+    first_pool = next(pools, [])
+    concurrency = max(len(first_pool), 1)
+    pool_count = 0
+    cache_hits = 0
+
+    def cache_misses():
+        nonlocal pool_count, cache_hits
+        for pool in chain([first_pool], pools):
+            pool_count += 1
+            for task in pool:
+                misses, hits = cache.split(generate_sim_data(task, region, universe, neut, delay))
+                cache_hits += len(hits)
+                if misses:
+                    # 只剩一个子模拟时按单个 simulation 提交
+                    yield misses[0] if len(misses) == 1 else misses
+
+    stats = drain_sim_queue(queue, batch, concurrency, cache, payloads=cache_misses())
+    print("submitted %(submitted)d complete %(complete)d error %(error)d rejected %(rejected)d" % stats)
+    print("cache hits %d | queue %s: %s" % (cache_hits, batch, queue.counts(batch)))
+    queue.close()
+    cache.close()
     print("Simulate done")
-    return x
+    return max(pool_count - 1, 0)
+
+
+def drain_sim_queue(queue, batch, concurrency, cache=None, payloads=()):
+    """
+    消费持久化队列中某个批次的任务：先挂接上次已提交未结束的进度URL，
+    再补跑队列里上次遗留的 pending 任务，然后边入队边提交 payloads。
+    配置了多个账号（见 account_pool）时任务分摊到各账号，结果 alpha 记在提交它的账号名下。
+
+    Args:
+        queue: SimQueue
+        batch: 批次名
+        concurrency: 每个账号同时在途的 simulation 数（accounts.json 里单独配置的账号以配置为准）
+        cache: 可选的 SimCache，完成后写入结果
+        payloads: 新任务的载荷流（可以是生成器）
+
+    Returns:
+        dict: 调度器统计
+    """
+    return run_sim_queue(queue, [batch], concurrency, queue_tasks(queue, batch, payloads), cache)
+
+
+def queue_tasks(queue, batch, payloads=()):
+    """
+    某个批次的待提交任务流 (task_id, payload)：先产出队列里上次遗留的 pending 任务，再边入队边产出 payloads，
+    同一个任务只产出一次。
+    """
+    seen = set()
+    for task in chain(queue.pending(batch), queue.feed(batch, payloads)):
+        if task[0] not in seen:
+            seen.add(task[0])
+            yield task
+
+
+def run_sim_queue(queue, batches, concurrency, tasks, cache=None, on_submit=None, on_complete=None):
+    """
+    用一个调度器跑完队列任务：先挂接 batches 中上次已提交未结束的进度URL，再在有空槽时从 tasks 拉取新任务。
+
+    Args:
+        queue: SimQueue
+        batches: 需要挂接在途任务的批次名列表
+        concurrency: 每个账号同时在途的 simulation 数
+        tasks: (task_id, payload) 流，可以是多个批次的 queue_tasks 合并而成
+        cache: 可选的 SimCache，完成后由后台线程写入结果（见 sim_cache.CacheRecorder），
+            写完才把队列里的任务标为 complete，中途退出时下次运行会重新挂接并补写
+        on_submit: 额外的提交回调 on_submit(task_id, progress_url)，挂接的在途任务不会触发
+        on_complete: 额外的结束回调 on_complete(task_id, progress_json)
+
+    Returns:
+        dict: 调度器统计
+    """
+    accounts = get_account_pool()
+    resume = [(url, (task_id, payload), account)
+              for batch in batches for task_id, url, payload, account in queue.in_flight(batch)]
+    if resume:
+        print("🔁 挂接上次在途任务 %d 个" % len(resume))
+    recorder = CacheRecorder(cache.path) if cache is not None else None
+
+    def recorded(task_id, account):
+        def _done(alpha_ids):
+            accounts.claim(alpha_ids, account)
+            queue.mark_complete(task_id, alpha_ids)
+        return _done
+
+    def submitted(task, progress_url):
+        queue.mark_submitted(task[0], progress_url, dispatcher.account_for(progress_url))
+        if on_submit is not None:
+            on_submit(task[0], progress_url)
+
+    def completed(task, progress_url, progress):
+        task_id, payload = task
+        if progress.get('status') != 'COMPLETE':
+            queue.mark_failed(task_id, progress.get('status', 'UNKNOWN'))
+        else:
+            payloads = payload if isinstance(payload, list) else [payload]
+            done = recorded(task_id, dispatcher.account_for(progress_url))
+            if recorder is not None:
+                # 取子模拟和 alpha 详情要两轮请求，交给后台线程，调度器立即继续轮询和补位
+                recorder.submit(dispatcher.session_for(progress_url), payloads, progress, done)
+            else:
+                done([])
+        if on_complete is not None:
+            on_complete(task_id, progress)
+
+    dispatcher = SimulationDispatcher(
+        None, concurrency, accounts=list(accounts),
+        on_submit=submitted,
+        on_complete=completed,
+        # 被拒绝的是 4xx 校验失败的载荷，重跑也不会通过；模拟结果非 COMPLETE 的由 mark_failed 退回重跑
+        on_reject=lambda task, text: queue.mark_failed(task[0], text, retry=False),
+    )
+    try:
+        return dispatcher.run(tasks, lambda task: task[1], resume=resume)
+    finally:
+        if recorder is not None:
+            recorder.close()
 
 
 def generate_sim_data(alpha_list, region, uni, neut, delay):
@@ -514,19 +471,97 @@ def generate_sim_data(alpha_list, region, uni, neut, delay):
 def load_task_pool(alpha_list, limit_of_children_simulations, limit_of_multi_simulations):
     '''
     Input:
-        alpha_list : list of (alpha, decay) tuples
+        alpha_list : iterable of (alpha, decay) tuples (list or generator)
         limit_of_multi_simulations : number of children simulation in a multi-simulation
         limit_of_multi_simulations : number of simultaneous multi-simulations
-    Output:
+    Output (generator, pools are built lazily):
         task : [10 * (alpha, decay)] for a multi-simulation
         pool : [10 * [10 * (alpha, decay)]] for simultaneous multi-simulations
-        pools : [[10 * [10 * (alpha, decay)]]]
+        pools : yields pool one by one
 
     '''
-    tasks = [alpha_list[i:i + limit_of_children_simulations] for i in
-             range(0, len(alpha_list), limit_of_children_simulations)]
-    pools = [tasks[i:i + limit_of_multi_simulations] for i in range(0, len(tasks), limit_of_multi_simulations)]
-    return pools
+    alpha_iter = iter(alpha_list)
+    tasks = iter(lambda: list(islice(alpha_iter, limit_of_children_simulations)), [])
+    yield from iter(lambda: list(islice(tasks, limit_of_multi_simulations)), [])
+
+
+def shuffled(items, buffer_size=10000, rng=random):
+    '''
+    流式打乱：维护一个 buffer_size 大小的缓冲区，每次随机弹出一个，
+    不需要先把整个表达式流物化成列表。buffer_size 不小于总数时等价于 random.shuffle。
+    '''
+    buffer = []
+    for item in items:
+        buffer.append(item)
+        if len(buffer) >= buffer_size:
+            i = rng.randrange(len(buffer))
+            buffer[i], buffer[-1] = buffer[-1], buffer[i]
+            yield buffer.pop()
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+# 数据集/数据字段元数据的本地缓存：键为 (instrumentType, region, delay, universe, dataset_id, search)，
+# 未过期时直接读本地，不发请求；过期后先只取一条比对 count，没变化就续期，变了才整表重新获取。
+METADATA_CACHE = environ.get('BRAIN_META_CACHE', 'metadata_cache.db')
+METADATA_TTL = float(environ.get('BRAIN_META_TTL', 24 * 3600))
+
+
+def _metadata_conn():
+    import sqlite3
+    conn = sqlite3.connect(METADATA_CACHE, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS metadata ('
+        ' key TEXT PRIMARY KEY,'
+        ' count INTEGER,'
+        ' results TEXT,'
+        ' fetched REAL)'
+    )
+    return conn
+
+
+def cached_listing(s, key, url, limit=50, count=None, ttl=None):
+    """
+    带 TTL 的分页列表缓存。
+
+    Args:
+        s: 已登录的 requests.Session
+        key: 缓存键（元组）
+        url: 不带 limit/offset 的接口URL
+        limit, count: 传给 run_paged
+        ttl: 过期秒数，默认 METADATA_TTL；0 表示强制刷新
+
+    Returns:
+        list: results
+    """
+    ttl = METADATA_TTL if ttl is None else ttl
+    key = json.dumps(key)
+    conn = _metadata_conn()
+    try:
+        row = conn.execute('SELECT count, results, fetched FROM metadata WHERE key = ?', (key,)).fetchone()
+        if row is not None and time.time() - row[2] < ttl:
+            return json.loads(row[1])
+
+        if row is not None and ttl > 0:
+            # 条件刷新：只取一条看 count 是否变化
+            try:
+                separator = '&' if '?' in url else '?'
+                probe = paced_request(s, 'GET', f"{url}{separator}limit=1&offset=0", timeout=30)
+                if probe.status_code < 400 and probe.json().get('count') == row[0]:
+                    with conn:
+                        conn.execute('UPDATE metadata SET fetched = ? WHERE key = ?', (time.time(), key))
+                    return json.loads(row[1])
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠️ 元数据刷新失败，继续使用过期缓存: {e}")
+                return json.loads(row[1])
+
+        results = run_paged(s, url, limit=limit, count=count)
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)',
+                         (key, len(results) if count is None else None, json.dumps(results), time.time()))
+        return results
+    finally:
+        conn.close()
 
 
 def get_datasets(
@@ -536,10 +571,10 @@ def get_datasets(
         delay: int = 1,
         universe: str = 'TOP3000'
 ):
-    url = "https://api.worldquantbrain.com/data-sets?" + \
+    url = API_URL + "/data-sets?" + \
           f"instrumentType={instrument_type}&region={region}&delay={str(delay)}&universe={universe}"
-    result = s.get(url)
-    datasets_df = pd.DataFrame(result.json()['results'])
+    key = ('data-sets', instrument_type, region, str(delay), universe)
+    datasets_df = pd.DataFrame(cached_listing(s, key, url, limit=50))
     return datasets_df
 
 
@@ -552,29 +587,21 @@ def get_datafields(
         dataset_id: str = '',
         search: str = ''
 ):
+    # 第一页拿到 count 后，其余页并发获取，按 offset 顺序拼接；结果在本地缓存 METADATA_TTL 秒
     if len(search) == 0:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}&limit=50" + \
-                       "&offset={x}"
-        count = s.get(url_template.format(x=0)).json()['count']
-
+        url = API_URL + "/data-fields?" + \
+              f"&instrumentType={instrument_type}" + \
+              f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}"
+        count = None
     else:
-        url_template = "https://api.worldquantbrain.com/data-fields?" + \
-                       f"&instrumentType={instrument_type}" + \
-                       f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" + \
-                       f"&search={search}" + \
-                       "&offset={x}"
+        url = API_URL + "/data-fields?" + \
+              f"&instrumentType={instrument_type}" + \
+              f"&region={region}&delay={str(delay)}&universe={universe}" + \
+              f"&search={search}"
         count = 100
 
-    datafields_list = []
-    for x in range(0, count, 50):
-        datafields = s.get(url_template.format(x=x))
-        datafields_list.append(datafields.json()['results'])
-
-    datafields_list_flat = [item for sublist in datafields_list for item in sublist]
-
-    datafields_df = pd.DataFrame(datafields_list_flat)
+    key = ('data-fields', instrument_type, region, str(delay), universe, dataset_id, search)
+    datafields_df = pd.DataFrame(cached_listing(s, key, url, limit=50, count=count))
     return datafields_df
 
 
@@ -620,428 +647,248 @@ def view_alphas(gold_bag):
         print(i)
 
 
-def get_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage):
-    s = login()
-    output = []
-    # 3E large 3C less
-    count = 0
-    for i in range(0, alpha_num, 100):
-        print(i)
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(sharpe_th) + "&settings.region=" + region + "&order=-is.sharpe&hidden=false&type!=SUPER"
-        print('url_e')
-        print(url_e)
-        url_c = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3C-" + str(fitness_th) + "&is.sharpe%3C-" \
-                + str(sharpe_th) + "&settings.region=" + region + "&order=is.sharpe&hidden=false&type!=SUPER"
-        print('url_c')
-        print(url_c)
-        urls = [url_e]
-        if usage != "submit":
-            urls.append(url_c)
-        for url in urls:
-            response = s.get(url)
-            # print(response.json())
-            try:
-                alpha_list = response.json()["results"]
-                # print(response.json())
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-                    # if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s" % exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(rec)
-                        if turnover > 0.7:
-                            rec.append(decay * 4)
-                        elif turnover > 0.6:
-                            rec.append(decay * 3 + 3)
-                        elif turnover > 0.5:
-                            rec.append(decay * 3)
-                        elif turnover > 0.4:
-                            rec.append(decay * 2)
-                        elif turnover > 0.35:
-                            rec.append(decay + 4)
-                        elif turnover > 0.3:
-                            rec.append(decay + 2)
-                        output.append(rec)
-            except:
-                print("%d finished re-login" % i)
-                s = login()
+class AlphaFilter:
+    """
+    /users/self/alphas 的查询条件。
 
-    print("count: %d" % count)
-    return output
+    Args:
+        start_date, end_date: 'MM-DD'，按 2025 年的 dateCreated 区间筛选
+        sharpe_th, fitness_th: IS sharpe / fitness 阈值
+        region: 地区
+        super_alpha: True 只取 SuperAlpha，False 排除 SuperAlpha
+        color: 只取该颜色；exclude_color: 排除该颜色
+        negative: True 时取 sharpe/fitness 都低于负阈值的 alpha（用于取反）
+        order: 排序，默认正向按 sharpe 降序、负向按 sharpe 升序
+    """
 
+    def __init__(self, start_date, end_date, sharpe_th, fitness_th, region, super_alpha=False,
+                 color=None, exclude_color=None, negative=False, order=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.sharpe_th = sharpe_th
+        self.fitness_th = fitness_th
+        self.region = region
+        self.super_alpha = super_alpha
+        self.color = color
+        self.exclude_color = exclude_color
+        self.negative = negative
+        self.order = order or ('is.sharpe' if negative else '-is.sharpe')
+
+    def negated(self):
+        """同样条件下 sharpe/fitness 取负阈值的查询"""
+        return AlphaFilter(self.start_date, self.end_date, self.sharpe_th, self.fitness_th, self.region,
+                           self.super_alpha, self.color, self.exclude_color, negative=True)
+
+    def catalog_query(self):
+        """同样条件在本地 AlphaCatalog.select 上的参数"""
+        query = {
+            'region': self.region,
+            'super_alpha': self.super_alpha,
+            'colors': (self.color,) if self.color else (),
+            'exclude_colors': (self.exclude_color,) if self.exclude_color else (),
+            'created_from': "2025-" + self.start_date + "T00:00:00-04:00",
+            'created_to': "2025-" + self.end_date + "T00:00:00-04:00",
+            'order': self.order.replace('is.', ''),
+        }
+        if self.negative:
+            query.update(max_sharpe=-self.sharpe_th, max_fitness=-self.fitness_th)
+        else:
+            query.update(min_sharpe=self.sharpe_th, min_fitness=self.fitness_th)
+        return query
 
-def get_super_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage):
-    s = login()
+    def url(self):
+        """不带 limit/offset 的查询URL"""
+        if self.negative:
+            metrics = "&is.fitness%3C-" + str(self.fitness_th) + "&is.sharpe%3C-" + str(self.sharpe_th)
+        else:
+            metrics = "&is.fitness%3E" + str(self.fitness_th) + "&is.sharpe%3E" + str(self.sharpe_th)
+        url = API_URL + "/users/self/alphas?" \
+              + "status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + self.start_date \
+              + "T00:00:00-04:00&dateCreated%3C2025-" + self.end_date \
+              + "T00:00:00-04:00" + metrics + "&settings.region=" + self.region
+        if self.color:
+            url += "&is.color=" + self.color
+        if self.exclude_color:
+            url += "&is.color!=" + self.exclude_color
+        url += "&order=" + self.order + "&hidden=false"
+        url += "&type=SUPER" if self.super_alpha else "&type!=SUPER"
+        return url
+
+
+def iter_alphas(s, alpha_filter, max_items, limit=100, prefetch=4, seen=None, max_retries=3):
+    """
+    按 limit 分页流式产出满足条件的 alpha 记录（字典），按 id 去重。
+
+    第一页拿到 count 后，后续页每 prefetch 页并发获取一批，按 offset 顺序产出；
+    失败的页在下一批重试，最多 max_retries 次。
+
+    Args:
+        s: 已登录的 requests.Session
+        alpha_filter: AlphaFilter
+        max_items: 最多取多少条
+        seen: 跨多个查询共享的已见 id 集合
+    """
+    seen = set() if seen is None else seen
+    url = alpha_filter.url()
+
+    def fetch(client, offset):
+        return client.request('GET', f"{url}&limit={limit}&offset={offset}")
+
+    pending = [0]
+    total = None
+    attempts = defaultdict(int)
+    while pending:
+        batch, pending = pending[:prefetch], pending[prefetch:]
+        responses = run_many(s, fetch, batch, limit=prefetch)
+        retry = []
+        for offset, response in zip(batch, responses):
+            if isinstance(response, Exception) or response.status_code >= 400:
+                attempts[offset] += 1
+                reason = response if isinstance(response, Exception) else f"HTTP {response.status_code}"
+                if attempts[offset] < max_retries:
+                    retry.append(offset)
+                else:
+                    print(f"⚠️ offset={offset} 获取失败，跳过: {reason}")
+                continue
+            body = response.json()
+            if total is None:
+                total = min(body.get('count', max_items), max_items)
+                pending = list(range(limit, total, limit))
+            results = body.get('results', [])
+            print(f"📥 {alpha_filter.region} offset={offset} 获取到 {len(results)} 个alpha")
+            for alpha in results:
+                if alpha['id'] not in seen:
+                    seen.add(alpha['id'])
+                    yield alpha
+        pending = retry + pending
+
+
+def _alpha_record(alpha, sharpe_th):
+    """alpha → [id, 表达式, sharpe, turnover, fitness, margin, dateCreated, decay, 建议decay]，多空数量不足时返回 None"""
+    metrics = alpha["is"]
+    sharpe = metrics["sharpe"]
+    turnover = metrics["turnover"]
+    decay = alpha["settings"]["decay"]
+    exp = alpha['regular']['code']
+    if (metrics["longCount"] + metrics["shortCount"]) <= 100:
+        return None
+    if sharpe < -sharpe_th:
+        exp = "-%s" % exp
+    rec = [alpha["id"], exp, sharpe, turnover, metrics["fitness"], metrics["margin"], alpha["dateCreated"], decay]
+    if turnover > 0.7:
+        rec.append(decay * 4)
+    elif turnover > 0.6:
+        rec.append(decay * 3 + 3)
+    elif turnover > 0.5:
+        rec.append(decay * 3)
+    elif turnover > 0.4:
+        rec.append(decay * 2)
+    elif turnover > 0.35:
+        rec.append(decay + 4)
+    elif turnover > 0.3:
+        rec.append(decay + 2)
+    return rec
+
+
+def _collect_records(s, filters, alpha_num, sharpe_th):
     output = []
-    # 3E large 3C less
     count = 0
-    for i in range(0, alpha_num, 20):
-        print(f"📥 Offset {i}: 获取 {region} 地区的 SuperAlpha...")
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(sharpe_th) + "&settings.region=" + region + "&order=-is.sharpe&hidden=false&type=SUPER"
-        # print('url_e')
-        # print(url_e)
-        url_c = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3C-" + str(fitness_th) + "&is.sharpe%3C-" \
-                + str(sharpe_th) + "&settings.region=" + region + "&order=is.sharpe&hidden=false&type=SUPER"
-        # print('url_c')
-        # print(url_c)
-        urls = [url_e]
-        if usage != "submit":
-            urls.append(url_c)
-        for url in urls:
-            response = s.get(url)
-            # print(response.json())
-            try:
-                alpha_list = response.json()["results"]
-                batch_ids = []  # 收集本批次的ID
-                # print(alpha_list)
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    batch_ids.append(alpha_id)
-                    output.append(alpha_id)
-
-                # 横向显示本批次ID（每行10个）
-                if batch_ids:
-                    print(f"   获取到 {len(batch_ids)} 个: ", end="")
-                    print(" | ".join([aid[:8] for aid in batch_ids[:10]]))
-                    if len(batch_ids) > 10:
-                        print(f"   ... 及其他 {len(batch_ids) - 10} 个")
-                    # print(alpha_list[j]["is"]["sharpe"])
-                    # # print(alpha_list[j]["is"]["longCount"])
-                    # name = alpha_list[j]["name"]
-                    # dateCreated = alpha_list[j]["dateCreated"]
-                    # sharpe = alpha_list[j]["is"]["sharpe"]
-                    # fitness = alpha_list[j]["is"]["fitness"]
-                    # turnover = alpha_list[j]["is"]["turnover"]
-                    # margin = alpha_list[j]["is"]["margin"]
-                    # longCount = alpha_list[j]["is"]["longCount"]
-                    # shortCount = alpha_list[j]["is"]["shortCount"]
-                    # decay = alpha_list[j]["settings"]["decay"]
-                    # exp = alpha_list[j]['regular']['code']
-                    # count += 1
-                    # #if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-                    # print(longCount)
-                    # print(shortCount)
-                    # if (longCount + shortCount) > 100:
-                    #     print(alpha_list[j]["is"]["longCount"])
-                    #     if sharpe < -sharpe_th:
-                    #         exp = "-%s"%exp
-                    #     rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                    #     print(rec)
-                    #     if turnover > 0.7:
-                    #         rec.append(decay*4)
-                    #     elif turnover > 0.6:
-                    #         rec.append(decay*3+3)
-                    #     elif turnover > 0.5:
-                    #         rec.append(decay*3)
-                    #     elif turnover > 0.4:
-                    #         rec.append(decay*2)
-                    #     elif turnover > 0.35:
-                    #         rec.append(decay+4)
-                    #     elif turnover > 0.3:
-                    #         rec.append(decay+2)
-                    #     output.append(rec)
-            except:
-                print("%d finished re-login" % i)
-                s = login()
-
+    seen = set()
+    for alpha_filter in filters:
+        for alpha in iter_alphas(s, alpha_filter, alpha_num, seen=seen):
+            count += 1
+            rec = _alpha_record(alpha, sharpe_th)
+            if rec is not None:
+                print(rec)
+                output.append(rec)
     print("count: %d" % count)
     return output
 
 
-def get_super_alphas_color(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage, color):
-    s = login()
+def _collect_ids(s, filters, alpha_num):
     output = []
-    # 3E large 3C less
-    count = 0
-    for i in range(0, alpha_num, 10):
-        print(f"📥 Offset {i}: 获取 {region} 地区的 {color} 色 SuperAlpha...")
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(
-            sharpe_th) + "&settings.region=" + region + "&is.color=" + color + "&order=-is.sharpe&hidden=false&type=SUPER"
-        # print('url_e')
-        # print(url_e)
-        url_c = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3C-" + str(fitness_th) + "&is.sharpe%3C-" \
-                + str(
-            sharpe_th) + "&settings.region=" + region + "&is.color=" + color + "&order=is.sharpe&hidden=false&type=SUPER"
-        # print('url_c')
-        # print(url_c)
-        urls = [url_e]
-        if usage != "submit":
-            urls.append(url_c)
-        for url in urls:
-            response = s.get(url)
-            # print(response.json())
-            try:
-                alpha_list = response.json()["results"]
-                batch_ids = []  # 收集本批次的ID
-                # print(alpha_list)
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    batch_ids.append(alpha_id)
-                    output.append(alpha_id)
-
-                # 横向显示本批次ID（每行10个）
-                if batch_ids:
-                    print(f"   获取到 {len(batch_ids)} 个: ", end="")
-                    print(" | ".join([aid[:8] for aid in batch_ids[:10]]))
-                    if len(batch_ids) > 10:
-                        print(f"   ... 及其他 {len(batch_ids) - 10} 个")
-                    # print(alpha_list[j]["is"]["sharpe"])
-                    # # print(alpha_list[j]["is"]["longCount"])
-                    # name = alpha_list[j]["name"]
-                    # dateCreated = alpha_list[j]["dateCreated"]
-                    # sharpe = alpha_list[j]["is"]["sharpe"]
-                    # fitness = alpha_list[j]["is"]["fitness"]
-                    # turnover = alpha_list[j]["is"]["turnover"]
-                    # margin = alpha_list[j]["is"]["margin"]
-                    # longCount = alpha_list[j]["is"]["longCount"]
-                    # shortCount = alpha_list[j]["is"]["shortCount"]
-                    # decay = alpha_list[j]["settings"]["decay"]
-                    # exp = alpha_list[j]['regular']['code']
-                    # count += 1
-                    # #if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-                    # print(longCount)
-                    # print(shortCount)
-                    # if (longCount + shortCount) > 100:
-                    #     print(alpha_list[j]["is"]["longCount"])
-                    #     if sharpe < -sharpe_th:
-                    #         exp = "-%s"%exp
-                    #     rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                    #     print(rec)
-                    #     if turnover > 0.7:
-                    #         rec.append(decay*4)
-                    #     elif turnover > 0.6:
-                    #         rec.append(decay*3+3)
-                    #     elif turnover > 0.5:
-                    #         rec.append(decay*3)
-                    #     elif turnover > 0.4:
-                    #         rec.append(decay*2)
-                    #     elif turnover > 0.35:
-                    #         rec.append(decay+4)
-                    #     elif turnover > 0.3:
-                    #         rec.append(decay+2)
-                    #     output.append(rec)
-            except:
-                print("%d finished re-login" % i)
-                s = login()
-
-    print("count: %d" % count)
+    seen = set()
+    for alpha_filter in filters:
+        output.extend(alpha["id"] for alpha in iter_alphas(s, alpha_filter, alpha_num, seen=seen))
+    print(f"   获取到 {len(output)} 个: " + " | ".join(aid[:8] for aid in output[:10]))
+    if len(output) > 10:
+        print(f"   ... 及其他 {len(output) - 10} 个")
     return output
 
 
-def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_num):
-    print(
-        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit开始处理地区 {region}，目标数量: {alpha_num}")
+def get_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage):
     s = login()
-    output = []
-    count = 0
+    # 3E large 3C less
+    alpha_filter = AlphaFilter(start_date, end_date, sharpe_th, fitness_th, region)
+    filters = [alpha_filter] if usage == "submit" else [alpha_filter, alpha_filter.negated()]
+    return _collect_records(s, filters, alpha_num, sharpe_th)
 
-    for i in range(0, alpha_num, 40):
-        offset_start = time.time()
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 地区 {region} API请求，offset={i}")
 
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(
-            sharpe_th) + "&settings.region=" + region + "&is.color!=RED" + "&order=-is.sharpe&hidden=false&type!=SUPER"
+def get_super_alphas(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage):
+    s = login()
+    print(f"📥 获取 {region} 地区的 SuperAlpha...")
+    alpha_filter = AlphaFilter(start_date, end_date, sharpe_th, fitness_th, region, super_alpha=True)
+    filters = [alpha_filter] if usage == "submit" else [alpha_filter, alpha_filter.negated()]
+    return _collect_ids(s, filters, alpha_num)
 
-        urls = [url_e]
 
-        for url in urls:  # 修复缩进，确保这个循环正确执行
-            req_start = time.time()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 发送API请求到: {url[:80]}...")  # 只打印URL前80字符
+def get_super_alphas_color(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, usage, color):
+    s = login()
+    print(f"📥 获取 {region} 地区的 {color} 色 SuperAlpha...")
+    alpha_filter = AlphaFilter(start_date, end_date, sharpe_th, fitness_th, region, super_alpha=True, color=color)
+    filters = [alpha_filter] if usage == "submit" else [alpha_filter, alpha_filter.negated()]
+    return _collect_ids(s, filters, alpha_num)
 
-            try:
-                # 添加超时30秒，避免无限挂起；如果需要重试机制，可以用wait_get替换
-                response = s.get(url, timeout=30)
-                req_time = time.time() - req_start
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API响应状态: {response.status_code}，响应时间: {req_time:.2f}秒")
-
-                if response.status_code != 200:
-                    print(
-                        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API错误 {response.status_code}: {response.text[:200]}")  # 只打印前200字符错误信息
-                    # 如果非200，尝试重登录
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 尝试重新登录...")
-                    s = login()
-                    continue  # 重试这个请求
-
-                # 检查Retry-After头，如果有等待时间
-                retry_after = response.headers.get("Retry-After", 0)
-                if int(retry_after) > 0:
-                    wait_time = int(retry_after)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API要求等待 {wait_time} 秒...")
-                    time.sleep(wait_time)
-
-                alpha_list = response.json()["results"]
-                offset_count = len(alpha_list)
-                print(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 获取到 {offset_count} 个alpha，总计数: {count + offset_count}")
-
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s" % exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(
-                            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 添加alpha {alpha_id} (Sharpe: {sharpe:.3f})")
-
-                        if turnover > 0.7:
-                            rec.append(decay * 4)
-                        elif turnover > 0.6:
-                            rec.append(decay * 3 + 3)
-                        elif turnover > 0.5:
-                            rec.append(decay * 3)
-                        elif turnover > 0.4:
-                            rec.append(decay * 2)
-                        elif turnover > 0.35:
-                            rec.append(decay + 4)
-                        elif turnover > 0.3:
-                            rec.append(decay + 2)
-                        output.append(rec)
-
-                offset_time = time.time() - offset_start
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] offset={i} 处理完成，耗时: {offset_time:.2f}秒")
-
-            except requests.exceptions.Timeout:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求超时 (30秒)，offset={i}，跳过")
-                continue
-            except requests.exceptions.RequestException as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] API请求异常: {e}，offset={i}")
-                # 尝试重登录
-                try:
-                    s = login()
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录成功，继续")
-                except Exception as login_e:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重登录失败: {login_e}，跳过此offset")
-                continue
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] JSON解析或其他错误: {e}")
-                # 原有重登录逻辑
-                s = login()
-                continue
 
-    total_time = time.time() - offset_start  # 注意：这里offset_start是最后一个循环的，实际应从函数开始计算
+def get_alphas_posit(start_date, end_date, sharpe_th, fitness_th, region, alpha_num):
+    print(
+        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit开始处理地区 {region}，目标数量: {alpha_num}")
+    started = time.time()
+    alpha_filter = AlphaFilter(start_date, end_date, sharpe_th, fitness_th, region, exclude_color='RED')
+    output = select_local(alpha_filter, alpha_num)
     print(
-        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，总计数: {count}，输出: {len(output)}，总耗时约: {total_time:.2f}秒 (估算)")
+        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] get_alphas_posit for {region} 完成，输出: {len(output)}，总耗时: {time.time() - started:.2f}秒")
     return output
 
 
 def get_alphas_posit_color(start_date, end_date, sharpe_th, fitness_th, region, alpha_num, color):
     s = login()
-    output = []
-    # 3E large 3C less
-    count = 0
-    for i in range(0, alpha_num, 20):
-        # print(i)
-        url_e = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-                + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-                + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-                + "T00:00:00-04:00&is.fitness%3E" + str(fitness_th) + "&is.sharpe%3E" \
-                + str(
-            sharpe_th) + "&settings.region=" + region + "&is.color=" + color + "&order=is.sharpe&hidden=false&type!=SUPER"
-        # url_c = "https://api.worldquantbrain.com/users/self/alphas?limit=100&offset=%d" % (i) \
-        #         + "&status=UNSUBMITTED%1FIS_FAIL&dateCreated%3E=2025-" + start_date \
-        #         + "T00:00:00-04:00&dateCreated%3C2025-" + end_date \
-        #         + "T00:00:00-04:00&is.fitness%3C-" + str(fitness_th) + "&is.sharpe%3C-" \
-        #         + str(sharpe_th) + "&settings.region=" + region + "&order=is.sharpe&hidden=false&type!=SUPER"
-        urls = [url_e]
-        # if usage != "submit":
-        #     urls.append(url_c)
-        for url in urls:
-            response = s.get(url)
-            # print(response.json())
-            try:
-                alpha_list = response.json()["results"]
-                # print(response.json())
-                for j in range(len(alpha_list)):
-                    alpha_id = alpha_list[j]["id"]
-                    name = alpha_list[j]["name"]
-                    dateCreated = alpha_list[j]["dateCreated"]
-                    sharpe = alpha_list[j]["is"]["sharpe"]
-                    fitness = alpha_list[j]["is"]["fitness"]
-                    turnover = alpha_list[j]["is"]["turnover"]
-                    margin = alpha_list[j]["is"]["margin"]
-                    longCount = alpha_list[j]["is"]["longCount"]
-                    shortCount = alpha_list[j]["is"]["shortCount"]
-                    decay = alpha_list[j]["settings"]["decay"]
-                    exp = alpha_list[j]['regular']['code']
-                    count += 1
-                    # if (sharpe > 1.2 and sharpe < 1.6) or (sharpe < -1.2 and sharpe > -1.6):
-                    if (longCount + shortCount) > 100:
-                        if sharpe < -sharpe_th:
-                            exp = "-%s" % exp
-                        rec = [alpha_id, exp, sharpe, turnover, fitness, margin, dateCreated, decay]
-                        print(rec)
-                        if turnover > 0.7:
-                            rec.append(decay * 4)
-                        elif turnover > 0.6:
-                            rec.append(decay * 3 + 3)
-                        elif turnover > 0.5:
-                            rec.append(decay * 3)
-                        elif turnover > 0.4:
-                            rec.append(decay * 2)
-                        elif turnover > 0.35:
-                            rec.append(decay + 4)
-                        elif turnover > 0.3:
-                            rec.append(decay + 2)
-                        output.append(rec)
-            except:
-                print("%d finished re-login" % i)
-                s = login()
+    alpha_filter = AlphaFilter(start_date, end_date, sharpe_th, fitness_th, region, color=color, order='is.sharpe')
+    return _collect_records(s, [alpha_filter], alpha_num, sharpe_th)
 
-    print("count: %d" % count)
+
+def synced_catalog(s=None, since=None):
+    """打开本地 alpha 目录并做一次增量同步（60 秒内已同步过则跳过）"""
+    catalog = AlphaCatalog()
+    try:
+        catalog.sync(s or login(), since=since)
+    except requests.RequestException as e:
+        print(f"⚠️ alpha目录同步失败，使用本地已有数据: {e}")
+    return catalog
+
+
+def select_local(alpha_filter, alpha_num, s=None, prefix=None, keep_num=None):
+    """
+    在本地 alpha 目录上按 alpha_filter 筛选，返回与 get_alphas 相同格式的记录。
+    给定 prefix/keep_num 时同时按 prune 规则每个字段只保留 sharpe 绝对值最大的 keep_num 个。
+    """
+    catalog = synced_catalog(s, since=alpha_filter.catalog_query()['created_from'])
+    try:
+        per_field = (prefix, keep_num) if prefix else None
+        alphas = catalog.select(limit=alpha_num, per_field=per_field, **alpha_filter.catalog_query())
+    finally:
+        catalog.close()
+    output = [rec for rec in (_alpha_record(alpha, alpha_filter.sharpe_th) for alpha in alphas) if rec is not None]
+    print("count: %d" % len(alphas))
     return output
 
 
+def prune_local(alpha_filter, prefix, keep_num, alpha_num=None, s=None):
+    """prune 的本地查询版本：直接在 alpha 目录上按字段分组取前 keep_num 个，返回 [[表达式, decay]]"""
+    recs = select_local(alpha_filter, alpha_num, s=s, prefix=prefix, keep_num=keep_num)
+    return [[rec[1], rec[-1]] for rec in recs]
+
+
 def transform(next_alpha_recs, region):
     output = []
     for rec in next_alpha_recs:
@@ -1072,61 +919,57 @@ def prune(next_alpha_recs, prefix, keep_num):
 
 
 def first_order_factory(fields, ops_set):
-    alpha_set = []
+    """逐个产出 fields × ops_set 的一阶表达式（生成器，fields 也可以是生成器）"""
     # for field in fields:
     for field in fields:
         # reverse op does the work
-        alpha_set.append(field)
+        yield field
         # alpha_set.append("-%s"%field)
         for op in ops_set:
 
             if op == "ts_percentage":
 
                 # lpha_set += ts_comp_factory(op, field, "percentage", [0.2, 0.5, 0.8])
-                alpha_set += ts_comp_factory(op, field, "percentage", [0.5])
+                yield from ts_comp_factory(op, field, "percentage", [0.5])
 
             elif op == "ts_target_tvr_hump":
 
                 # alpha_set += ts_comp_factory(op, field, "factor", [0.2, 0.5, 0.8])
-                alpha_set += ts_comp_factory(op, field, "lambda_min=0, lambda_max=1, target_tvr=0.1", [0.5])
+                yield from ts_comp_factory(op, field, "lambda_min=0, lambda_max=1, target_tvr=0.1", [0.5])
 
             elif op == "ts_decay_exp_window":
 
                 # alpha_set += ts_comp_factory(op, field, "factor", [0.2, 0.5, 0.8])
-                alpha_set += ts_comp_factory(op, field, "factor", [0.5])
+                yield from ts_comp_factory(op, field, "factor", [0.5])
 
 
             elif op == "ts_moment":
 
-                alpha_set += ts_comp_factory(op, field, "k", [2, 3, 4])
+                yield from ts_comp_factory(op, field, "k", [2, 3, 4])
 
             elif op == "ts_entropy":
 
                 # alpha_set += ts_comp_factory(op, field, "buckets", [5, 10, 15, 20])
-                alpha_set += ts_comp_factory(op, field, "buckets", [10])
+                yield from ts_comp_factory(op, field, "buckets", [10])
 
             elif op.startswith("ts_") or op == "inst_tvr":
 
-                alpha_set += ts_factory(op, field)
+                yield from ts_factory(op, field)
 
             elif op.startswith("group_"):
 
-                alpha_set += group_factory(op, field, "usa")
+                yield from group_factory(op, field, "usa")
 
             elif op.startswith("vector"):
 
-                alpha_set += vector_factory(op, field)
+                yield from vector_factory(op, field)
 
             elif op == "signed_power":
 
-                alpha = "%s(%s, 2)" % (op, field)
-                alpha_set.append(alpha)
+                yield "%s(%s, 2)" % (op, field)
 
             else:
-                alpha = "%s(%s)" % (op, field)
-                alpha_set.append(alpha)
-
-    return alpha_set
+                yield "%s(%s)" % (op, field)
 
 
 def first_order_factory_undo(fields):
@@ -1141,19 +984,15 @@ def first_order_factory_undo(fields):
 
 
 def get_group_second_order_factory(first_order, group_ops, region):
-    second_order = []
     for fo in first_order:
         for group_op in group_ops:
-            second_order += group_factory(group_op, fo, region)
-    return second_order
+            yield from group_factory(group_op, fo, region)
 
 
 def get_ts_second_order_factory(first_order, ts_ops):
-    second_order = []
     for fo in first_order:
         for ts_op in ts_ops:
-            second_order += ts_factory(ts_op, fo)
-    return second_order
+            yield from ts_factory(ts_op, fo)
 
 
 def get_data_fields_csv(filename, prefix):
@@ -1179,38 +1018,25 @@ def ts_arith_factory(ts_op, arith_op, field):
 
 
 def arith_ts_factory(arith_op, ts_op, field):
-    second_order = []
-    first_order = ts_factory(ts_op, field)
-    for fo in first_order:
-        second_order.append("%s(%s)" % (arith_op, fo))
-    return second_order
+    for fo in ts_factory(ts_op, field):
+        yield "%s(%s)" % (arith_op, fo)
 
 
 def ts_group_factory(ts_op, group_op, field, region):
-    second_order = []
-    first_order = group_factory(group_op, field, region)
-    for fo in first_order:
-        second_order += ts_factory(ts_op, fo)
-    return second_order
+    for fo in group_factory(group_op, field, region):
+        yield from ts_factory(ts_op, fo)
 
 
 def group_ts_factory(group_op, ts_op, field, region):
-    second_order = []
-    first_order = ts_factory(ts_op, field)
-    for fo in first_order:
-        second_order += group_factory(group_op, fo, region)
-    return second_order
+    for fo in ts_factory(ts_op, field):
+        yield from group_factory(group_op, fo, region)
 
 
 def vector_factory(op, field):
-    output = []
     vectors = ["cap"]
 
     for vector in vectors:
-        alpha = "%s(%s, %s)" % (op, field, vector)
-        output.append(alpha)
-
-    return output
+        yield "%s(%s, %s)" % (op, field, vector)
 
 
 def trade_when_factory(op, field, region):
@@ -1287,36 +1113,27 @@ def trade_when_factory(op, field, region):
 
 
 def ts_factory(op, field):
-    output = []
     # days = [3, 5, 10, 20, 60, 120, 240]
     days = [5, 22, 66, 120, 240]
 
     for day in days:
-        alpha = "%s(%s, %d)" % (op, field, day)
-        output.append(alpha)
-
-    return output
+        yield "%s(%s, %d)" % (op, field, day)
 
 
 def ts_comp_factory(op, field, factor, paras):
-    output = []
     if factor == 'lambda_min=0, lambda_max=1, target_tvr=0.1':
-        alpha = "%s(%s, %s)" % (op, field, factor)
-        output.append(alpha)
+        yield "%s(%s, %s)" % (op, field, factor)
     else:
         # l1, l2 = [3, 5, 10, 20, 60, 120, 240], paras
         l1, l2 = [5, 22, 66, 240], paras
-        comb = list(product(l1, l2))
-        for day, para in comb:
+        for day, para in product(l1, l2):
 
             if type(para) == float:
                 alpha = "%s(%s, %d, %s=%.1f)" % (op, field, day, factor, para)
             elif type(para) == int:
                 alpha = "%s(%s, %d, %s=%d)" % (op, field, day, factor, para)
 
-            output.append(alpha)
-
-    return output
+            yield alpha
 
 
 def twin_field_factory(op, field, fields):
@@ -1334,7 +1151,6 @@ def twin_field_factory(op, field, fields):
 
 
 def group_factory(op, field, region):
-    output = []
     vectors = ["cap"]
 
     chn_group_13 = ['pv13_h_min2_sector', 'pv13_di_6l', 'pv13_rcsed_6l', 'pv13_di_5l', 'pv13_di_4l',
@@ -1483,16 +1299,11 @@ def group_factory(op, field, region):
     for group in groups:
         if op.startswith("group_vector"):
             for vector in vectors:
-                alpha = "%s(%s,%s,densify(%s))" % (op, field, vector, group)
-                output.append(alpha)
+                yield "%s(%s,%s,densify(%s))" % (op, field, vector, group)
         elif op.startswith("group_percentage"):
-            alpha = "%s(%s,densify(%s),percentage=0.5)" % (op, field, group)
-            output.append(alpha)
+            yield "%s(%s,densify(%s),percentage=0.5)" % (op, field, group)
         else:
-            alpha = "%s(%s,densify(%s))" % (op, field, group)
-            output.append(alpha)
-
-    return output
+            yield "%s(%s,densify(%s))" % (op, field, group)
 
 
 def filter_alpha(tracker, keys, return_type):
@@ -0,0 +1,266 @@
+"""
+BRAIN 调用的进程内指标
+
+记录每个接口的请求数、延迟直方图、状态码计数、收到的 Retry-After 总秒数、各类睡眠时间，
+以及调度/检查流水线的队列深度，用来看墙钟时间到底花在哪里：
+    - 同步请求在 session_pool.PooledSession 里统一记录，异步请求在 AsyncBrainClient.request 里记录
+    - 睡眠用 metrics.sleep(秒, 原因) 代替 time.sleep；异步代码 await 前调用 metrics.observe_sleep
+      （多个协程同时等待时各自累加）
+    - 队列深度用 metrics.set_gauge(名称, 值)
+
+导出方式（也可以在代码里直接调用 snapshot() / render_prometheus()）：
+    BRAIN_METRICS_PORT=9108        启动本地 HTTP 端点：/metrics 为 Prometheus 文本格式，/metrics.json 为 JSON
+    BRAIN_METRICS_FILE=metrics.json  每 BRAIN_METRICS_INTERVAL 秒（默认60）把 JSON 快照写入该文件，退出时再写一次
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# 请求延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 函数耗时直方图的桶上界（秒）
+DURATION_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 14400)
+
+# 路径中这些段之后的一段是 id，统计时合并成 {id}
+_ID_AFTER = {'alphas', 'simulations'}
+
+
+def endpoint(method, url):
+    """把请求归一化成接口名，如 'GET /alphas/{id}/check'"""
+    parts = urlparse(url).path.rstrip('/').split('/')
+    for i in range(1, len(parts)):
+        if parts[i - 1] in _ID_AFTER and parts[i] != 'self':
+            parts[i] = '{id}'
+    return f"{method.upper()} {'/'.join(parts) or '/'}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(上界, 累计数)]，最后一个上界为 '+Inf'"""
+        total, result = 0, []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.sum, 6),
+                'buckets': {str(bound): count for bound, count in self.cumulative()}}
+
+
+class Metrics:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.requests = Counter()       # (接口, 状态码) -> 次数
+            self.errors = Counter()         # (接口, 异常类型) -> 次数
+            self.latency = {}               # 接口 -> _Histogram
+            self.retry_after = Counter()    # 接口 -> Retry-After 秒数合计
+            self.retry_after_count = Counter()
+            self.sleeps = Counter()         # 原因 -> 秒数合计
+            self.gauges = {}                # 名称 -> 当前值
+            self.durations = {}             # 函数名 -> _Histogram
+
+    # ---------- 记录 ----------
+
+    def observe_request(self, method, url, status, seconds, retry_after=None):
+        name = endpoint(method, url)
+        with self._lock:
+            self.requests[(name, int(status))] += 1
+            histogram = self.latency.get(name)
+            if histogram is None:
+                histogram = self.latency[name] = _Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            try:
+                retry_after = float(retry_after or 0)
+            except ValueError:
+                retry_after = 0.0
+            if retry_after > 0:
+                self.retry_after[name] += retry_after
+                self.retry_after_count[name] += 1
+
+    def observe_error(self, method, url, error):
+        with self._lock:
+            self.errors[(endpoint(method, url), type(error).__name__)] += 1
+
+    def observe_sleep(self, reason, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.sleeps[reason] += seconds
+
+    def sleep(self, seconds, reason):
+        """time.sleep 并按原因记录睡眠时间"""
+        if seconds > 0:
+            self.observe_sleep(reason, seconds)
+            time.sleep(seconds)
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe_duration(self, name, seconds):
+        with self._lock:
+            histogram = self.durations.get(name)
+            if histogram is None:
+                histogram = self.durations[name] = _Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds)
+
+    # ---------- 导出 ----------
+
+    def snapshot(self):
+        """当前全部指标的 JSON 可序列化字典"""
+        with self._lock:
+            endpoints = {}
+            for (name, status), count in self.requests.items():
+                entry = endpoints.setdefault(name, {'requests': 0, 'status': {}})
+                entry['requests'] += count
+                entry['status'][str(status)] = count
+            for name, histogram in self.latency.items():
+                endpoints[name]['latency'] = histogram.to_dict()
+            for name, total in self.retry_after.items():
+                endpoints[name]['retry_after'] = {'responses': self.retry_after_count[name], 'seconds': round(total, 3)}
+            for (name, error), count in self.errors.items():
+                endpoints.setdefault(name, {'requests': 0, 'status': {}}).setdefault('errors', {})[error] = count
+            return {
+                'timestamp': time.time(),
+                'uptime': round(time.time() - self.started, 3),
+                'requests': sum(self.requests.values()),
+                'endpoints': endpoints,
+                'sleep_seconds': {reason: round(seconds, 3) for reason, seconds in self.sleeps.items()},
+                'gauges': dict(self.gauges),
+                'durations': {name: histogram.to_dict() for name, histogram in self.durations.items()},
+            }
+
+    def render_prometheus(self):
+        """Prometheus 文本格式"""
+        def labels(**kw):
+            return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in kw.items()) + '}'
+
+        lines = []
+        with self._lock:
+            lines += ['# HELP brain_requests_total BRAIN API requests by endpoint and status code.',
+                      '# TYPE brain_requests_total counter']
+            lines += [f'brain_requests_total{labels(endpoint=name, status=status)} {count}'
+                      for (name, status), count in sorted(self.requests.items())]
+            lines += ['# HELP brain_request_errors_total BRAIN API requests that raised before a response.',
+                      '# TYPE brain_request_errors_total counter']
+            lines += [f'brain_request_errors_total{labels(endpoint=name, error=error)} {count}'
+                      for (name, error), count in sorted(self.errors.items())]
+            lines += ['# HELP brain_request_duration_seconds BRAIN API request latency.',
+                      '# TYPE brain_request_duration_seconds histogram']
+            for name, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'brain_request_duration_seconds_bucket{labels(endpoint=name, le=bound)} {count}')
+                lines.append(f'brain_request_duration_seconds_sum{labels(endpoint=name)} {histogram.sum:.6f}')
+                lines.append(f'brain_request_duration_seconds_count{labels(endpoint=name)} {histogram.count}')
+            lines += ['# HELP brain_retry_after_seconds_total Sum of Retry-After values received.',
+                      '# TYPE brain_retry_after_seconds_total counter']
+            lines += [f'brain_retry_after_seconds_total{labels(endpoint=name)} {total:.3f}'
+                      for name, total in sorted(self.retry_after.items())]
+            lines += ['# HELP brain_retry_after_responses_total Responses carrying a Retry-After header.',
+                      '# TYPE brain_retry_after_responses_total counter']
+            lines += [f'brain_retry_after_responses_total{labels(endpoint=name)} {count}'
+                      for name, count in sorted(self.retry_after_count.items())]
+            lines += ['# HELP brain_sleep_seconds_total Time spent sleeping by reason.',
+                      '# TYPE brain_sleep_seconds_total counter']
+            lines += [f'brain_sleep_seconds_total{labels(reason=reason)} {seconds:.3f}'
+                      for reason, seconds in sorted(self.sleeps.items())]
+            lines += ['# HELP brain_queue_depth Current depth of dispatch and check queues.',
+                      '# TYPE brain_queue_depth gauge']
+            lines += [f'brain_queue_depth{labels(queue=name)} {value}' for name, value in sorted(self.gauges.items())]
+            lines += ['# HELP brain_function_duration_seconds Wall time of instrumented functions.',
+                      '# TYPE brain_function_duration_seconds histogram']
+            for name, histogram in sorted(self.durations.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'brain_function_duration_seconds_bucket{labels(function=name, le=bound)} {count}')
+                lines.append(f'brain_function_duration_seconds_sum{labels(function=name)} {histogram.sum:.6f}')
+                lines.append(f'brain_function_duration_seconds_count{labels(function=name)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+def start_http_server(port, host='127.0.0.1', registry=None):
+    """在后台线程提供 /metrics（Prometheus 文本）和 /metrics.json，返回 server（server.shutdown() 停止）"""
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, content_type = json.dumps(registry.snapshot()).encode(), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, content_type = registry.render_prometheus().encode(), 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"📈 指标端点: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_snapshot_writer(path, interval=60, registry=None):
+    """每 interval 秒把 JSON 快照写入 path，进程退出时再写一次"""
+    registry = registry or metrics
+    stop = threading.Event()
+
+    def _run():
+        while not stop.wait(interval):
+            try:
+                registry.write_snapshot(path)
+            except OSError as e:
+                print(f"   ⚠️  [metrics] 写入快照失败: {e}")
+
+    threading.Thread(target=_run, name='metrics-snapshot', daemon=True).start()
+    atexit.register(registry.write_snapshot, path)
+    return stop
+
+
+if os.environ.get('BRAIN_METRICS_PORT'):
+    start_http_server(int(os.environ['BRAIN_METRICS_PORT']))
+if os.environ.get('BRAIN_METRICS_FILE'):
+    start_snapshot_writer(os.environ['BRAIN_METRICS_FILE'], float(os.environ.get('BRAIN_METRICS_INTERVAL', 60)))
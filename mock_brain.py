@@ -0,0 +1,773 @@
+"""
+本地模拟 BRAIN API 服务器
+
+离线压测调度器吞吐、重试行为和内存占用用，不需要连真实的 api.worldquantbrain.com。实现的接口：
+    POST /authentication                      Basic 认证，返回 cookie 和 token.expiry
+    POST /simulations                         单个（dict）或 multi（list，2~10个）模拟，返回 Location
+    GET  /simulations/{id}                    未完成时带 Retry-After；完成后返回 alpha / children
+    GET|PATCH /alphas/{id}
+    GET  /alphas/{id}/check                   计算期间带 Retry-After，完成后返回 is.checks（含 PROD_CORRELATION）
+    GET  /alphas/{id}/correlations/prod|self
+    GET  /alphas/{id}/recordsets/pnl
+    GET  /users/self/alphas                   分页、排序，支持 status=A%1FB / is.sharpe>1 / type!=SUPER 等过滤
+    GET  /data-sets, /data-fields             分页
+另有 GET /_mock/stats（请求统计）和 POST /_mock/config（运行中修改配置，如故障率）。
+
+模拟耗时、Retry-After 和每个请求的延迟都是可配置的分布，写法见 parse_dist；
+按 fault_rates 的概率在任意接口注入 429 / 401（同时作废令牌）/ 5xx。
+
+用法：
+    python mock_brain.py --port 8765 --sim-time lognormal:20,0.5 --fault-429 0.05
+    BRAIN_API_URL=http://127.0.0.1:8765 python 0USA_delay1.py
+
+代码里用 start_mock_server(...) 在后台线程启动，返回的 MockBrain 带 url / stats() / configure() / stop()。
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import string
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import unquote
+
+from aiohttp import web
+
+EASTERN = timezone(timedelta(hours=-4))
+SEED_FROM = datetime(2025, 1, 1, tzinfo=EASTERN).timestamp()
+SEED_TO = datetime(2025, 12, 31, tzinfo=EASTERN).timestamp()
+
+REGIONS = ('USA', 'CHN', 'EUR', 'ASI', 'GLB', 'JPN', 'AMR', 'IND')
+DATASETS = ('fundamental6', 'pv1', 'analyst4', 'model16', 'news12', 'news20', 'option8', 'option9',
+            'socialmedia12')
+
+DEFAULT_CONFIG = {
+    'sim_time': 'lognormal:20,0.5',   # 单个模拟从提交到完成的秒数
+    'retry_after': 'const:2',         # 进度/检查/相关性接口返回的 Retry-After
+    'check_time': 'uniform:3,10',     # /check 计算耗时
+    'corr_time': 'uniform:1,5',       # /correlations 计算耗时
+    'latency': 'const:0',             # 每个请求的服务端延迟
+    'sim_error_rate': 0.02,           # 模拟以 ERROR 结束的比例（括号不配对的表达式总是 ERROR）
+    'max_concurrent_sims': 8,         # 每个账号同时在途的模拟上限，超过返回 429
+    'token_ttl': 4 * 3600,
+    'users': None,                    # {username: password}；为空时接受任何账号
+    'fault_rates': {'429': 0.0, '401': 0.0, '5xx': 0.0},
+    'fault_routes': None,             # 只对这些接口注入故障，如 ['progress', 'check']；为空表示全部
+    'seed_alphas': 300,               # 启动时预置的 alpha 数量（部分为已提交的 OS alpha）
+    'fields_per_dataset': 120,
+    'pnl_days': 1260,
+    'seed': 0,
+}
+
+
+def parse_dist(spec):
+    """
+    把分布描述解析成 sample(rng) 函数。
+
+    支持 'const:2'、'uniform:1,5'、'exp:0.5'（均值）、'lognormal:20,0.5'（均值, 对数标准差）；
+    数字直接当作常数；列表表示实测记录的样本，每次从中随机取一个。
+    """
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda rng: value
+    if isinstance(spec, (list, tuple)):
+        samples = [float(x) for x in spec]
+        return lambda rng: rng.choice(samples)
+    kind, _, args = spec.partition(':')
+    params = [float(x) for x in args.split(',') if x]
+    if kind == 'const':
+        return lambda rng: params[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    if kind == 'lognormal':
+        mean, sigma = params
+        mu = math.log(mean) - sigma ** 2 / 2
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"未知的分布: {spec}")
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, EASTERN).isoformat(timespec='seconds')
+
+
+def _rng_for(*parts):
+    """同样的输入得到同样的随机序列，保证同一表达式的指标、PnL 可复现"""
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+
+def _lookup(obj, dotted):
+    for key in dotted.split('.'):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def _compare(left, op, right):
+    if left is None:
+        return op == '!='
+    if isinstance(left, bool) or right.lower() in ('true', 'false'):
+        left, right = str(left).lower(), right.lower()
+    else:
+        try:
+            left, right = float(left), float(right)
+        except (TypeError, ValueError):
+            try:
+                left, right = datetime.fromisoformat(str(left)), datetime.fromisoformat(right)
+            except ValueError:
+                left, right = str(left), right
+    if op == '=':
+        return left == right
+    if op == '!=':
+        return left != right
+    if op == '>':
+        return left > right
+    if op == '>=':
+        return left >= right
+    if op == '<':
+        return left < right
+    return left <= right
+
+
+OPERATORS = ('>=', '<=', '!=', '>', '<', '=')
+PAGING_KEYS = {'limit', 'offset', 'order'}
+
+
+def parse_filters(query_string):
+    """
+    解析 /users/self/alphas 的原始查询串。
+
+    URL 里比较符是编码后的 %3E / %3C，且 is.sharpe%3E1 这类条件没有 '='，
+    不能用普通的 key=value 解析。
+
+    Returns:
+        (filters, paging): filters 为 [(字段, 比较符, [取值...])]，%1F 分隔的多个取值任一匹配即可
+    """
+    filters, paging = [], {}
+    for part in query_string.split('&'):
+        part = unquote(part)
+        if not part:
+            continue
+        for op in OPERATORS:
+            field, sep, value = part.partition(op)
+            if sep:
+                break
+        else:
+            continue
+        if field in PAGING_KEYS and op == '=':
+            paging[field] = value
+        else:
+            filters.append((field, op, value.split('\x1f')))
+    return filters, paging
+
+
+class MockState:
+    """服务器内存状态：账号令牌、模拟、alpha、检查/相关性计算进度和请求统计"""
+
+    def __init__(self, config):
+        self.config = dict(DEFAULT_CONFIG)
+        self.config['fault_rates'] = dict(DEFAULT_CONFIG['fault_rates'])
+        self.rng = random.Random(config.get('seed', 0))
+        self.configure(**config)
+        self.tokens = {}         # token -> (username, expires_at)
+        self.sims = {}           # sim_id -> dict
+        self.alphas = {}         # alpha_id -> alpha JSON
+        self.ready_at = {}       # (alpha_id, 'check'|'prod'|'self') -> 完成时间
+        self.counters = Counter()
+        self.peak_sims = 0
+        end = date(2025, 6, 30)
+        days = []
+        day = end
+        while len(days) < self.config['pnl_days']:
+            if day.weekday() < 5:
+                days.append(day.isoformat())
+            day -= timedelta(days=1)
+        self.pnl_dates = days[::-1]
+        self._seed_alphas()
+
+    def configure(self, **changes):
+        for key, value in changes.items():
+            if key not in DEFAULT_CONFIG:
+                raise KeyError(f"未知的配置项: {key}")
+            if key == 'fault_rates':
+                self.config['fault_rates'].update(value)
+            else:
+                self.config[key] = value
+        self.dists = {key: parse_dist(self.config[key])
+                      for key in ('sim_time', 'retry_after', 'check_time', 'corr_time', 'latency')}
+
+    def sample(self, key):
+        return max(0.0, self.dists[key](self.rng))
+
+    def new_id(self, length):
+        return ''.join(self.rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+    # ---------- alpha ----------
+
+    def make_alpha(self, payload, created, username='MOCK'):
+        settings = dict(payload.get('settings') or {})
+        alpha_type = payload.get('type', 'REGULAR')
+        code = payload.get('regular') or payload.get('combo') or ''
+        rng = _rng_for(alpha_type, code, json.dumps(settings, sort_keys=True))
+        sharpe = round(rng.gauss(0.0, 1.2), 2)
+        turnover = round(rng.uniform(0.01, 0.9), 4)
+        fitness = round(sharpe * rng.uniform(0.3, 1.1), 2)
+        alpha = {
+            'id': self.new_id(7),
+            'type': alpha_type,
+            'author': username,
+            'settings': settings,
+            'regular': None,
+            'dateCreated': _iso(created),
+            'dateSubmitted': None,
+            'dateModified': _iso(created),
+            'name': None,
+            'favorite': False,
+            'hidden': False,
+            'color': None,
+            'category': None,
+            'tags': [],
+            'classifications': [],
+            'grade': 'AVERAGE',
+            'stage': 'IS',
+            'status': 'UNSUBMITTED',
+            'is': {
+                'pnl': round(rng.uniform(-2e6, 4e6)),
+                'bookSize': 20000000,
+                'longCount': rng.randint(20, 1600),
+                'shortCount': rng.randint(20, 1600),
+                'turnover': turnover,
+                'returns': round(sharpe * 0.04, 4),
+                'drawdown': round(rng.uniform(0.01, 0.3), 4),
+                'margin': round(rng.gauss(0.0005, 0.0008), 6),
+                'sharpe': sharpe,
+                'fitness': fitness,
+                'startDate': self.pnl_dates[0],
+                'checks': [
+                    {'name': 'LOW_SHARPE', 'result': 'PASS' if sharpe >= 1.25 else 'FAIL', 'limit': 1.25, 'value': sharpe},
+                    {'name': 'LOW_FITNESS', 'result': 'PASS' if fitness >= 1.0 else 'FAIL', 'limit': 1.0, 'value': fitness},
+                    {'name': 'LOW_TURNOVER', 'result': 'PASS' if turnover >= 0.01 else 'FAIL', 'limit': 0.01, 'value': turnover},
+                    {'name': 'HIGH_TURNOVER', 'result': 'PASS' if turnover <= 0.7 else 'FAIL', 'limit': 0.7, 'value': turnover},
+                    {'name': 'CONCENTRATED_WEIGHT', 'result': 'PASS'},
+                    {'name': 'SELF_CORRELATION', 'result': 'PENDING'},
+                ],
+            },
+            'os': None,
+        }
+        if alpha_type == 'SUPER':
+            alpha['combo'] = {'code': payload.get('combo', ''), 'description': None}
+            alpha['selection'] = {'code': payload.get('selection', ''), 'description': None}
+        else:
+            alpha['regular'] = {'code': code, 'description': None, 'operatorCount': code.count('(')}
+        self.alphas[alpha['id']] = alpha
+        return alpha
+
+    def _seed_alphas(self):
+        fields = ['close', 'volume', 'returns', 'vwap', 'cap', 'assets', 'sales', 'eps']
+        ops = ['rank', 'ts_rank', 'ts_zscore', 'group_rank', 'ts_delta']
+        rng = self.rng
+        for i in range(self.config['seed_alphas']):
+            expr = f"{rng.choice(ops)}({rng.choice(fields)}, {rng.randint(5, 250)})"
+            payload = {'type': 'SUPER' if rng.random() < 0.1 else 'REGULAR', 'regular': expr,
+                       'settings': {'instrumentType': 'EQUITY', 'region': rng.choice(REGIONS), 'universe': 'TOP3000',
+                                    'delay': rng.choice((0, 1)), 'decay': rng.randint(0, 20),
+                                    'neutralization': 'SUBINDUSTRY'}}
+            if payload['type'] == 'SUPER':
+                payload.update(combo='combo_a(alpha)', selection=f'turnover < {rng.uniform(0.1, 0.5):.1f}')
+            # 各脚本的查询条件写死了 2025 年的日期，预置 alpha 分布在这一年里
+            created = rng.uniform(SEED_FROM, SEED_TO)
+            alpha = self.make_alpha(payload, created)
+            if rng.random() < 0.25:
+                alpha.update(stage='OS', status='ACTIVE', dateSubmitted=_iso(created + 86400))
+
+    def pnl(self, alpha):
+        """按 is.sharpe 生成的累计 PnL 序列"""
+        rng = _rng_for('pnl', alpha['id'])
+        sd = 5e4
+        mu = alpha['is']['sharpe'] * sd / math.sqrt(252)
+        total, records = 0.0, []
+        for day in self.pnl_dates:
+            total += rng.gauss(mu, sd)
+            records.append([day, round(total, 2)])
+        return records
+
+    # ---------- 模拟 ----------
+
+    def in_flight(self, username, now):
+        return sum(1 for sim in self.sims.values()
+                   if sim['user'] == username and sim['parent'] is None and sim['done_at'] > now)
+
+    def submit(self, username, payload, now):
+        children = payload if isinstance(payload, list) else None
+        duration = self.sample('sim_time') * (1 + 0.1 * len(children) if children else 1)
+        sim_id = self.new_id(23)
+        sim = {'id': sim_id, 'user': username, 'parent': None, 'started': now, 'done_at': now + duration,
+               'payload': None if children else payload, 'children': [], 'alpha': None, 'status': None}
+        self.sims[sim_id] = sim
+        for child_payload in children or ():
+            child_id = self.new_id(23)
+            self.sims[child_id] = {'id': child_id, 'user': username, 'parent': sim_id, 'started': now,
+                                   'done_at': sim['done_at'],
+                                   'payload': child_payload, 'children': [], 'alpha': None, 'status': None}
+            sim['children'].append(child_id)
+        self.counters['simulations_submitted'] += 1
+        self.counters['children_submitted'] += len(children or ())
+        self.peak_sims = max(self.peak_sims, self.in_flight(username, now))
+        return sim
+
+    def finish(self, sim):
+        """第一次在完成后被查询时生成结果（alpha 或 ERROR）"""
+        if sim['status'] is not None:
+            return
+        sim['observed_at'] = time.time()
+        if sim['children']:
+            for child_id in sim['children']:
+                self.finish(self.sims[child_id])
+            statuses = [self.sims[child_id]['status'] for child_id in sim['children']]
+            sim['status'] = 'ERROR' if all(status == 'ERROR' for status in statuses) else 'COMPLETE'
+        else:
+            code = sim['payload'].get('regular') or sim['payload'].get('combo') or ''
+            if code.count('(') != code.count(')') or self.rng.random() < self.config['sim_error_rate']:
+                sim['status'] = 'ERROR'
+                sim['message'] = 'Attempted to use unknown variable or invalid expression'
+            else:
+                sim['status'] = 'COMPLETE'
+                sim['alpha'] = self.make_alpha(sim['payload'], sim['done_at'], sim['user'])['id']
+                self.counters['alphas_created'] += 1
+        self.counters['simulations_' + sim['status'].lower()] += 1
+
+    def progress_json(self, sim):
+        if sim['children']:
+            return {'children': sim['children'], 'type': 'REGULAR', 'status': sim['status']}
+        body = {'id': sim['id'], 'type': sim['payload'].get('type', 'REGULAR'),
+                'settings': sim['payload'].get('settings', {}), 'regular': sim['payload'].get('regular'),
+                'status': sim['status']}
+        if sim['status'] == 'COMPLETE':
+            body['alpha'] = sim['alpha']
+        else:
+            body['message'] = sim.get('message')
+        return body
+
+    def ready(self, alpha_id, kind, now):
+        """检查/相关性是否算完：第一次请求时开始计时"""
+        key = (alpha_id, kind)
+        if key not in self.ready_at:
+            self.ready_at[key] = now + self.sample('check_time' if kind == 'check' else 'corr_time')
+        return now >= self.ready_at[key]
+
+    def prod_corr(self, alpha):
+        return round(_rng_for('prod', alpha['id']).uniform(0.1, 0.8), 4)
+
+    def stats(self):
+        """
+        请求/模拟统计。
+
+        busy_slot_seconds 是所有顶层模拟在服务器端实际运行的秒数之和，除以墙钟时间即平均在途槽位数；
+        completion_lag 是模拟完成到客户端第一次查询到结果之间的平均秒数。
+        """
+        now = time.time()
+        tops = [sim for sim in self.sims.values() if sim['parent'] is None]
+        lags = [sim['observed_at'] - sim['done_at'] for sim in tops if 'observed_at' in sim]
+        return {'counters': dict(self.counters), 'peak_concurrent_sims': self.peak_sims,
+                'alphas': len(self.alphas), 'simulations': len(tops),
+                'busy_slot_seconds': sum(min(sim['done_at'], now) - sim['started'] for sim in tops),
+                'completion_lag': sum(lags) / len(lags) if lags else None}
+
+
+class MockBrainApp:
+    """aiohttp 应用：请求计数、延迟和故障注入在中间件里统一处理"""
+
+    def __init__(self, state):
+        self.state = state
+        self.app = web.Application(middlewares=[self.middleware])
+        self.app.add_routes([
+            web.post('/authentication', self.authentication),
+            web.post('/simulations', self.post_simulation),
+            web.get('/simulations/{sim_id}', self.get_simulation),
+            web.get('/alphas/{alpha_id}', self.get_alpha),
+            web.patch('/alphas/{alpha_id}', self.patch_alpha),
+            web.get('/alphas/{alpha_id}/check', self.get_check),
+            web.get('/alphas/{alpha_id}/correlations/{kind}', self.get_correlations),
+            web.get('/alphas/{alpha_id}/recordsets/pnl', self.get_pnl),
+            web.get('/users/self/alphas', self.list_alphas),
+            web.get('/data-sets', self.list_datasets),
+            web.get('/data-fields', self.list_datafields),
+            web.get('/_mock/stats', self.get_stats),
+            web.post('/_mock/config', self.post_config),
+        ])
+
+    @staticmethod
+    def route_name(request):
+        path = request.path
+        if path.startswith('/_mock'):
+            return 'mock'
+        if path == '/authentication':
+            return 'authentication'
+        if path.startswith('/simulations'):
+            return 'simulations' if request.method == 'POST' else 'progress'
+        if path.startswith('/alphas/'):
+            if path.endswith('/check'):
+                return 'check'
+            if '/correlations/' in path:
+                return 'correlations'
+            if path.endswith('/recordsets/pnl'):
+                return 'pnl'
+            return 'alphas'
+        if path.startswith('/users/self/alphas'):
+            return 'list'
+        return 'data'
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        state = self.state
+        route = self.route_name(request)
+        if route == 'mock':
+            return await handler(request)
+        latency = state.sample('latency')
+        if latency > 0:
+            await asyncio.sleep(latency)
+        response = self.inject_fault(request, route)
+        if response is None and route != 'authentication':
+            request['user'] = self.authorized(request)
+            if request['user'] is None:
+                response = web.json_response({'detail': 'Incorrect authentication credentials.'}, status=401)
+        if response is None:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                response = e
+        state.counters['requests'] += 1
+        state.counters[f'{request.method} {route} {response.status}'] += 1
+        return response
+
+    def inject_fault(self, request, route):
+        state = self.state
+        routes = state.config['fault_routes']
+        if route == 'authentication' or (routes and route not in routes):
+            return None
+        rates = state.config['fault_rates']
+        roll = state.rng.random()
+        if roll < rates.get('429', 0):
+            state.counters['fault_429'] += 1
+            return web.json_response({'detail': 'Too many requests'}, status=429,
+                                     headers={'Retry-After': f"{state.sample('retry_after'):.1f}"})
+        roll -= rates.get('429', 0)
+        if roll < rates.get('401', 0):
+            # 模拟令牌在运行中途失效：作废当前令牌，客户端必须重新认证
+            state.counters['fault_401'] += 1
+            state.tokens.pop(request.cookies.get('t'), None)
+            return web.json_response({'detail': 'Incorrect authentication credentials.'}, status=401)
+        roll -= rates.get('401', 0)
+        if roll < rates.get('5xx', 0):
+            state.counters['fault_5xx'] += 1
+            return web.json_response({'detail': 'Internal server error'}, status=state.rng.choice((500, 502, 503)))
+        return None
+
+    def authorized(self, request):
+        entry = self.state.tokens.get(request.cookies.get('t'))
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    async def authentication(self, request):
+        header = request.headers.get('Authorization', '')
+        try:
+            username, _, password = base64.b64decode(header.split(' ', 1)[1]).decode().partition(':')
+        except (IndexError, ValueError):
+            return web.json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+        users = self.state.config['users']
+        if users is not None and users.get(username) != password:
+            return web.json_response({'detail': 'Invalid username or password.'}, status=401)
+        token = self.state.new_id(32)
+        ttl = self.state.config['token_ttl']
+        self.state.tokens[token] = (username, time.time() + ttl)
+        self.state.counters['logins'] += 1
+        response = web.json_response({'user': {'id': username}, 'token': {'expiry': ttl},
+                                      'permissions': ['CONSULTANT', 'MULTI_SIMULATION', 'SUPER_ALPHA']}, status=201)
+        response.set_cookie('t', token, path='/', httponly=True)
+        return response
+
+    async def post_simulation(self, request):
+        state = self.state
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'detail': 'JSON parse error'}, status=400)
+        if isinstance(payload, list) and not 2 <= len(payload) <= 10:
+            return web.json_response({'detail': 'Multi-simulation must have 2 to 10 children.'}, status=400)
+        items = payload if isinstance(payload, list) else [payload]
+        if not all(isinstance(item, dict) and (item.get('regular') or item.get('combo')) for item in items):
+            return web.json_response({'regular': ['This field is required.']}, status=400)
+        now = time.time()
+        if state.in_flight(request['user'], now) >= state.config['max_concurrent_sims']:
+            state.counters['concurrent_limit'] += 1
+            return web.json_response({'detail': 'CONCURRENT_SIMULATION_LIMIT_EXCEEDED'}, status=429,
+                                     headers={'Retry-After': f"{state.sample('retry_after'):.1f}"})
+        sim = state.submit(request['user'], payload, now)
+        location = f"{request.url.origin()}/simulations/{sim['id']}"
+        return web.Response(status=201, headers={'Location': location, 'Retry-After': '1.0'})
+
+    async def get_simulation(self, request):
+        state = self.state
+        sim = state.sims.get(request.match_info['sim_id'])
+        if sim is None:
+            raise web.HTTPNotFound(text='{"detail": "Not found."}', content_type='application/json')
+        now = time.time()
+        if now < sim['done_at']:
+            progress = (now - sim['started']) / (sim['done_at'] - sim['started'])
+            return web.json_response({'progress': round(min(0.99, progress), 2)},
+                                     headers={'Retry-After': f"{state.sample('retry_after'):.1f}"})
+        state.finish(sim)
+        return web.json_response(state.progress_json(sim))
+
+    def _alpha(self, request):
+        alpha = self.state.alphas.get(request.match_info['alpha_id'])
+        if alpha is None:
+            raise web.HTTPNotFound(text='{"detail": "Not found."}', content_type='application/json')
+        return alpha
+
+    async def get_alpha(self, request):
+        return web.json_response(self._alpha(request))
+
+    async def patch_alpha(self, request):
+        alpha = self._alpha(request)
+        for key, value in (await request.json()).items():
+            if isinstance(value, dict) and isinstance(alpha.get(key), dict):
+                alpha[key].update(value)
+            elif key not in ('regular', 'combo', 'selection') or alpha.get(key) is not None:
+                alpha[key] = value
+        alpha['dateModified'] = _iso(time.time())
+        return web.json_response(alpha)
+
+    def _pending(self):
+        return web.Response(status=200, headers={'Retry-After': f"{self.state.sample('retry_after'):.1f}"})
+
+    async def get_check(self, request):
+        alpha = self._alpha(request)
+        if not self.state.ready(alpha['id'], 'check', time.time()):
+            return self._pending()
+        checks = [dict(check) for check in alpha['is']['checks'] if check['name'] != 'SELF_CORRELATION']
+        pc = self.state.prod_corr(alpha)
+        checks.append({'name': 'SELF_CORRELATION', 'result': 'PASS', 'limit': 0.7,
+                       'value': round(_rng_for('self', alpha['id']).uniform(0.0, 0.8), 4)})
+        checks.append({'name': 'PROD_CORRELATION', 'result': 'PASS' if pc < 0.7 else 'FAIL', 'limit': 0.7,
+                       'value': pc})
+        return web.json_response({'is': {'checks': checks}})
+
+    async def get_correlations(self, request):
+        alpha = self._alpha(request)
+        kind = request.match_info['kind']
+        if kind not in ('prod', 'self'):
+            raise web.HTTPNotFound()
+        if not self.state.ready(alpha['id'], kind, time.time()):
+            return self._pending()
+        rng = _rng_for(kind, alpha['id'])
+        if kind == 'prod':
+            value = self.state.prod_corr(alpha)
+            buckets = [[round(-1 + i / 10, 1), round(-0.9 + i / 10, 1), rng.randint(0, 500)] for i in range(20)]
+            return web.json_response({
+                'schema': {'name': 'prodCorrelation', 'title': 'Prod Correlation', 'properties': [
+                    {'name': 'min', 'title': 'Min', 'type': 'decimal'},
+                    {'name': 'max', 'title': 'Max', 'type': 'decimal'},
+                    {'name': 'alphas', 'title': '№ Alphas', 'type': 'integer'}]},
+                'records': buckets, 'min': round(-value / 2, 4), 'max': value})
+
+        region = alpha['settings'].get('region')
+        peers = [other for other in self.state.alphas.values()
+                 if other['stage'] == 'OS' and other['id'] != alpha['id'] and other['settings'].get('region') == region]
+        records = [[other['id'], other['name'], 'EQUITY', region, other['settings'].get('universe'),
+                    round(rng.uniform(-0.3, 0.8), 4), other['is']['sharpe'], other['is']['returns'],
+                    other['is']['turnover'], other['is']['fitness'], other['is']['margin']] for other in peers[:5]]
+        correlations = [record[5] for record in records]
+        return web.json_response({
+            'schema': {'name': 'selfCorrelation', 'title': 'Self Correlation', 'properties': [
+                {'name': name, 'title': name, 'type': 'string'} for name in
+                ('id', 'name', 'instrumentType', 'region', 'universe', 'correlation', 'sharpe', 'returns',
+                 'turnover', 'fitness', 'margin')]},
+            'records': records,
+            'min': min(correlations, default=None), 'max': max(correlations, default=None)})
+
+    async def get_pnl(self, request):
+        alpha = self._alpha(request)
+        return web.json_response({
+            'schema': {'name': 'pnl', 'title': 'PnL', 'properties': [
+                {'name': 'date', 'title': 'Date', 'type': 'date'},
+                {'name': 'pnl', 'title': 'PnL', 'type': 'amount'}]},
+            'records': self.state.pnl(alpha)})
+
+    @staticmethod
+    def _page(request, items, limit, offset):
+        page = items[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(items):
+            next_url = str(request.url.update_query({'offset': offset + limit}))
+        return web.json_response({'count': len(items), 'next': next_url, 'previous': None, 'results': page})
+
+    async def list_alphas(self, request):
+        filters, paging = parse_filters(request.rel_url.raw_query_string)
+        alphas = [alpha for alpha in self.state.alphas.values()
+                  if all(any(_compare(_lookup(alpha, field), op, value) for value in values)
+                         for field, op, values in filters)]
+        order = paging.get('order')
+        if order:
+            field = order.lstrip('-')
+            present = [alpha for alpha in alphas if _lookup(alpha, field) is not None]
+            missing = [alpha for alpha in alphas if _lookup(alpha, field) is None]
+            present.sort(key=lambda alpha: _lookup(alpha, field), reverse=order.startswith('-'))
+            alphas = present + missing
+        limit = min(int(paging.get('limit', 100)), 100)
+        return self._page(request, alphas, limit, int(paging.get('offset', 0)))
+
+    async def list_datasets(self, request):
+        query = request.query
+        region = query.get('region', 'USA')
+        datasets = [{'id': dataset_id, 'name': dataset_id, 'description': f'{dataset_id} mock dataset',
+                     'region': region, 'delay': int(query.get('delay', 1)), 'universe': query.get('universe'),
+                     'coverage': 0.8, 'fieldCount': self.state.config['fields_per_dataset']} for dataset_id in DATASETS]
+        return self._page(request, datasets, min(int(query.get('limit', 50)), 50), int(query.get('offset', 0)))
+
+    def _datafields(self, dataset_id, region, delay, universe):
+        rng = _rng_for('fields', dataset_id)
+        fields = []
+        for i in range(self.state.config['fields_per_dataset']):
+            roll = rng.random()
+            field_type = 'MATRIX' if roll < 0.7 else 'VECTOR' if roll < 0.95 else 'GROUP'
+            fields.append({'id': f'{dataset_id}_{field_type.lower()}_{i}', 'description': f'{dataset_id} field {i}',
+                           'dataset': {'id': dataset_id, 'name': dataset_id}, 'region': region, 'delay': delay,
+                           'universe': universe, 'type': field_type, 'coverage': round(rng.uniform(0.3, 1.0), 2),
+                           'userCount': rng.randint(0, 500), 'alphaCount': rng.randint(0, 5000), 'themes': []})
+        return fields
+
+    async def list_datafields(self, request):
+        query = request.query
+        args = (query.get('region', 'USA'), int(query.get('delay', 1)), query.get('universe'))
+        dataset_id = query.get('dataset.id')
+        search = query.get('search', '')
+        fields = []
+        for candidate in ([dataset_id] if dataset_id else DATASETS):
+            fields.extend(field for field in self._datafields(candidate, *args) if search in field['id'])
+        return self._page(request, fields, min(int(query.get('limit', 50)), 50), int(query.get('offset', 0)))
+
+    async def get_stats(self, request):
+        return web.json_response(self.state.stats())
+
+    async def post_config(self, request):
+        try:
+            self.state.configure(**await request.json())
+        except (KeyError, ValueError) as e:
+            return web.json_response({'detail': str(e)}, status=400)
+        return web.json_response(self.state.config)
+
+
+class MockBrain:
+    """
+    在后台线程运行的模拟服务器。
+
+    Example:
+        with start_mock_server(sim_time='const:1', fault_rates={'429': 0.05}) as server:
+            os.environ['BRAIN_API_URL'] = server.url  # 或把 server.url 作为 api_url 传给各模块
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        self.state = MockState(config)
+        self.app = MockBrainApp(self.state).app
+        self.host = host
+        self.port = port
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name='mock-brain', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self.app, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{self.host}:{self.port}'
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+    def configure(self, **changes):
+        """运行中修改配置（如 fault_rates），线程安全"""
+        self._loop.call_soon_threadsafe(lambda: self.state.configure(**changes))
+
+    def stats(self):
+        return asyncio.run_coroutine_threadsafe(self._stats(), self._loop).result()
+
+    async def _stats(self):
+        return self.state.stats()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def start_mock_server(host='127.0.0.1', port=0, **config):
+    """启动后台模拟服务器并返回 MockBrain；port=0 时自动选择空闲端口"""
+    return MockBrain(host, port, **config).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟 BRAIN API 服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sim-time', default=DEFAULT_CONFIG['sim_time'], help='模拟耗时分布，如 lognormal:20,0.5')
+    parser.add_argument('--retry-after', default=DEFAULT_CONFIG['retry_after'], help='Retry-After 分布')
+    parser.add_argument('--check-time', default=DEFAULT_CONFIG['check_time'])
+    parser.add_argument('--corr-time', default=DEFAULT_CONFIG['corr_time'])
+    parser.add_argument('--latency', default=DEFAULT_CONFIG['latency'], help='每个请求的服务端延迟分布')
+    parser.add_argument('--max-concurrent-sims', type=int, default=DEFAULT_CONFIG['max_concurrent_sims'])
+    parser.add_argument('--sim-error-rate', type=float, default=DEFAULT_CONFIG['sim_error_rate'])
+    parser.add_argument('--token-ttl', type=float, default=DEFAULT_CONFIG['token_ttl'])
+    parser.add_argument('--fault-429', type=float, default=0.0)
+    parser.add_argument('--fault-401', type=float, default=0.0)
+    parser.add_argument('--fault-5xx', type=float, default=0.0)
+    parser.add_argument('--fault-routes', default='', help='逗号分隔的接口名，如 progress,check；默认全部')
+    parser.add_argument('--seed-alphas', type=int, default=DEFAULT_CONFIG['seed_alphas'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', help='JSON 文件，覆盖上面的配置项（如实测的 sim_time 样本列表）')
+    args = parser.parse_args()
+
+    config = {
+        'sim_time': args.sim_time, 'retry_after': args.retry_after, 'check_time': args.check_time,
+        'corr_time': args.corr_time, 'latency': args.latency, 'max_concurrent_sims': args.max_concurrent_sims,
+        'sim_error_rate': args.sim_error_rate, 'token_ttl': args.token_ttl, 'seed_alphas': args.seed_alphas,
+        'fault_rates': {'429': args.fault_429, '401': args.fault_401, '5xx': args.fault_5xx},
+        'fault_routes': [route for route in args.fault_routes.split(',') if route] or None,
+        'seed': args.seed,
+    }
+    if args.profile:
+        with open(args.profile) as f:
+            config.update(json.load(f))
+    state = MockState(config)
+    print(f"🧪 模拟 BRAIN API: http://{args.host}:{args.port}  (设置 BRAIN_API_URL 指向该地址)")
+    web.run_app(MockBrainApp(state).app, host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
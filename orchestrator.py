@@ -0,0 +1,319 @@
+"""
+全区域模拟编排器
+
+取代分别运行 13 个 0*.py 区域脚本：每个脚本原来各自登录、各自拉数据字段、各自跑一个调度器，
+互相不知道对方，在同一批账号并发槽位上盲目争抢。这里把它们写成声明式的任务列表 JOBS，
+所有任务流共用一个账号池、一个调度器、一个持久化队列和一个结果缓存：
+    - 调度器有空槽时才向下拉任务，按区域公平份额从各任务流中挑下一个：
+      优先在途最少（其次已提交最少）的区域，同区域内优先在途最少、已提交最少的任务
+    - 每个任务流在第一次被拉取时才获取数据字段、生成表达式，中性化配置逐个执行
+    - 批次名为 区域/宇宙/D延迟/数据集/中性化，同一区域的不同数据集各自成批；中断后重新运行会挂接上次
+      在途的任务，并跳过 sim_cache 里已经跑过的组合
+    - 表达式流的种子与 0*.py 脚本一样按 区域/宇宙/D延迟/数据集 保存在 sim_queue 里，中断后重新运行
+      生成同一个流、继续上次没跑完的任务；流全部跑完后才换新种子
+    - 每个区域的在途数写入指标 orchestrator_<区域>
+
+并发上限是每个账号的（accounts.json 里单独配置的账号以配置为准），不再是每个脚本各自的 CONCURRENT_SIMS。
+
+用法：
+    python orchestrator.py                        # 运行全部 JOBS
+    python orchestrator.py --only USA,JPN_delay0  # 按区域或任务名筛选
+    python orchestrator.py --jobs jobs.json       # 从 JSON 文件读取任务列表（字段同 JOBS）
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+from itertools import chain
+
+from alpha_generator import AlphaExpressionGenerator
+from fastexpr import ExpressionValidator, dedupe
+from machine_lib import (first_order_factory, generate_sim_data, get_account_pool, get_datafields,
+                         load_task_pool, ops_set, queue_tasks, run_sim_queue, shuffled)
+from metrics import metrics
+from sim_cache import SimCache
+from sim_queue import SimQueue
+
+NEUT_BASIC = ["NONE", "MARKET", "SECTOR", "INDUSTRY", "SUBINDUSTRY"]
+NEUT_RISK = ["NONE", "REVERSION_AND_MOMENTUM", "STATISTICAL", "CROWDING", "FAST", "SLOW",
+             "MARKET", "SECTOR", "INDUSTRY", "SUBINDUSTRY", "SLOW_AND_FAST"]
+NEUT_ALL = NEUT_RISK + ["COUNTRY"]
+NEUT_CHN = [neut for neut in NEUT_RISK if neut != "STATISTICAL"]
+
+# 与各 0*.py 脚本的配置区域一一对应
+JOBS = [
+    {'name': 'AMR_delay0', 'dataset': 'analyst16', 'region': 'AMR', 'universe': 'TOP600', 'delay': 0,
+     'data_type': 'VECTOR', 'neutralizations': NEUT_BASIC + ["COUNTRY"], 'decay': 60, 'task_pool_size': 2},
+    {'name': 'AMR_delay1', 'dataset': 'other335', 'region': 'AMR', 'universe': 'TOP600', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_BASIC + ["COUNTRY"], 'decay': 60, 'task_pool_size': 8},
+    {'name': 'ASI', 'dataset': 'news7', 'region': 'ASI', 'universe': 'MINVOL1M', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_ALL, 'decay': 5, 'task_pool_size': 2},
+    {'name': 'CHN_delay0', 'dataset': 'pv25', 'region': 'CHN', 'universe': 'TOP2000U', 'delay': 0,
+     'data_type': 'VECTOR', 'neutralizations': NEUT_CHN, 'decay': 60, 'task_pool_size': 8},
+    {'name': 'CHN_delay1', 'dataset': 'other543', 'region': 'CHN', 'universe': 'TOP2000U', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_CHN, 'decay': 60, 'task_pool_size': 8},
+    {'name': 'EUR_delay0', 'dataset': 'risk60', 'region': 'EUR', 'universe': 'TOP2500', 'delay': 0,
+     'data_type': 'VECTOR', 'neutralizations': ["CROWDING", "SLOW", "FAST", "REVERSION_AND_MOMENTUM", "STATISTICAL"],
+     'decay': 60, 'task_pool_size': 2},
+    {'name': 'EUR_delay1', 'dataset': 'earnings6', 'region': 'EUR', 'universe': 'TOP2500', 'delay': 1,
+     'data_type': 'VECTOR', 'neutralizations': NEUT_ALL, 'decay': 20, 'task_pool_size': 2},
+    {'name': 'GLB', 'dataset': 'other496', 'region': 'GLB', 'universe': 'MINVOL1M', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_ALL, 'decay': 60, 'task_pool_size': 2},
+    {'name': 'IND', 'dataset': 'other335', 'region': 'IND', 'universe': 'TOP500', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_BASIC, 'decay': 60, 'task_pool_size': 2},
+    {'name': 'JPN_delay0', 'dataset': 'pv1', 'region': 'JPN', 'universe': 'TOP1600', 'delay': 0,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_BASIC, 'decay': 20, 'task_pool_size': 8},
+    {'name': 'JPN_delay1', 'dataset': 'socialmedia39', 'region': 'JPN', 'universe': 'TOP1600', 'delay': 1,
+     'data_type': 'VECTOR', 'neutralizations': NEUT_BASIC, 'decay': 20, 'task_pool_size': 2},
+    {'name': 'USA_delay0', 'dataset': 'sentiment18', 'region': 'USA', 'universe': 'TOP3000', 'delay': 0,
+     'data_type': 'VECTOR', 'neutralizations': NEUT_RISK, 'decay': 20, 'task_pool_size': 2},
+    {'name': 'USA_delay1', 'dataset': 'news7', 'region': 'USA', 'universe': 'TOP3000', 'delay': 1,
+     'data_type': 'MATRIX', 'neutralizations': NEUT_RISK, 'decay': 20, 'task_pool_size': 2},
+]
+
+# 任务未写明时的默认值
+JOB_DEFAULTS = {'data_type': 'MATRIX', 'neutralizations': NEUT_BASIC, 'decay': 60, 'task_pool_size': 2,
+                'field_range': 30}
+
+
+def job_stream(job):
+    """任务的表达式流名（与 0*.py 脚本保存种子用的相同）"""
+    return '%s/%s/D%s/%s' % (job['region'], job['universe'], job['delay'], job['dataset'])
+
+
+def job_batch(job, neut):
+    """任务某个中性化配置对应的队列批次名，带上数据集，同区域的不同数据集不会共用批次"""
+    return '%s/%s' % (job_stream(job), neut)
+
+
+class JobStream:
+    """
+    一个区域任务的惰性任务流 (task_id, payload)。
+
+    第一次 next() 时才获取数据字段；每个中性化配置用同一个种子重新生成表达式，
+    得到相同的表达式和打乱顺序（字段窗口和生成方式与 0*.py 脚本一致）。
+    """
+
+    def __init__(self, job, s, queue, cache):
+        self.job = job
+        self.s = s
+        self.queue = queue
+        self.cache = cache
+        self.stream = job_stream(job)
+        self.seed = queue.stream_seed(self.stream)
+        self.neutralizations = list(dict.fromkeys(job['neutralizations']))
+        random.Random(self.seed).shuffle(self.neutralizations)
+        self.cache_hits = 0
+        self._tasks = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._tasks is None:
+            self._tasks = self._generate()
+        return next(self._tasks)
+
+    def _fields(self):
+        job = self.job
+        gdf = get_datafields(s=self.s, dataset_id=job['dataset'], region=job['region'],
+                             universe=job['universe'], delay=job['delay'])
+        all_fields = gdf[gdf['type'] == job['data_type']]['id'].tolist() if len(gdf) else []
+        size = job['field_range']
+        if len(all_fields) > size:
+            start_idx = random.Random(self.seed).randint(0, len(all_fields) - size)
+            fields = all_fields[start_idx: start_idx + size]
+        else:
+            fields = all_fields
+        print(f"  ✓ [{job['name']}] {job['dataset']} | 总字段: {len(all_fields)} | 使用: {len(fields)}")
+        return fields
+
+    def _task_pool(self, fields):
+        job = self.job
+        rng = random.Random(self.seed)
+        generator = AlphaExpressionGenerator(fields, job['data_type'], rng)
+        first_order = ExpressionValidator(generator.validator.vector_fields).filter(
+            first_order_factory(generator.generate_all(), ops_set), title='First Order 校验（按外层操作符）')
+        first_order = dedupe(first_order, 'First Order ')
+        tasks = shuffled(((expr, job['decay']) for expr in first_order), rng=rng)
+        return chain.from_iterable(load_task_pool(tasks, job['task_pool_size'], 1))
+
+    def _cache_misses(self, fields, neut):
+        job = self.job
+        for task in self._task_pool(fields):
+            misses, hits = self.cache.split(generate_sim_data(task, job['region'], job['universe'], neut, job['delay']))
+            self.cache_hits += len(hits)
+            if misses:
+                # 只剩一个子模拟时按单个 simulation 提交
+                yield misses[0] if len(misses) == 1 else misses
+
+    def _generate(self):
+        fields = self._fields()
+        for neut in self.neutralizations:
+            print(f"\n▶ [{self.job['name']}] 中性化 {neut}")
+            yield from queue_tasks(self.queue, job_batch(self.job, neut), self._cache_misses(fields, neut))
+
+
+class FairShare:
+    """
+    按公平份额合并多个任务流：每次取下一个任务时，先选在途最少、在途相同时已提交最少的区域，
+    再在该区域里选在途最少、已提交最少的任务流。
+    在途数由调度器的提交/结束回调维护；任务流抛异常时丢弃该任务流，其余继续。
+    """
+
+    def __init__(self, streams):
+        self.streams = dict(streams)       # 任务名 -> JobStream
+        self.region = {name: stream.job['region'] for name, stream in self.streams.items()}
+        self.in_flight = Counter()         # 任务名 -> 在途数
+        self.region_in_flight = Counter()  # 区域 -> 在途数
+        self.served = Counter()            # 任务名 -> 已取出任务数
+        self.region_served = Counter()     # 区域 -> 已取出任务数
+        self.job_of = {}                   # task_id -> 任务名
+        self.done = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.streams:
+            name = min(self.streams, key=lambda job: (self.region_in_flight[self.region[job]],
+                                                      self.region_served[self.region[job]],
+                                                      self.in_flight[job], self.served[job]))
+            try:
+                task = next(self.streams[name])
+            except StopIteration:
+                print(f"\n✓ [{name}] 全部中性化配置已提交")
+                self.done.append(name)
+                del self.streams[name]
+                continue
+            except Exception as e:
+                print(f"\n❌ [{name}] 任务流出错，跳过该任务: {type(e).__name__} - {e}")
+                del self.streams[name]
+                continue
+            self.served[name] += 1
+            self.region_served[self.region[name]] += 1
+            self.job_of[task[0]] = name
+            return task
+        raise StopIteration
+
+    def _track(self, name, delta):
+        self.in_flight[name] += delta
+        region = self.region[name]
+        self.region_in_flight[region] += delta
+        metrics.set_gauge('orchestrator_%s' % region, self.region_in_flight[region])
+
+    def resumed(self, task_id, name):
+        """上次在途、本次直接挂接的任务"""
+        self.job_of[task_id] = name
+        self._track(name, 1)
+
+    def submitted(self, task_id, progress_url):
+        self._track(self.job_of[task_id], 1)
+
+    def finished(self, task_id, progress):
+        name = self.job_of.pop(task_id, None)
+        if name is not None:
+            self._track(name, -1)
+
+
+def load_jobs(path=None, only=None):
+    """
+    读取任务列表并补全默认值。
+
+    Args:
+        path: JSON 文件路径，为 None 时用 JOBS
+        only: 只保留任务名或区域在其中的任务
+    """
+    if path:
+        with open(path, encoding='utf-8') as f:
+            jobs = json.load(f)
+    else:
+        jobs = JOBS
+    jobs = [dict(JOB_DEFAULTS, **job) for job in jobs]
+    for job in jobs:
+        job.setdefault('name', '%s_delay%s' % (job['region'], job['delay']))
+    if only:
+        jobs = [job for job in jobs if job['name'] in only or job['region'] in only]
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("任务名重复: %s" % [name for name, count in Counter(names).items() if count > 1])
+    # 同一个 区域/宇宙/D延迟/数据集 的两个任务会共用种子和批次，重复挂接、重复计数
+    streams = [job_stream(job) for job in jobs]
+    if len(set(streams)) != len(streams):
+        raise ValueError("任务的 区域/宇宙/D延迟/数据集 重复: %s"
+                         % [stream for stream, count in Counter(streams).items() if count > 1])
+    return jobs
+
+
+def orchestrate(jobs, concurrency=3):
+    """
+    用一个调度器跑完全部任务。
+
+    Args:
+        jobs: load_jobs 返回的任务列表
+        concurrency: 每个账号同时在途的 multi-simulation 数
+
+    Returns:
+        dict: 调度器统计
+    """
+    accounts = get_account_pool()
+    s = accounts.default.session
+    cache = SimCache()
+    queue = SimQueue()
+
+    streams = {job['name']: JobStream(job, s, queue, cache) for job in jobs}
+    feed = FairShare(streams)
+    batches = {}  # 批次名 -> 任务名，去重后每个批次只挂接一次
+    for job in jobs:
+        for neut in job['neutralizations']:
+            batches.setdefault(job_batch(job, neut), job['name'])
+    for batch, name in batches.items():
+        for task_id, *_ in queue.in_flight(batch):
+            feed.resumed(task_id, name)
+
+    print("=" * 70)
+    print(f"全区域编排: {len(jobs)} 个任务 | {len(accounts)} 个账号 | 每账号并发 {concurrency}")
+    for job in jobs:
+        print(f"  {job['name']:<12} {job['dataset']:<14} {job['region']}/{job['universe']}/D{job['delay']} "
+              f"{job['data_type']} | 中性化 {len(job['neutralizations'])} 个 | 衰减 {job['decay']}")
+    print("=" * 70)
+
+    start = time.time()
+    stats = run_sim_queue(queue, list(batches), concurrency, feed, cache,
+                          on_submit=feed.submitted, on_complete=feed.finished)
+    # 全部产出完的流下次运行换新种子；出错被丢弃的流保留种子，下次从中断处继续
+    for name in feed.done:
+        queue.release_seed(streams[name].stream)
+
+    print("\n" + "=" * 70)
+    print("✓ 全部模拟完成！用时 %.0f 秒" % (time.time() - start))
+    print("submitted %(submitted)d complete %(complete)d error %(error)d rejected %(rejected)d" % stats)
+    for job in jobs:
+        counts = Counter()
+        for neut in dict.fromkeys(job['neutralizations']):
+            counts.update(queue.counts(job_batch(job, neut)))
+        print(f"  {job['name']:<12} 已提交 {feed.served[job['name']]} | 缓存命中 {streams[job['name']].cache_hits} "
+              f"| 队列 {dict(counts)}")
+    print("=" * 70)
+    queue.close()
+    cache.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在一个进程里按公平份额运行全部区域的模拟任务')
+    parser.add_argument('--jobs', help='任务列表 JSON，字段同 orchestrator.JOBS，默认用内置的 JOBS')
+    parser.add_argument('--only', help='逗号分隔的任务名或区域，只运行这些任务')
+    parser.add_argument('--concurrency', type=int, default=3, help='每个账号同时在途的 multi-simulation 数')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    orchestrate(load_jobs(args.jobs, only), args.concurrency)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠ 用户中断")
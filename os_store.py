@@ -0,0 +1,118 @@
+"""
+进程内的 OS alpha 收益率数据
+
+检查脚本每轮 download_data 之后把 os_alpha_ids / 新增 alpha 的 PnL / ppac_alpha_ids 交给这里，
+收益率（pnl 差分、近4年窗口）只为新增的列计算；之后按 tag（None / 'PPAC' / 'SelfCorr'）和区域取的视图都缓存起来，
+逐个检查候选 alpha 时不再重复反序列化 pickle、重算收益率。
+
+只有 download_data 真的下载到新 alpha 时才调用 extend，其余轮次沿用内存里的数据。
+"""
+import pickle
+from pathlib import Path
+
+import pandas as pd
+
+from pnl_store import open_pnl_store
+
+TAGS = (None, 'PPAC', 'SelfCorr')
+
+
+def _returns(pnls):
+    """累计 PnL → 日收益率"""
+    return pnls - pnls.ffill().shift(1)
+
+
+class OSReturnsStore:
+    """OS alpha 收益率及其按 tag / 区域切好的视图"""
+
+    def __init__(self):
+        self.version = 0
+        self.os_alpha_ids = None
+        self.ppac_alpha_ids = set()
+        self.os_alpha_rets = None
+        self._views = {}
+        self._regions = {}
+
+    @property
+    def loaded(self):
+        return self.os_alpha_rets is not None
+
+    def update(self, os_alpha_ids, os_alpha_pnls, ppac_alpha_ids):
+        """
+        用完整的 PnL 数据重建收益率并清空视图缓存。
+
+        Args:
+            os_alpha_ids: {region: [alpha_id]}
+            os_alpha_pnls: 日期 × alpha 的累计 PnL DataFrame
+            ppac_alpha_ids: Power Pool alpha id 列表
+        """
+        self._set(os_alpha_ids, _returns(os_alpha_pnls), ppac_alpha_ids)
+
+    def extend(self, os_alpha_ids, new_pnls, ppac_alpha_ids):
+        """只为新增 alpha 计算收益率，拼到已有收益率上"""
+        if not self.loaded:
+            raise RuntimeError("OS 收益率尚未加载，不能增量更新")
+        rets = pd.concat([self.os_alpha_rets, _returns(new_pnls)], axis=1).sort_index()
+        self._set(os_alpha_ids, rets, ppac_alpha_ids)
+
+    def load(self, data_path):
+        """从 download_data 保存的 id 列表和按列存储的 PnL 加载（进程启动后第一次使用时）"""
+        data_path = Path(data_path)
+        objs = []
+        for name in ('os_alpha_ids', 'ppac_alpha_ids'):
+            with open(str(data_path / name) + '.pickle', 'rb') as f:
+                objs.append(pickle.load(f))
+        os_alpha_ids, ppac_alpha_ids = objs
+        # 每段单独求收益率：差分只依赖该列自身的日期，与在合并后的日期轴上计算结果相同
+        frames = [_returns(segment) for segment in open_pnl_store(data_path).segments()]
+        rets = pd.concat(frames, axis=1).sort_index() if frames else pd.DataFrame()
+        self._set(os_alpha_ids, rets, ppac_alpha_ids)
+
+    def _set(self, os_alpha_ids, os_alpha_rets, ppac_alpha_ids):
+        present = set(os_alpha_rets.columns)
+        self.os_alpha_ids = {region: [alpha for alpha in ids if alpha in present]
+                             for region, ids in os_alpha_ids.items()}
+        exist_alpha = [alpha for ids in self.os_alpha_ids.values() for alpha in ids]
+        os_alpha_rets = os_alpha_rets[exist_alpha]
+        if len(os_alpha_rets.index):
+            dates = pd.to_datetime(os_alpha_rets.index)
+            os_alpha_rets = os_alpha_rets[dates > dates.max() - pd.DateOffset(years=4)]
+        self.ppac_alpha_ids = set(ppac_alpha_ids)
+        self.os_alpha_rets = os_alpha_rets
+        self._views.clear()
+        self._regions.clear()
+        self.version += 1
+
+    def view(self, tag=None):
+        """
+        与原 load_data(tag) 返回值相同的 (os_alpha_ids, os_alpha_rets)。
+
+        tag='PPAC' 只保留 Power Pool alpha；tag='SelfCorr' 排除 Power Pool alpha。
+        返回的对象在下次 update 之前保持同一引用，调用方不要原地修改。
+        """
+        if tag not in TAGS:
+            raise ValueError(f"未知的 tag: {tag}")
+        if tag not in self._views:
+            if tag == 'PPAC':
+                ids = {region: [a for a in alphas if a in self.ppac_alpha_ids]
+                       for region, alphas in self.os_alpha_ids.items()}
+            elif tag == 'SelfCorr':
+                ids = {region: [a for a in alphas if a not in self.ppac_alpha_ids]
+                       for region, alphas in self.os_alpha_ids.items()}
+            else:
+                ids = self.os_alpha_ids
+            columns = [alpha for alphas in ids.values() for alpha in alphas]
+            rets = self.os_alpha_rets if tag is None else self.os_alpha_rets[columns]
+            self._views[tag] = (ids, rets)
+        return self._views[tag]
+
+    def region(self, region, tag=None):
+        """某区域的收益率切片（按 tag 过滤后），没有数据时返回空 DataFrame"""
+        key = (region, tag)
+        if key not in self._regions:
+            ids, rets = self.view(tag)
+            self._regions[key] = rets[ids.get(region, [])]
+        return self._regions[key]
+
+
+os_store = OSReturnsStore()
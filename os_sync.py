@@ -0,0 +1,106 @@
+"""
+按时间水位线增量同步 alpha 列表（OS alpha 用 dateSubmitted，本地 alpha 目录用 dateModified）
+
+/users/self/alphas?stage=OS&order=-dateSubmitted 按提交时间倒序分页，翻到比上次记录的
+最新 dateSubmitted 更早的 alpha 就停止，因此无论两次运行之间提交了多少个 alpha 都不会漏，
+请求数也只和新增数量有关。水位线只在整次翻页成功后才前移，中途失败下次会从原水位线重新翻。
+
+水位线保存在 data_path/os_sync.json。
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from brain_async import API_URL
+from metrics import metrics
+from rate_limiter import paced_request
+
+
+def _parse(date_submitted):
+    """dateSubmitted 带时区偏移（夏令时前后不同），按时间而不是字符串比较"""
+    return datetime.fromisoformat(date_submitted.replace('Z', '+00:00'))
+
+
+def load_watermark(path):
+    """读取水位线（dateSubmitted 原始字符串），没有时返回 None"""
+    try:
+        with open(path) as f:
+            return json.load(f).get('dateSubmitted')
+    except (OSError, ValueError):
+        return None
+
+
+def save_watermark(path, date_submitted):
+    tmp_file = str(path) + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'dateSubmitted': date_submitted, 'updated': time.time()}, f)
+    os.replace(tmp_file, path)
+
+
+def newest_submitted(alphas, watermark=None, field='dateSubmitted'):
+    """alpha 列表与旧水位线中最新的 dateSubmitted（或 field 指定的时间字段）"""
+    dates = [alpha[field] for alpha in alphas if alpha.get(field)]
+    if watermark:
+        dates.append(watermark)
+    return max(dates, key=_parse) if dates else None
+
+
+def fetch_os_alphas_since(s, watermark=None, limit=100, max_retries=5, api_url=API_URL):
+    """
+    倒序翻页获取水位线之后（含同一时刻）提交的 OS alpha。
+
+    Args:
+        s: 已登录的 requests.Session
+        watermark: 上次同步记录的 dateSubmitted；None 表示全量
+        limit: 每页数量
+        max_retries: 单页失败重试次数
+
+    Returns:
+        (alphas, complete): complete 为 False 表示翻页中途失败，调用方不应前移水位线
+    """
+    return fetch_alphas_since(s, 'stage=OS', 'dateSubmitted', watermark, limit, max_retries, api_url)
+
+
+def fetch_alphas_since(s, query, field, watermark=None, limit=100, max_retries=5, api_url=API_URL):
+    """
+    按 field（dateSubmitted / dateModified 等）倒序翻页 /users/self/alphas，直到越过水位线。
+
+    Args:
+        query: 额外的查询参数，如 'stage=OS'；为空表示不过滤
+        field: 排序和比较用的时间字段
+
+    Returns:
+        (alphas, complete)
+    """
+    since = _parse(watermark) if watermark else None
+    alphas, seen = [], set()
+    offset = 0
+    while True:
+        url = f"{api_url}/users/self/alphas?{query + '&' if query else ''}limit={limit}&offset={offset}&order=-{field}"
+        response = None
+        for attempt in range(max_retries):
+            response = paced_request(s, 'GET', url)
+            if response.status_code == 429:
+                continue
+            if response.status_code < 400:
+                break
+            metrics.sleep(min(2 ** attempt, 60), 'backoff')
+        if response is None or response.status_code >= 400:
+            print(f"   ⚠️  [os_sync] 获取alpha列表失败 (offset={offset}, HTTP {getattr(response, 'status_code', None)})")
+            return alphas, False
+
+        results = response.json().get('results', [])
+        for alpha in results:
+            date_value = alpha.get(field)
+            if since is not None and date_value and _parse(date_value) < since:
+                print(f"   📊 [os_sync] 已越过水位线 {watermark}，新增/更新 {len(alphas)} 个alpha")
+                return alphas, True
+            # 翻页期间有新提交会让后续页整体后移，按 id 去重
+            if alpha['id'] not in seen:
+                seen.add(alpha['id'])
+                alphas.append(alpha)
+
+        if len(results) < limit:
+            return alphas, True
+        offset += limit
@@ -0,0 +1,154 @@
+"""
+按列存储、内存映射读取的 OS alpha PnL 数据
+
+目录结构（默认 data_path/os_pnl）：
+    index.json               段列表和 alpha id → (段号, 列号) 索引
+    seg_00001.dates.npy      该段的日期轴（'YYYY-MM-DD' 字符串）
+    seg_00001.pnl.npy        该段的 PnL 矩阵，float64、列主序，每个 alpha 一列连续存放
+
+每次 download_data 新下载的 alpha 写成一个新段，旧段文件从不改写，写入量只和新增 alpha 数有关。
+读取时用 np.load(mmap_mode='r') 直接映射，不做反序列化。段数超过 MAX_SEGMENTS 时合并成一段。
+"""
+import json
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MAX_SEGMENTS = 64
+
+
+class PnLStore:
+    """
+    Args:
+        root: 存储目录
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.root / 'index.json'
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {'segments': [], 'columns': {}}
+        self.segment_names = index['segments']
+        self.columns = index['columns']
+
+    @property
+    def ids(self):
+        return list(self.columns)
+
+    def __contains__(self, alpha_id):
+        return alpha_id in self.columns
+
+    def __len__(self):
+        return len(self.columns)
+
+    def _save_index(self):
+        tmp_file = str(self.index_file) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'segments': self.segment_names, 'columns': self.columns}, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _next_name(self):
+        number = int(self.segment_names[-1].split('_')[1]) + 1 if self.segment_names else 1
+        return 'seg_%05d' % number
+
+    def _remove_segments(self, names):
+        for name in names:
+            for suffix in ('.dates.npy', '.pnl.npy'):
+                try:
+                    os.remove(self.root / (name + suffix))
+                except OSError:
+                    pass
+
+    def _write_segment(self, name, pnls):
+        for suffix, array in (('.dates.npy', np.asarray(pnls.index, dtype=str)),
+                              ('.pnl.npy', np.asfortranarray(pnls.to_numpy(dtype=np.float64)))):
+            tmp_file = self.root / (name + suffix + '.tmp')
+            with open(tmp_file, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_file, self.root / (name + suffix))
+
+    def append(self, pnls):
+        """
+        追加新 alpha 的 PnL；已存在的列忽略。
+
+        Args:
+            pnls: 日期为索引、alpha id 为列的 DataFrame
+
+        Returns:
+            int: 实际写入的列数
+        """
+        pnls = pnls.loc[:, [alpha_id for alpha_id in pnls.columns if alpha_id not in self.columns]]
+        if pnls.shape[1] == 0:
+            return 0
+        pnls = pnls.sort_index()
+        name = self._next_name()
+        self._write_segment(name, pnls)
+        segment = len(self.segment_names)
+        self.segment_names.append(name)
+        for column, alpha_id in enumerate(pnls.columns):
+            self.columns[alpha_id] = [segment, column]
+        self._save_index()
+        if len(self.segment_names) > MAX_SEGMENTS:
+            self.compact()
+        return pnls.shape[1]
+
+    def segments(self):
+        """逐段产出内存映射的 DataFrame（不复制数据），列顺序与索引一致"""
+        names_by_segment = [[] for _ in self.segment_names]
+        for alpha_id, (segment, column) in self.columns.items():
+            names_by_segment[segment].append((column, alpha_id))
+        for name, columns in zip(self.segment_names, names_by_segment):
+            dates = np.load(self.root / (name + '.dates.npy'), mmap_mode='r')
+            values = np.load(self.root / (name + '.pnl.npy'), mmap_mode='r')
+            columns.sort()
+            frame = pd.DataFrame(values, index=pd.Index(np.asarray(dates), name='Date'),
+                                 columns=[alpha_id for _, alpha_id in columns], copy=False)
+            yield frame
+
+    def frame(self, ids=None):
+        """所有段按日期对齐后的 PnL DataFrame；ids 给定时只取这些列"""
+        frames = list(self.segments())
+        if not frames:
+            return pd.DataFrame()
+        pnls = pd.concat(frames, axis=1).sort_index()
+        return pnls if ids is None else pnls[[alpha_id for alpha_id in ids if alpha_id in self.columns]]
+
+    def compact(self):
+        """把全部段合并成一段，删除旧段文件"""
+        pnls = self.frame()
+        old_names = self.segment_names
+        name = self._next_name()
+        self._write_segment(name, pnls)
+        self.segment_names = [name]
+        self.columns = {alpha_id: [0, column] for column, alpha_id in enumerate(pnls.columns)}
+        self._save_index()
+        self._remove_segments(old_names)
+
+    def clear(self):
+        """清空存储（全量重新下载时使用）"""
+        old_names = self.segment_names
+        self.segment_names, self.columns = [], {}
+        self._save_index()
+        self._remove_segments(old_names)
+
+
+def open_pnl_store(data_path):
+    """
+    打开 data_path/os_pnl 下的存储；存储为空而旧的 os_alpha_pnls.pickle 存在时，导入一次作为第一段。
+    """
+    data_path = Path(data_path)
+    store = PnLStore(data_path / 'os_pnl')
+    legacy_file = data_path / 'os_alpha_pnls.pickle'
+    if len(store) == 0 and legacy_file.exists():
+        with open(legacy_file, 'rb') as f:
+            pnls = pickle.load(f)
+        count = store.append(pnls)
+        print(f"   📦 [PnLStore] 已从 {legacy_file.name} 导入 {count} 个alpha的PnL")
+    return store
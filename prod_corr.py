@@ -0,0 +1,257 @@
+"""
+生产相关性轮询服务
+
+/alphas/{id}/correlations/prod 要等服务器算完，期间一直返回 Retry-After。旧代码在主循环里逐个 alpha
+阻塞等待，一个候选最多卡10分钟，其余候选只能排队。
+
+这里把所有待查的 alpha 放进一个按"下次可轮询时间"排序的堆里，后台线程的事件循环每次只轮询已经到期的，
+每次请求只发一次、不在请求内等待：Retry-After 写回堆里作为下次轮询时间，412/其他错误码按指数退避，
+429 由共享限速器排队。每个 alpha 从提交起有独立的10分钟预算，超过记为 timeout，不影响其他 alpha。
+
+结果以 concurrent.futures.Future 返回，也可以传回调。
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+from brain_async import AsyncBrainClient
+from metrics import metrics
+
+MAX_WAIT = 10 * 60
+
+
+class ProdCorrResult:
+    """
+    单个 alpha 的生产相关性结果。
+
+    Attributes:
+        alpha_id: alpha ID
+        status: 'ok' / 'timeout' / 'error'
+        value: 返回 JSON 中的 max（ok 时，可能为 None）
+        polls: 发起请求的次数
+        elapsed: 从提交到出结果的秒数
+        error: 最后一次错误说明
+    """
+
+    def __init__(self, alpha_id, status, value=None, polls=0, elapsed=0.0, error=None):
+        self.alpha_id = alpha_id
+        self.status = status
+        self.value = value
+        self.polls = polls
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+    def __repr__(self):
+        return f"ProdCorrResult({self.alpha_id}, {self.status}, value={self.value}, polls={self.polls})"
+
+
+class _Job:
+    def __init__(self, alpha_id, future, started, deadline):
+        self.alpha_id = alpha_id
+        self.future = future
+        self.started = started
+        self.deadline = deadline
+        self.polls = 0
+        self.error_count = {}
+        self.last_error = None
+
+
+class ProdCorrService:
+    """
+    后台线程里的生产相关性轮询服务。
+
+    Args:
+        s: 已登录的 requests.Session（沿用其 cookie 和账号，401 时客户端自动重新认证）
+        concurrency: 同时在途的请求数
+        max_wait: 每个 alpha 的等待预算（秒）
+        max_errors: 连续请求异常（网络错误等）达到该次数记为 error
+        api_url: API根地址
+
+    Example:
+        with ProdCorrService(sess) as service:
+            futures = [service.submit(alpha_id) for alpha_id in alpha_ids]
+            for future in as_completed(futures):
+                result = future.result()
+    """
+
+    def __init__(self, s, concurrency=10, max_wait=MAX_WAIT, max_errors=5, api_url=None):
+        self.s = s
+        self.concurrency = max(1, int(concurrency))
+        self.max_wait = max_wait
+        self.max_errors = max_errors
+        self.api_url = api_url
+        self.stats = {'submitted': 0, 'polls': 0, 'ok': 0, 'timeout': 0, 'error': 0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._startup_error = None
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._main(),),
+                                        name='prod-corr', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            # 客户端没建起来（如认证失败），服务线程已退出
+            self._thread.join()
+            self._loop.close()
+            raise self._startup_error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, alpha_id, callback=None):
+        """
+        提交一个 alpha，立即返回 Future，结果为 ProdCorrResult。
+
+        Args:
+            callback: 出结果时调用 callback(result)；在服务线程里执行，应尽快返回
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError('ProdCorrService 服务线程已停止')
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(f.result()))
+        self.stats['submitted'] += 1
+        self._loop.call_soon_threadsafe(self._add, alpha_id, future)
+        return future
+
+    def submit_many(self, alpha_ids, callback=None):
+        """批量提交，返回 {alpha_id: Future}"""
+        return {alpha_id: self.submit(alpha_id, callback) for alpha_id in dict.fromkeys(alpha_ids)}
+
+    def close(self, wait=True):
+        """停止服务；wait 为 True 时先等已提交的 alpha 全部出结果"""
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._stop, wait)
+            self._thread.join()
+        self._loop.close()
+
+    def _add(self, alpha_id, future):
+        now = self._loop.time()
+        job = _Job(alpha_id, future, now, now + self.max_wait)
+        self._schedule(now, job)
+        self._active += 1
+
+    def _schedule(self, when, job):
+        heapq.heappush(self._heap, (when, next(self._seq), job))
+        self._wakeup.set()
+
+    def _stop(self, wait):
+        self._stopping = True
+        if not wait:
+            for _, _, job in self._heap:
+                self._resolve(job, 'error', error='服务已关闭')
+            self._heap.clear()
+        self._wakeup.set()
+
+    def _resolve(self, job, status, value=None, error=None):
+        result = ProdCorrResult(job.alpha_id, status, value, job.polls, self._loop.time() - job.started,
+                                error or job.last_error)
+        self.stats[status] += 1
+        self._active -= 1
+        self._wakeup.set()
+        job.future.set_result(result)
+
+    async def _main(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._active = 0
+        slots = asyncio.Semaphore(self.concurrency)
+        kwargs = {'max_connections': self.concurrency}
+        if self.api_url:
+            kwargs['api_url'] = self.api_url
+        try:
+            client = AsyncBrainClient.from_session(self.s, **kwargs)
+            await client.__aenter__()
+        except Exception as e:
+            self._startup_error = e
+            return
+        finally:
+            self._ready.set()
+        tasks = set()
+        try:
+            while not (self._stopping and self._active == 0):
+                self._wakeup.clear()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+                delay = self._heap[0][0] - self._loop.time()
+                if delay > 0:
+                    # 最早的到期前可能有新提交或结果，被唤醒时重新看堆顶
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                _, _, job = heapq.heappop(self._heap)
+                metrics.set_gauge('prod_corr_waiting', len(self._heap))
+                metrics.set_gauge('prod_corr_active', self._active)
+                await slots.acquire()
+                task = asyncio.create_task(self._poll(client, job))
+                tasks.add(task)
+                task.add_done_callback(lambda t: (tasks.discard(t), slots.release()))
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await client.__aexit__(None, None, None)
+
+    async def _poll(self, client, job):
+        now = self._loop.time()
+        remaining = job.deadline - now
+        if remaining <= 0:
+            self._resolve(job, 'timeout')
+            return
+        job.polls += 1
+        self.stats['polls'] += 1
+        try:
+            # 只发一次；429 在请求内由限速器排队，但不超过剩余预算
+            response = await client.request('GET', '/alphas/' + job.alpha_id + '/correlations/prod',
+                                            follow_retry_after=False, max_wait=remaining)
+        except Exception as e:
+            job.last_error = f"{type(e).__name__} - {str(e)[:50]}"
+            count = job.error_count['exception'] = job.error_count.get('exception', 0) + 1
+            if count >= self.max_errors:
+                self._resolve(job, 'error')
+            else:
+                self._retry(job, min(2 ** count, 60))
+            return
+        job.error_count.pop('exception', None)
+
+        if response.timed_out:
+            self._resolve(job, 'timeout')
+            return
+        status_code = response.status_code
+        retry_after = float(response.headers.get('Retry-After', 0) or 0)
+        if status_code < 400:
+            if retry_after > 0:
+                self._retry(job, retry_after)
+                return
+            try:
+                value = response.json().get('max', None)
+            except ValueError as e:
+                self._resolve(job, 'error', error=f"响应解析失败: {e}")
+                return
+            self._resolve(job, 'ok', value)
+            return
+
+        count = job.error_count[status_code] = job.error_count.get(status_code, 0) + 1
+        job.last_error = f"HTTP {status_code}"
+        if count == 1 or count % 5 == 0:
+            print(f"   ⚠️  [ProdCorr] {job.alpha_id} 返回状态码 {status_code}（已重试 {count} 次）")
+        # 412 前置条件不满足：2秒起步最多120秒；其他错误码最多180秒
+        self._retry(job, retry_after or min(2 ** count, 120 if status_code == 412 else 180))
+
+    def _retry(self, job, wait):
+        now = self._loop.time()
+        if now + wait > job.deadline:
+            self._resolve(job, 'timeout')
+        else:
+            self._schedule(now + wait, job)
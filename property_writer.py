@@ -0,0 +1,237 @@
+"""
+后台合并写入 alpha 属性（write-behind）
+
+检查脚本在候选循环里对每个 alpha 打颜色/标签/名称，原来每次都是一个阻塞的 PATCH。
+这里把 PATCH 请求体放进本地队列立即返回，由后台线程按 patch 类限速器的速率逐个发送：
+    - 合并：同一个 alpha 排队中的多次修改合并成一个请求体（后写的字段覆盖先写的，
+      description 等嵌套字段逐项合并），与按顺序逐个 PATCH 的最终结果相同
+    - 持久化：队列保存在 SQLite（默认 property_queue.db，可用 BRAIN_PROPERTY_QUEUE 指定），
+      每次入队立即提交；进程崩溃后重新运行会继续发送上次没发完的修改
+    - 失败：重试 max_retries 次仍失败的记录标为 failed 留在库里，不会被静默丢弃
+
+需要读回服务器状态之前（如提交检查、下一轮筛选）调用 flush() 等队列清空。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from brain_async import API_URL
+from metrics import metrics
+from rate_limiter import paced_request
+
+PENDING = 'pending'
+FAILED = 'failed'
+
+
+def merge_params(old, new):
+    """合并两个 PATCH 请求体：new 的字段覆盖 old，两边都是 dict 的字段递归合并"""
+    merged = dict(old)
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_params(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class PropertyWriter:
+    """
+    Args:
+        s: 已登录的 requests.Session
+        path: 队列数据库路径
+        linger: 入队后至少等待的秒数，期间对同一 alpha 的后续修改合并进同一个请求
+        max_retries: 单个 alpha 的最大失败次数，超过后标为 failed
+        relogin: 401/403 时调用的无参函数，返回新的 session
+        api_url: API根地址
+    """
+
+    def __init__(self, s, path=None, linger=1.0, max_retries=5, relogin=None, api_url=API_URL):
+        self.s = s
+        self.path = path or os.environ.get('BRAIN_PROPERTY_QUEUE', 'property_queue.db')
+        self.linger = linger
+        self.max_retries = max_retries
+        self.relogin = relogin
+        self.api_url = api_url
+        self.stats = {'queued': 0, 'coalesced': 0, 'sent': 0, 'failed': 0}
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS property_update ('
+            ' alpha_id TEXT PRIMARY KEY,'
+            ' payload TEXT NOT NULL,'
+            ' version INTEGER NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' next_at REAL NOT NULL,'
+            ' error TEXT,'
+            ' updated REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_property_update_due ON property_update (state, next_at)')
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closing = False
+        resumed = self.pending()
+        if resumed:
+            print(f"   📝 [PropertyWriter] 继续发送上次未完成的 {resumed} 个属性修改")
+        self._thread = threading.Thread(target=self._run, name='property-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, alpha_id, params):
+        """
+        排队一次 PATCH /alphas/{alpha_id}，立即返回。
+
+        Args:
+            params: PATCH 请求体（与 set_alpha_properties 构造的相同）
+        """
+        now = time.time()
+        with self._changed:
+            # 之前失败的修改也合并进来，一起重新发送
+            row = self.conn.execute('SELECT payload, version FROM property_update WHERE alpha_id = ?',
+                                    (alpha_id,)).fetchone()
+            if row:
+                payload, version = merge_params(json.loads(row[0]), params), row[1] + 1
+                self.stats['coalesced'] += 1
+            else:
+                payload, version = params, 1
+            with self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO property_update (alpha_id, payload, version, state, attempts, next_at, updated)'
+                    ' VALUES (?, ?, ?, ?, 0, ?, ?)',
+                    (alpha_id, json.dumps(payload), version, PENDING, now + self.linger, now))
+            self.stats['queued'] += 1
+            self._gauge()
+            self._changed.notify_all()
+
+    def pending(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM property_update WHERE state = ?', (PENDING,)).fetchone()[0]
+
+    def failed(self):
+        """重试耗尽的修改：[(alpha_id, 请求体, 错误)]"""
+        with self._lock:
+            rows = self.conn.execute('SELECT alpha_id, payload, error FROM property_update WHERE state = ?',
+                                     (FAILED,)).fetchall()
+        return [(alpha_id, json.loads(payload), error) for alpha_id, payload, error in rows]
+
+    def flush(self, timeout=None):
+        """
+        立即发送全部排队的修改（不再等 linger），阻塞到队列清空。
+
+        Returns:
+            bool: 超时前是否已清空（后台线程已停止时立即返回 False）
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            with self.conn:
+                self.conn.execute('UPDATE property_update SET next_at = MIN(next_at, ?) WHERE state = ? AND attempts = 0',
+                                  (time.time(), PENDING))
+            self._changed.notify_all()
+            while self.conn.execute('SELECT 1 FROM property_update WHERE state = ? LIMIT 1', (PENDING,)).fetchone():
+                if not self._thread.is_alive():
+                    print("   ⚠️  [PropertyWriter] 后台线程已停止，未发送的修改保留在库里，下次启动继续")
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining if remaining is not None else 1.0)
+        return True
+
+    def close(self, timeout=None):
+        """发送完排队的修改后停止后台线程；未发完的保留在库里，下次启动继续"""
+        self.flush(timeout)
+        with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        self._thread.join()
+        self.conn.close()
+        print(f"   📝 [PropertyWriter] 入队 {self.stats['queued']} 次，合并 {self.stats['coalesced']} 次，"
+              f"发送 {self.stats['sent']} 个请求，失败 {self.stats['failed']} 个")
+
+    def _gauge(self):
+        """更新队列深度指标（调用方持有锁）"""
+        metrics.set_gauge('property_queue', self.conn.execute(
+            'SELECT COUNT(*) FROM property_update WHERE state = ?', (PENDING,)).fetchone()[0])
+
+    def _next(self):
+        """取最早到期的一条；没有到期的时等待。返回 (alpha_id, payload, version, attempts) 或 None（关闭）"""
+        with self._changed:
+            while not self._closing:
+                row = self.conn.execute(
+                    'SELECT alpha_id, payload, version, attempts, next_at FROM property_update'
+                    ' WHERE state = ? ORDER BY next_at LIMIT 1', (PENDING,)).fetchone()
+                if row is None:
+                    self._changed.wait()
+                    continue
+                wait = row[4] - time.time()
+                if wait > 0:
+                    self._changed.wait(wait)
+                    continue
+                return row[0], json.loads(row[1]), row[2], row[3]
+            return None
+
+    def _done(self, alpha_id, version):
+        """发送成功：期间没有新的合并才删除，否则留给下一轮发送合并后的请求体"""
+        with self._changed:
+            with self.conn:
+                self.conn.execute('DELETE FROM property_update WHERE alpha_id = ? AND version = ?', (alpha_id, version))
+            self.stats['sent'] += 1
+            self._gauge()
+            self._changed.notify_all()
+
+    def _retry(self, alpha_id, version, attempts, wait, error):
+        with self._changed:
+            attempts += 1
+            if attempts >= self.max_retries:
+                state = FAILED
+                self.stats['failed'] += 1
+                print(f"   ❌ [PropertyWriter] 设置 {alpha_id} 属性失败，已重试 {attempts} 次: {error[:120]}")
+            else:
+                state = PENDING
+            with self.conn:
+                self.conn.execute(
+                    'UPDATE property_update SET state = ?, attempts = ?, next_at = ?, error = ?, updated = ?'
+                    ' WHERE alpha_id = ? AND version = ?',
+                    (state, attempts, time.time() + wait, error, time.time(), alpha_id, version))
+            self._gauge()
+            self._changed.notify_all()
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            alpha_id, params, version, attempts = item
+            try:
+                self._send(alpha_id, params, version, attempts)
+            except Exception as e:
+                # 重新登录失败（AuthenticationError）等意外异常也按失败重试，不能让后台线程退出
+                self._retry(alpha_id, version, attempts, 2 ** attempts, f"{type(e).__name__}: {str(e)[:80]}")
+
+    def _send(self, alpha_id, params, version, attempts):
+        try:
+            response = paced_request(self.s, 'PATCH', self.api_url + '/alphas/' + alpha_id,
+                                     json=params, timeout=600)
+        except requests.exceptions.RequestException as e:
+            self._retry(alpha_id, version, attempts, 2 ** attempts, f"网络异常: {str(e)[:80]}")
+            return
+
+        if response.status_code == 429:
+            # 限速器已暂停 PATCH 类接口，下一次取令牌会自动等待
+            return
+        if response.status_code in (401, 403) and self.relogin is not None:
+            new_session = self.relogin()
+            if new_session is not None:
+                self.s = new_session
+            self._retry(alpha_id, version, attempts, 0, f"认证失败 {response.status_code}")
+            return
+        if response.status_code >= 400:
+            retry_after = float(response.headers.get('Retry-After', 0) or 0)
+            self._retry(alpha_id, version, attempts, retry_after or 2 ** attempts,
+                        f"API错误 {response.status_code}: {response.text[:200]}")
+            return
+        self._done(alpha_id, version)
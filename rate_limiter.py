@@ -0,0 +1,163 @@
+"""
+客户端令牌桶限速器
+
+按接口类别（simulate / poll / alpha / check / patch）各维护一个令牌桶，进程内所有 BRAIN 调用共用。
+请求前先取令牌，在服务器拒绝之前就把请求摊平；收到 429 时速率减半并按 Retry-After 暂停该类别，
+之后每次成功请求缓慢回升（AIMD），从而学到账号实际可持续的速率。
+
+设置环境变量 BRAIN_RATE_STATE=/path/to/state.json 后，桶状态保存在本地文件并用文件锁保护，
+同一台机器上的多个脚本进程共享同一套限速。
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为进程内限速
+    fcntl = None
+
+# 每个类别的初始/最大速率（请求/秒）
+DEFAULT_RATES = {
+    'simulate': 1.0,
+    'poll': 5.0,
+    'alpha': 5.0,
+    'check': 2.0,
+    'patch': 2.0,
+}
+
+
+def classify(method, url):
+    """根据方法和URL判断接口类别"""
+    method = method.upper()
+    path = urlparse(url).path
+    if method == 'PATCH':
+        return 'patch'
+    if path.startswith('/simulations'):
+        return 'simulate' if method == 'POST' else 'poll'
+    if path.endswith('/check') or '/correlations/' in path:
+        return 'check'
+    return 'alpha'
+
+
+class RateLimiter:
+    """
+    GCRA 形式的令牌桶：每个类别只需保存"理论到达时间"(tat)、当前速率和暂停截止时间，
+    便于序列化到文件里跨进程共享。
+
+    Args:
+        rates: 覆盖 DEFAULT_RATES 的速率字典
+        burst: 桶容量（允许的突发请求数）
+        min_rate: 速率下限
+        state_file: 跨进程共享的状态文件路径，None 表示仅进程内
+    """
+
+    def __init__(self, rates=None, burst=5, min_rate=0.05, state_file=None):
+        self.max_rates = dict(DEFAULT_RATES)
+        self.max_rates.update(rates or {})
+        self.burst = burst
+        self.min_rate = min_rate
+        self.state_file = state_file if fcntl is not None else None
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, state, cls):
+        return state.setdefault(cls, {'tat': 0.0, 'rate': self.max_rates.get(cls, 1.0), 'blocked_until': 0.0})
+
+    @contextmanager
+    def _locked_state(self):
+        with self._lock:
+            if not self.state_file:
+                yield self._state
+                return
+            with open(self.state_file + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(self.state_file) as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = self._state
+                yield state
+                tmp_file = self.state_file + '.tmp'
+                with open(tmp_file, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_file, self.state_file)
+                self._state = state
+
+    def reserve(self, cls):
+        """预约一个令牌，返回调用方需要等待的秒数（异步代码用 asyncio.sleep 等待）"""
+        now = time.time()
+        with self._locked_state() as state:
+            entry = self._entry(state, cls)
+            interval = 1.0 / entry['rate']
+            tat = max(entry['tat'], now)
+            send_at = max(now, tat - interval * (self.burst - 1), entry['blocked_until'])
+            entry['tat'] = max(tat, send_at) + interval
+        return send_at - now
+
+    def acquire(self, cls):
+        """同步阻塞直到可以发送，返回实际等待秒数"""
+        delay = self.reserve(cls)
+        metrics.sleep(delay, 'rate_limit')
+        return delay
+
+    def delay(self, cls):
+        """不取令牌，只查看该类别当前还需等待多久"""
+        now = time.time()
+        with self._locked_state() as state:
+            entry = self._entry(state, cls)
+            interval = 1.0 / entry['rate']
+            send_at = max(now, entry['tat'] - interval * (self.burst - 1), entry['blocked_until'])
+        return send_at - now
+
+    def observe(self, cls, status_code, retry_after=None):
+        """
+        根据响应调整速率。
+
+        429: 速率减半，并暂停该类别 Retry-After 秒（没有该头时暂停一个新的发送间隔）；
+        其他成功响应: 速率按最大速率的2%线性回升。
+
+        Returns:
+            float: 被限流时该类别的暂停秒数，否则为 0
+        """
+        now = time.time()
+        with self._locked_state() as state:
+            entry = self._entry(state, cls)
+            if status_code == 429:
+                entry['rate'] = max(self.min_rate, entry['rate'] * 0.5)
+                wait = float(retry_after) if retry_after else 1.0 / entry['rate']
+                entry['blocked_until'] = max(entry['blocked_until'], now + wait)
+                entry['tat'] = max(entry['tat'], entry['blocked_until'])
+                return wait
+            if status_code < 400:
+                max_rate = self.max_rates.get(cls, 1.0)
+                entry['rate'] = min(max_rate, entry['rate'] + max_rate * 0.02)
+        return 0.0
+
+    def rates(self):
+        """当前各类别学到的速率"""
+        with self._locked_state() as state:
+            return {cls: entry['rate'] for cls, entry in state.items()}
+
+
+limiter = RateLimiter(state_file=os.environ.get('BRAIN_RATE_STATE'))
+
+
+def paced_request(s, method, url, rate_limiter=None, **kwargs):
+    """
+    经过限速器发送同步请求：发送前取令牌，收到响应后反馈给限速器。
+    未指定 rate_limiter 时优先用 Session 所属账号的限速器（account_pool 多账号时），否则用进程级的 limiter。
+
+    被 429 拒绝时不在这里睡眠——该类别已被暂停，调用方直接重试即可，下一次取令牌会自动等待。
+    """
+    rate_limiter = rate_limiter or getattr(s, 'limiter', None) or limiter
+    cls = classify(method, url)
+    rate_limiter.acquire(cls)
+    response = s.request(method, url, **kwargs)
+    rate_limiter.observe(cls, response.status_code, response.headers.get('Retry-After'))
+    return response
@@ -0,0 +1,194 @@
+"""
+进程内共享的登录会话池
+
+原来 machine_lib.login、检查脚本的 sign_in / SessionManager、1super2 的 sign_in / relogin、world1/world3
+各自登录，很多函数每次进入都重新 POST /authentication。这里按账号只保留一个带连接池的 requests.Session，
+所有调用方共用：
+    - 记录登录令牌的过期时间（/authentication 返回的 token.expiry），距过期不足 refresh_margin 时
+      在下一次请求前主动重新认证
+    - 请求返回 401 时自动重新认证一次并重发该请求；多个线程同时遇到 401 只认证一次
+    - 重新认证只更新同一个 Session 的 cookie，已经拿到 Session 引用的调用方不需要替换对象
+
+异步代码用 async_client() 得到沿用同一份 cookie 的 AsyncBrainClient。
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from brain_async import API_URL, AsyncBrainClient
+from metrics import metrics
+
+CREDENTIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'brain.txt')
+
+# 服务器没有返回过期时间时按4小时估计
+DEFAULT_TTL = 4 * 3600
+
+
+class AuthenticationError(Exception):
+    """账号密码错误或多次重试后仍无法登录"""
+
+
+def load_credentials(path=None):
+    """从 brain.txt（JSON 数组 ["username", "password"]）读取账号密码；环境变量 BRAIN_CREDENTIALS 可指定其他路径"""
+    path = path or os.environ.get('BRAIN_CREDENTIALS') or CREDENTIALS_FILE
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"配置文件 {path} 不存在！\n"
+            f"请在该路径创建 brain.txt 文件，内容格式为 JSON 数组：\n"
+            f'["your_username", "your_password"]\n'
+            f"用户名和密码用双引号包围，不要有额外空格或换行。\n"
+            f"例如：[\"john.doe@example.com\", \"your_password\"]"
+        )
+    with open(path) as f:
+        username, password = json.load(f)
+    return username, password
+
+
+class PooledSession(requests.Session):
+    """由 SessionPool 管理的 Session：请求前检查令牌是否快过期，401 时重新认证后重发一次；每次请求计入 metrics"""
+
+    def __init__(self, pool, username, password):
+        super().__init__()
+        self.pool = pool
+        self.auth = (username, password)
+        self.expires_at = 0.0
+        self.authenticated_at = 0.0
+        self.auth_lock = threading.Lock()
+        # 该账号自己的限速器（account_pool 设置），为 None 时用进程级的 rate_limiter.limiter
+        self.limiter = None
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool.pool_maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        is_auth = url.rstrip('/').endswith('/authentication')
+        if not is_auth:
+            self.pool.ensure_fresh(self)
+        sent_at = time.time()
+        response = self._send(method, url, *args, **kwargs)
+        if response.status_code == 401 and not is_auth:
+            self.pool.refresh(self, stale_before=sent_at)
+            response = self._send(method, url, *args, **kwargs)
+        return response
+
+    def _send(self, method, url, *args, **kwargs):
+        """发送一次请求（不做令牌检查和 401 重试）并记录延迟和状态码"""
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            metrics.observe_error(method, url, e)
+            raise
+        metrics.observe_request(method, url, response.status_code, time.perf_counter() - started,
+                                response.headers.get('Retry-After'))
+        return response
+
+
+class SessionPool:
+    """
+    Args:
+        api_url: API根地址
+        refresh_margin: 距令牌过期不足该秒数时主动重新认证
+        max_retries: 单次认证遇到 429/网络错误的最大重试次数
+        pool_maxsize: 每个 Session 的连接池大小
+    """
+
+    def __init__(self, api_url=API_URL, refresh_margin=600, max_retries=5, pool_maxsize=32):
+        self.api_url = api_url
+        self.refresh_margin = refresh_margin
+        self.max_retries = max_retries
+        self.pool_maxsize = pool_maxsize
+        self.login_count = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, username=None, password=None):
+        """
+        取某账号的共享 Session，第一次调用时登录；账号为空时读取 brain.txt。
+
+        Raises:
+            AuthenticationError: 登录失败
+        """
+        if username is None:
+            username, password = load_credentials()
+        with self._lock:
+            s = self._sessions.get(username)
+            if s is None or s.auth != (username, password):
+                s = self._sessions[username] = PooledSession(self, username, password)
+        self.ensure_fresh(s)
+        return s
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def ensure_fresh(self, s):
+        """令牌不存在或快过期时重新认证"""
+        if time.time() < s.expires_at - self.refresh_margin:
+            return
+        with s.auth_lock:
+            if time.time() < s.expires_at - self.refresh_margin:
+                return
+            self._authenticate(s)
+
+    def refresh(self, s, stale_before=None):
+        """
+        强制重新认证（遇到 401 或登出时）。
+
+        Args:
+            stale_before: 只有上次认证早于该时间才真正认证，避免多个线程对同一批 401 重复登录
+        """
+        with s.auth_lock:
+            if stale_before is not None and s.authenticated_at > stale_before:
+                return s
+            self._authenticate(s)
+        return s
+
+    def _authenticate(self, s):
+        username = s.auth[0]
+        response = None
+        for attempt in range(self.max_retries):
+            try:
+                response = s._send('POST', self.api_url + '/authentication', timeout=30)
+            except requests.exceptions.RequestException as e:
+                print(f"   ⚠️  [SessionPool] 登录网络异常: {str(e)[:80]} (尝试 {attempt + 1}/{self.max_retries})")
+                metrics.sleep(min(2 ** attempt, 60), 'auth_backoff')
+                continue
+            if response.status_code in (200, 201):
+                try:
+                    ttl = float(response.json().get('token', {}).get('expiry') or DEFAULT_TTL)
+                except ValueError:
+                    ttl = DEFAULT_TTL
+                now = time.time()
+                s.authenticated_at = now
+                s.expires_at = now + ttl
+                self.login_count += 1
+                print(f"   🔐 [SessionPool] {username} 登录成功，令牌 {ttl / 3600:.1f} 小时后过期 (总登录次数: {self.login_count})")
+                return
+            if response.status_code in (401, 403):
+                raise AuthenticationError(f"登录失败：认证信息错误 (状态码: {response.status_code})，请检查账号 {username} 的密码")
+            wait_time = float(response.headers.get('Retry-After', 0) or 0) or min(2 ** attempt * 5, 120)
+            print(f"   🚦 [SessionPool] 登录返回 {response.status_code}，{wait_time:.0f} 秒后重试 (尝试 {attempt + 1}/{self.max_retries})")
+            metrics.sleep(wait_time, 'auth_backoff')
+        raise AuthenticationError(f"登录失败，已重试 {self.max_retries} 次 (最后状态码: {getattr(response, 'status_code', None)})")
+
+    def async_client(self, username=None, password=None, **kwargs):
+        """沿用共享 Session cookie 的 AsyncBrainClient（需在 async with 中使用）"""
+        return AsyncBrainClient.from_session(self.get(username, password), **kwargs)
+
+
+pool = SessionPool()
+
+
+def get_session(username=None, password=None):
+    """进程内共享的已登录 Session"""
+    return pool.get(username, password)
+
+
+def refresh_session(s=None):
+    """强制重新认证并返回同一个 Session；s 为空时刷新 brain.txt 中的账号"""
+    return pool.refresh(s if s is not None else pool.get())
@@ -0,0 +1,183 @@
+"""
+表达式→模拟结果的本地缓存
+
+以规范化后的 generate_sim_data 载荷（表达式 + region/universe/delay/decay/neutralization/truncation 等全部设置）
+的哈希为键，保存模拟得到的 alpha id 与 IS 指标。multi_simulate 提交前先查缓存，
+已经跑过的组合直接在本地命中，不再消耗模拟额度。
+
+模拟完成后写缓存要先取子模拟结果、再取 alpha 详情，两轮网络请求由 CacheRecorder 在后台线程完成，
+不占用调度器的轮询/补位线程。
+
+缓存文件默认是当前目录下的 sim_cache.db，可用环境变量 BRAIN_SIM_CACHE 指定路径。
+"""
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from brain_async import run_many
+from fastexpr import canonical
+from metrics import metrics
+
+# 不影响模拟结果的设置项，不参与键计算
+IGNORED_SETTINGS = ('visualization',)
+
+
+def canonical_expression(expression):
+    """表达式的规范形式，使写法不同但等价的表达式得到相同的键"""
+    return canonical(expression)
+
+
+def cache_key(payload):
+    """单个 simulation 载荷的内容哈希"""
+    settings = {k: v for k, v in payload.get('settings', {}).items() if k not in IGNORED_SETTINGS}
+    body = {
+        'type': payload.get('type'),
+        'settings': settings,
+        'regular': canonical_expression(payload.get('regular', '')),
+    }
+    text = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SimCache:
+    """
+    SQLite 保存的模拟结果缓存。
+
+    Args:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('BRAIN_SIM_CACHE', 'sim_cache.db')
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sim_result ('
+            ' key TEXT PRIMARY KEY,'
+            ' expression TEXT,'
+            ' settings TEXT,'
+            ' alpha_id TEXT,'
+            ' metrics TEXT,'
+            ' created REAL)'
+        )
+        self.conn.commit()
+
+    def get(self, payload):
+        """命中时返回 {'alpha_id', 'is'}，否则 None"""
+        row = self.conn.execute(
+            'SELECT alpha_id, metrics FROM sim_result WHERE key = ?', (cache_key(payload),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'alpha_id': row[0], 'is': json.loads(row[1]) if row[1] else {}}
+
+    def put(self, payload, alpha_id, metrics):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO sim_result VALUES (?, ?, ?, ?, ?, ?)',
+            (cache_key(payload), payload.get('regular'), json.dumps(payload.get('settings', {}), sort_keys=True),
+             alpha_id, json.dumps(metrics or {}), time.time())
+        )
+        self.conn.commit()
+
+    def split(self, payloads):
+        """
+        把一组载荷分成未命中和命中两部分。
+
+        Returns:
+            (misses, hits): misses 是需要提交的载荷列表；hits 是 (载荷, 缓存结果) 列表
+        """
+        misses, hits = [], []
+        for payload in payloads:
+            cached = self.get(payload)
+            if cached is None:
+                misses.append(payload)
+            else:
+                hits.append((payload, cached))
+        return misses, hits
+
+    def record(self, s, payloads, progress):
+        """
+        模拟结束后把结果写入缓存。
+
+        Args:
+            s: 已登录的 requests.Session
+            payloads: 提交时的载荷列表（与 multi-simulation 的 children 顺序一致）
+            progress: 进度URL最终返回的 JSON
+
+        Returns:
+            list: 解析出的 alpha id
+        """
+        if progress.get('status') != 'COMPLETE':
+            return []
+
+        if progress.get('alpha'):
+            alpha_ids = [progress['alpha']]
+        else:
+            children = progress.get('children', [])
+            responses = run_many(s, lambda c, child: c.wait_progress('/simulations/' + child), children)
+            alpha_ids = [None if isinstance(r, Exception) else r.json().get('alpha') for r in responses]
+
+        pairs = [(payload, alpha_id) for payload, alpha_id in zip(payloads, alpha_ids) if alpha_id]
+        alphas = run_many(s, lambda c, alpha_id: c.get_alpha(alpha_id), [alpha_id for _, alpha_id in pairs])
+        for (payload, alpha_id), response in zip(pairs, alphas):
+            metrics = {} if isinstance(response, Exception) else response.json().get('is', {})
+            self.put(payload, alpha_id, metrics)
+        return [alpha_id for _, alpha_id in pairs]
+
+    def close(self):
+        self.conn.close()
+
+
+class CacheRecorder:
+    """
+    在后台线程里执行 SimCache.record，调度器的完成回调只需排队即返回。
+
+    后台线程使用自己的 SimCache 连接（WAL 模式，可与其他连接并发读写），按提交顺序逐个处理。
+
+    Args:
+        path: 缓存数据库路径，与调度线程里查缓存用的 SimCache 相同
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sim-cache-recorder', daemon=True)
+        self._thread.start()
+
+    def submit(self, s, payloads, progress, callback=None):
+        """
+        排队写入一个结束的模拟。
+
+        Args:
+            s, payloads, progress: 同 SimCache.record
+            callback: callback(alpha_ids)，写入后在后台线程里调用
+        """
+        self._jobs.put((s, payloads, progress, callback))
+        metrics.set_gauge('sim_cache_recording', self._jobs.qsize())
+
+    def _run(self):
+        cache = SimCache(self.path)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                s, payloads, progress, callback = job
+                try:
+                    alpha_ids = cache.record(s, payloads, progress)
+                    if callback is not None:
+                        callback(alpha_ids)
+                except Exception as e:
+                    print(f"   ⚠️  [SimCache] 写入模拟结果失败: {type(e).__name__} - {str(e)[:80]}")
+                metrics.set_gauge('sim_cache_recording', self._jobs.qsize())
+        finally:
+            cache.close()
+
+    def close(self):
+        """等排队的结果全部写完后停止"""
+        self._jobs.put(None)
+        self._thread.join()
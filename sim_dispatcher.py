@@ -0,0 +1,278 @@
+"""
+滑动窗口模拟调度器
+
+保持固定数量的 multi-simulation 同时在途：任意一个进度URL返回 COMPLETE/ERROR 后立即补位，
+取代旧的按 pool 屏障批处理——一个跑20分钟的慢任务不再让其余并发槽位空等。
+
+传入 accounts（account_pool 的账号列表）时按账号分片：每个账号各有自己的并发上限、Session 和限速器，
+新任务交给在途占比最低的空闲账号，进度轮询始终由提交它的账号发出。
+"""
+import heapq
+import itertools
+import time
+from collections import deque
+
+from brain_async import API_URL
+from metrics import metrics
+from rate_limiter import limiter, paced_request
+
+
+class _Lane:
+    """一个账号的提交通道：Session、并发上限、限速器和该账号提交被限流后的恢复时间"""
+
+    def __init__(self, name, s, concurrency, relogin, rate_limiter):
+        self.name = name
+        self.s = s
+        self.concurrency = max(1, int(concurrency))
+        self.relogin = relogin
+        self.limiter = rate_limiter
+        self.in_flight = 0
+        self.submit_after = 0.0
+
+    @property
+    def load(self):
+        return self.in_flight / self.concurrency
+
+
+class SimulationDispatcher:
+    """
+    单线程滑动窗口调度器。
+
+    在途任务按"下次可轮询时间"放在堆里，每次只轮询最早到期的进度URL，
+    因此N个在途任务共享一个线程，不需要逐个阻塞等待。
+
+    Args:
+        s: 已登录的 requests.Session（传入 accounts 时可为 None）
+        concurrency: 同时在途的 multi-simulation 数量上限（多账号时为每个账号的默认上限）
+        relogin: 遇到401时调用的无参函数，返回新的session
+        api_url: API根地址
+        default_retry: 提交被限流且没有 Retry-After 时的等待秒数
+        on_complete: 任务结束回调 on_complete(task, progress_url, progress_json)
+        on_submit: 提交成功回调 on_submit(task, progress_url)
+        on_reject: 被服务器拒绝回调 on_reject(task, response_text)
+        accounts: account_pool.Account 列表；给出时按账号分片，忽略 s / relogin
+        poll_backoff: 轮询出错（5xx、没有 Retry-After 的 429 等）后第一次重试的等待秒数，之后翻倍
+        max_poll_backoff: 轮询出错后单次等待上限
+    """
+
+    def __init__(self, s, concurrency, relogin=None, api_url=API_URL,
+                 default_retry=60, on_complete=None, on_submit=None, on_reject=None, accounts=None,
+                 poll_backoff=5, max_poll_backoff=120):
+        if accounts:
+            self.lanes = [_Lane(account.username, account.session, account.concurrency or concurrency,
+                                account.refresh, account.limiter) for account in accounts]
+        else:
+            self.lanes = [_Lane(None, s, concurrency, relogin, getattr(s, 'limiter', None) or limiter)]
+        self.concurrency = sum(lane.concurrency for lane in self.lanes)
+        self.api_url = api_url
+        self.default_retry = default_retry
+        self.on_complete = on_complete
+        self.on_submit = on_submit
+        self.on_reject = on_reject
+        self.poll_backoff = poll_backoff
+        self.max_poll_backoff = max_poll_backoff
+        self.stats = {'submitted': 0, 'complete': 0, 'error': 0, 'rejected': 0}
+        self._seq = itertools.count()
+        self._owners = {}  # progress_url -> _Lane
+        self._poll_errors = {}  # progress_url -> 连续轮询失败次数
+
+    @property
+    def s(self):
+        """第一个账号的 Session（单账号时即传入的 Session）"""
+        return self.lanes[0].s
+
+    def account_for(self, progress_url):
+        """提交该进度URL的账号名（单账号时为 None）"""
+        lane = self._owners.get(progress_url)
+        return lane.name if lane is not None else None
+
+    def session_for(self, progress_url):
+        """提交该进度URL的账号的 Session，结果 alpha 的后续请求要用它发送"""
+        lane = self._owners.get(progress_url)
+        return lane.s if lane is not None else self.s
+
+    def _lane(self, name):
+        for lane in self.lanes:
+            if lane.name == name:
+                return lane
+        return self.lanes[0]
+
+    def _refresh_session(self, lane):
+        if lane.relogin is not None:
+            lane.s = lane.relogin()
+
+    def _submit(self, lane, task, build_payload):
+        """
+        用 lane 对应的账号提交一个 multi-simulation。
+
+        Returns:
+            (progress_url, wait): 成功时 wait 为 None；被限流时 progress_url 为 None、wait 为等待秒数；
+            被服务器以 4xx 拒绝（如表达式错误）时两者都为 None，任务直接丢弃。
+        """
+        try:
+            response = paced_request(lane.s, 'POST', self.api_url + '/simulations', rate_limiter=lane.limiter,
+                                     json=build_payload(task))
+        except Exception as e:
+            print(f"   ⚠️  提交异常: {type(e).__name__} - {str(e)[:80]}")
+            return None, self.default_retry
+
+        if response.status_code == 401:
+            print("   🔐 提交时认证失效，重新登录...")
+            self._refresh_session(lane)
+            return None, 0
+
+        location = response.headers.get('Location')
+        if location:
+            return location, None
+
+        retry_after = response.headers.get('Retry-After')
+        if response.status_code == 429 or retry_after:
+            return None, float(retry_after or lane.limiter.delay('simulate') or self.default_retry)
+
+        if response.status_code >= 500:
+            # 服务器临时故障，不是载荷的问题，稍后重新提交
+            print(f"   ⚠️  提交返回状态码 {response.status_code}，{self.default_retry} 秒后重试")
+            return None, self.default_retry
+
+        print("loc key error: %s" % response.content)
+        self.stats['rejected'] += 1
+        if self.on_reject is not None:
+            self.on_reject(task, response.text)
+        return None, None
+
+    def _poll(self, lane, progress_url):
+        """
+        用提交它的账号轮询一次进度URL。
+
+        Returns:
+            (retry_after, progress_json): 仍在运行或这次轮询出错时 retry_after 为下次轮询前的等待秒数；
+            只有 2xx 且没有 Retry-After 的响应才算结束，此时 retry_after 为 None。
+        """
+        try:
+            response = paced_request(lane.s, 'GET', progress_url, rate_limiter=lane.limiter)
+        except Exception as e:
+            print(f"   ⚠️  轮询异常 {progress_url}: {type(e).__name__}")
+            return self._poll_failed(progress_url), None
+
+        if response.status_code == 401:
+            self._refresh_session(lane)
+            return 1.0, None
+
+        retry_after = float(response.headers.get('Retry-After', 0) or 0)
+        if response.status_code >= 400:
+            # 服务器出错或限流不代表模拟结束，模拟可能仍在服务器上运行，退避后继续轮询
+            print(f"   ⚠️  轮询 {progress_url} 返回状态码 {response.status_code}")
+            return max(retry_after, self._poll_failed(progress_url)), None
+        if retry_after > 0:
+            self._poll_errors.pop(progress_url, None)
+            return retry_after, None
+
+        try:
+            progress = response.json()
+        except ValueError:
+            print(f"   ⚠️  轮询 {progress_url} 响应解析失败")
+            return self._poll_failed(progress_url), None
+        self._poll_errors.pop(progress_url, None)
+        return None, progress
+
+    def _poll_failed(self, progress_url):
+        """记一次轮询失败，返回退避秒数"""
+        count = self._poll_errors[progress_url] = self._poll_errors.get(progress_url, 0) + 1
+        return min(self.poll_backoff * 2 ** (count - 1), self.max_poll_backoff)
+
+    def run(self, tasks, build_payload, resume=()):
+        """
+        消费 tasks 直到全部结束。
+
+        Args:
+            tasks: 任务可迭代对象（可以是生成器），每个任务是一个 multi-simulation 的子alpha列表
+            build_payload: build_payload(task) -> 提交给 /simulations 的 JSON
+            resume: 上次已提交未结束的 [(progress_url, task)] 或 [(progress_url, task, 账号名)]，
+                直接挂到进度URL上由原账号继续轮询，不重新提交
+
+        Returns:
+            dict: 提交/完成/出错/被拒数量统计
+        """
+        task_iter = iter(tasks)
+        exhausted = False
+        retry_queue = deque()
+        in_flight = []  # 堆: (下次轮询时间, 序号, progress_url, task)
+        for progress_url, task, *account in resume:
+            lane = self._lane(account[0] if account else None)
+            lane.in_flight += 1
+            self._owners[progress_url] = lane
+            heapq.heappush(in_flight, (time.time(), next(self._seq), progress_url, task))
+
+        while True:
+            # 1. 有空槽的账号就补位，优先交给在途占比最低的账号
+            while True:
+                now = time.time()
+                lanes = [lane for lane in self.lanes if lane.in_flight < lane.concurrency and now >= lane.submit_after]
+                if not lanes:
+                    break
+                if retry_queue:
+                    task = retry_queue.popleft()
+                elif not exhausted:
+                    try:
+                        task = next(task_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                else:
+                    break
+
+                lane = min(lanes, key=lambda candidate: candidate.load)
+                progress_url, wait = self._submit(lane, task, build_payload)
+                if progress_url:
+                    self.stats['submitted'] += 1
+                    lane.in_flight += 1
+                    self._owners[progress_url] = lane
+                    if self.on_submit is not None:
+                        self.on_submit(task, progress_url)
+                    heapq.heappush(in_flight, (time.time(), next(self._seq), progress_url, task))
+                elif wait is not None:
+                    # 只暂停这个账号，其他账号有空槽继续提交
+                    retry_queue.appendleft(task)
+                    lane.submit_after = time.time() + wait
+
+            metrics.set_gauge('dispatch_in_flight', len(in_flight))
+            metrics.set_gauge('dispatch_retry_queue', len(retry_queue))
+            has_pending = bool(retry_queue) or not exhausted
+            if not in_flight:
+                if not has_pending:
+                    break
+                metrics.sleep(min(lane.submit_after for lane in self.lanes) - time.time(), 'dispatch_throttled')
+                continue
+
+            # 2. 睡到最早需要处理的时间点（下一个到期的轮询，或某个有空槽的账号限流解除后的补位）
+            next_wake = in_flight[0][0]
+            if has_pending:
+                resumes = [lane.submit_after for lane in self.lanes if lane.in_flight < lane.concurrency]
+                if resumes:
+                    next_wake = min(next_wake, min(resumes))
+            metrics.sleep(next_wake - time.time(), 'dispatch_wait')
+            if in_flight[0][0] > time.time():
+                continue
+
+            # 3. 轮询最早到期的任务
+            _, seq, progress_url, task = heapq.heappop(in_flight)
+            lane = self._owners[progress_url]
+            retry_after, progress = self._poll(lane, progress_url)
+            if retry_after is not None:
+                heapq.heappush(in_flight, (time.time() + retry_after, seq, progress_url, task))
+                continue
+
+            lane.in_flight -= 1
+            status = progress.get("status", 0)
+            if status == "COMPLETE":
+                self.stats['complete'] += 1
+            else:
+                self.stats['error'] += 1
+                print("Not complete : %s" % progress_url)
+            print(f"   ✓ {status} | 在途 {len(in_flight)}/{self.concurrency} | "
+                  f"完成 {self.stats['complete']} 出错 {self.stats['error']}")
+            if self.on_complete is not None:
+                self.on_complete(task, progress_url, progress)
+            del self._owners[progress_url]
+
+        return self.stats
@@ -0,0 +1,191 @@
+"""
+持久化模拟队列
+
+每个 simulation（或 multi-simulation）是一行记录，状态流转：
+    pending → submitted(progress_url, account) → complete(alpha_ids) | failed
+
+临时性失败（模拟结果为 ERROR/FAIL 等非 COMPLETE 状态）记一次失败次数后退回 pending，下次拉取该批次时重跑，
+累计 max_attempts 次仍失败才记为 failed；服务器以 4xx 拒绝的载荷（表达式校验不通过）直接记为 failed。
+
+数据库使用 SQLite WAL 模式，每次状态变化立即提交。进程崩溃后重新运行脚本时，
+submitted 状态的任务直接重新挂到原进度URL上、由提交它的账号继续轮询，不会重复提交；pending 的任务按入队顺序继续跑。
+
+表达式流的随机种子（字段窗口、vec_* 选择、打乱顺序）也按流保存在这里（stream_seed），
+中断后重新运行生成同一个流，继续上次没跑完的任务；整个流跑完后 release_seed，下次运行换新种子。
+
+队列文件默认是当前目录下的 sim_queue.db，可用环境变量 BRAIN_SIM_QUEUE 指定路径。
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+SUBMITTED = 'submitted'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+MAX_ATTEMPTS = 3
+
+
+class SimQueue:
+    """
+    Args:
+        path: 数据库文件路径
+        max_attempts: 临时性失败的任务最多运行次数
+    """
+
+    def __init__(self, path=None, max_attempts=MAX_ATTEMPTS):
+        self.path = path or os.environ.get('BRAIN_SIM_QUEUE', 'sim_queue.db')
+        self.max_attempts = max_attempts
+        # 调度线程和 sim_cache.CacheRecorder 的后台线程都会更新状态，连接跨线程共用、用锁串行化
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sim_task ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' batch TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' progress_url TEXT,'
+            ' alpha_ids TEXT,'
+            ' error TEXT,'
+            ' updated REAL,'
+            ' account TEXT,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' UNIQUE (batch, key))'
+        )
+        # 旧版本的队列文件没有 account、attempts 列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(sim_task)')]
+        if 'account' not in columns:
+            self.conn.execute('ALTER TABLE sim_task ADD COLUMN account TEXT')
+        if 'attempts' not in columns:
+            self.conn.execute('ALTER TABLE sim_task ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sim_task_state ON sim_task (batch, state, id)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sim_seed (stream TEXT PRIMARY KEY, seed INTEGER NOT NULL, created REAL)')
+        self.conn.commit()
+
+    def stream_seed(self, stream):
+        """
+        表达式流的随机种子：上次没跑完时返回同一个种子，否则生成并保存一个新的。
+
+        Args:
+            stream: 流名，如 'USA/TOP3000/D1/news7'
+        """
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO sim_seed VALUES (?, ?, ?)',
+                              (stream, random.randrange(2 ** 32), time.time()))
+            return self.conn.execute('SELECT seed FROM sim_seed WHERE stream = ?', (stream,)).fetchone()[0]
+
+    def release_seed(self, stream):
+        """流已全部跑完，下次运行使用新种子"""
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM sim_seed WHERE stream = ?', (stream,))
+
+    def enqueue(self, batch, payloads):
+        """
+        批量入队。同一 batch 内相同载荷只保留一条，重复运行脚本不会产生重复任务。
+
+        Args:
+            batch: 批次名，如 'USA/TOP3000/D1/SUBINDUSTRY'
+            payloads: 可迭代的载荷（单个 simulation 的 dict 或 multi-simulation 的 list）
+
+        Returns:
+            int: 新入队的条数
+        """
+        with self._lock:
+            before = self.conn.total_changes
+            with self.conn:
+                for payload in payloads:
+                    self._insert(batch, payload)
+            return self.conn.total_changes - before
+
+    def _insert(self, batch, payload):
+        text = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        self.conn.execute(
+            'INSERT OR IGNORE INTO sim_task (batch, key, payload, state, updated) VALUES (?, ?, ?, ?, ?)',
+            (batch, key, text, PENDING, time.time())
+        )
+        return self.conn.execute('SELECT id, state FROM sim_task WHERE batch = ? AND key = ?', (batch, key)).fetchone()
+
+    def feed(self, batch, payloads):
+        """
+        边入队边产出：每个载荷写入（提交）后立即产出 (id, payload)，供调度器按需拉取，
+        不必等整个表达式流枚举完才开始提交。已经跑完或在途的重复载荷会被跳过，
+        临时性失败后退回 pending 的会再次产出。
+        """
+        for payload in payloads:
+            with self._lock, self.conn:
+                task_id, state = self._insert(batch, payload)
+            if state == PENDING:
+                yield task_id, payload
+
+    def pending(self, batch):
+        """按入队顺序逐条取出 pending 任务 (id, payload)；运行中新入队的任务也会被取到"""
+        last_id = 0
+        while True:
+            with self._lock:
+                row = self.conn.execute(
+                    'SELECT id, payload FROM sim_task WHERE batch = ? AND state = ? AND id > ? ORDER BY id LIMIT 1',
+                    (batch, PENDING, last_id)
+                ).fetchone()
+            if row is None:
+                return
+            last_id = row[0]
+            yield row[0], json.loads(row[1])
+
+    def in_flight(self, batch):
+        """已提交未结束的任务 [(id, progress_url, payload, account)]，用于重启后由原账号重新挂接"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, progress_url, payload, account FROM sim_task WHERE batch = ? AND state = ? ORDER BY id',
+                (batch, SUBMITTED)
+            ).fetchall()
+        return [(task_id, url, json.loads(payload), account) for task_id, url, payload, account in rows]
+
+    def _update(self, task_id, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join('%s = ?' % name for name in fields)
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE sim_task SET %s WHERE id = ?' % columns, (*fields.values(), task_id))
+
+    def mark_submitted(self, task_id, progress_url, account=None):
+        self._update(task_id, state=SUBMITTED, progress_url=progress_url, account=account)
+
+    def mark_complete(self, task_id, alpha_ids=()):
+        self._update(task_id, state=COMPLETE, alpha_ids=json.dumps(list(alpha_ids)))
+
+    def mark_failed(self, task_id, error='', retry=True):
+        """
+        记一次失败。
+
+        Args:
+            retry: 是否为临时性失败；是且累计失败次数未到 max_attempts 时退回 pending 等待重跑，
+                否则（如 4xx 校验拒绝）记为 failed
+        """
+        with self._lock, self.conn:
+            self.conn.execute(
+                'UPDATE sim_task SET attempts = attempts + 1, error = ?, updated = ?,'
+                ' state = CASE WHEN ? AND attempts + 1 < ? THEN ? ELSE ? END WHERE id = ?',
+                (str(error)[:500], time.time(), bool(retry), self.max_attempts, PENDING, FAILED, task_id)
+            )
+
+    def counts(self, batch=None):
+        """各状态的任务数"""
+        with self._lock:
+            if batch is None:
+                rows = self.conn.execute('SELECT state, COUNT(*) FROM sim_task GROUP BY state').fetchall()
+            else:
+                rows = self.conn.execute(
+                    'SELECT state, COUNT(*) FROM sim_task WHERE batch = ? GROUP BY state', (batch,)
+                ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.conn.close()
@@ -1,7 +1,9 @@
 import requests
 import json
 from os.path import expanduser
-from requests.auth import HTTPBasicAuth
+
+from brain_async import API_URL
+from session_pool import get_session
 
 # 加载凭据文件
 with open(expanduser('brain.txt')) as f:
@@ -10,18 +12,8 @@ with open(expanduser('brain.txt')) as f:
 # 从列表中提取用户名和密码
 username, password = credentials
 
-# 创建会话对象
-sess = requests.Session()
-
-# 设置基本身份验证
-sess.auth = HTTPBasicAuth(username, password)
-
-# 向API发送POST请求进行身份验证
-response = sess.post('https://api.worldquantbrain.com/authentication')
-
-# 打印响应状态和内容以调试
-print(response.status_code)
-print(response.json())
+# 使用进程内共享的登录会话（令牌快过期或遇到 401 时自动重新认证）
+sess = get_session(username, password)
 
 simulation_data = {
     'type': 'REGULAR',
@@ -45,7 +37,7 @@ simulation_data = {
 from time import sleep
 
 sim_resp = sess.post(
-    'https://api.worldquantbrain.com/simulations',
+    API_URL + '/simulations',
     json=simulation_data,
 )
 